@@ -0,0 +1,139 @@
+"""语音播报调度模块 - 在独立线程中调用 Home Assistant 播报"""
+import logging
+import queue
+import threading
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class Announcement:
+    """一条待播报的消息"""
+
+    def __init__(self, message, on_done=None, context=None, enqueued_at=None):
+        """
+        Args:
+            message: 播报内容
+            on_done: 播报完成后的回调，参数为 (announcement, result)
+            context: 调用方附带的数据（例如对应的提醒），原样传给回调
+            enqueued_at: 入队时间（单调时钟），默认为当前时间
+        """
+        self.message = message
+        self.on_done = on_done
+        self.context = context
+        # 入队时间（单调时钟），用于计算排队延迟
+        self.enqueued_at = SYSTEM_CLOCK.monotonic() if enqueued_at is None else enqueued_at
+        # 以下字段由调度器在播报完成后填写
+        self.ok = None
+        self.started_at = None  # 开始播报的时间（Unix 时间戳）
+        self.queue_delay = None  # 排队等待时间（秒）
+        self.latency = None  # Home Assistant 调用耗时（秒）
+
+
+class AnnouncementDispatcher:
+    """
+    语音播报调度器
+
+    提醒评估只负责把消息放入队列，由专门的工作线程依次调用
+    Home Assistant 播报，因此评估和调度永远不会被 HA 的网络请求阻塞。
+    每条消息播报完成后通过回调报告结果和耗时。
+    """
+
+    _STOP = object()
+
+    def __init__(self, ha_client, entity_id, clock=SYSTEM_CLOCK):
+        """
+        初始化播报调度器
+
+        Args:
+            ha_client: HomeAssistantClient 实例
+            entity_id: 小米音箱的配置标识
+            clock: 时钟对象，重放模拟时使用虚拟时钟
+        """
+        self.ha_client = ha_client
+        self.entity_id = entity_id
+        self.clock = clock
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """启动工作线程"""
+        self._thread = threading.Thread(
+            target=self._worker, name='announcer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """处理完队列中已有的消息后停止工作线程"""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, message, on_done=None, context=None):
+        """
+        提交一条播报消息（立即返回）
+
+        Returns:
+            Announcement 对象
+        """
+        announcement = Announcement(message, on_done=on_done, context=context,
+                                    enqueued_at=self.clock.monotonic())
+        self._queue.put(announcement)
+        return announcement
+
+    def pending(self):
+        """队列中等待播报的消息数"""
+        return self._queue.qsize()
+
+    def run_pending(self):
+        """
+        在当前线程中依次播报队列中已有的消息
+
+        用于没有启动工作线程的场景（例如单线程的重放模拟）
+
+        Returns:
+            处理的消息数
+        """
+        processed = 0
+        while True:
+            try:
+                announcement = self._queue.get_nowait()
+            except queue.Empty:
+                return processed
+            if announcement is self._STOP:
+                continue
+            self._dispatch(announcement)
+            processed += 1
+
+    def _worker(self):
+        while True:
+            announcement = self._queue.get()
+            if announcement is self._STOP:
+                break
+            self._dispatch(announcement)
+
+    def _dispatch(self, announcement):
+        """调用 Home Assistant 播报一条消息并报告结果"""
+        started = self.clock.monotonic()
+        announcement.started_at = self.clock.time()
+        announcement.queue_delay = started - announcement.enqueued_at
+
+        try:
+            result = self.ha_client.xiaomi_speaker_say(
+                entity_id=self.entity_id,
+                message=announcement.message
+            )
+        except Exception as e:
+            logger.exception('播报时出错: %s', e)
+            result = None
+
+        announcement.latency = self.clock.monotonic() - started
+        announcement.ok = result is not None
+
+        if announcement.on_done:
+            try:
+                announcement.on_done(announcement, result)
+            except Exception as e:
+                logger.exception('播报回调出错: %s', e)
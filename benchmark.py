@@ -0,0 +1,311 @@
+"""基准测试 - 用本地模拟服务端到端驱动 CalendarReminderApp
+
+场景：
+    poll       合成日历（10 ~ 100k 个事件）下每次刷新的 CPU 时间、峰值内存和 HTTP 请求数
+    reminders  一批即将到期的提醒的实际播报时间与计划时间之差，以及每个提醒的 HTTP 请求数
+
+模拟服务运行在子进程中，测得的 CPU 和内存只包含被测程序本身。
+
+用法：
+    python benchmark.py poll --sizes 10,1000,10000,100000 --polls 5
+    python benchmark.py reminders --count 20 --ha-latency 0.2 --failure-rate 0.1
+    python benchmark.py all --json results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+from google.auth.credentials import AnonymousCredentials
+
+import main_cli
+from fake_services import (CALENDAR_API_PREFIX, FakeCalendarServer, FakeHomeAssistantServer,
+                           make_event, start_in_subprocess, synthetic_calendar_server)
+from google_calendar_cli import GoogleCalendarClient
+from home_assistant import HomeAssistantClient
+from log_setup import setup_logging
+from metrics import POLL_EVENTS
+
+# 被测应用的配置：只使用 script 播报（每条消息一次 HA 调用），不开启推送和指标端点
+BENCH_ENV = {
+    'XIAOMI_SPEAKER_ENTITY_ID': 'script.benchmark_say',
+    'INCREMENTAL_SYNC': 'true',
+    'WATCH_ENABLED': 'false',
+    'METRICS_PORT': '',
+    'CHECK_INTERVAL': '60',
+    'REMINDER_GRACE_SECONDS': '60',
+}
+
+
+def _get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def _post_json(url, data):
+    request = urllib.request.Request(
+        url, data=json.dumps(data).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+@contextlib.contextmanager
+def _workdir():
+    """在临时目录中运行，状态文件不会写到仓库里"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='calendar-bench-') as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(cwd)
+
+
+@contextlib.contextmanager
+def _subprocess_server(factory, **kwargs):
+    process, port = start_in_subprocess(factory, **kwargs)
+    try:
+        yield port
+    finally:
+        process.terminate()
+        process.join(5)
+
+
+def build_app(calendar_port, ha_port, calendar_ids=('primary',), **env):
+    """
+    创建连接模拟服务的 CalendarReminderApp
+
+    Args:
+        calendar_port: 模拟 Calendar API 的端口
+        ha_port: 模拟 Home Assistant 的端口
+        calendar_ids: 日历 ID 列表
+        **env: 覆盖的环境变量（应用在初始化时读取）
+    """
+    os.environ.update(BENCH_ENV)
+    os.environ.update({key: str(value) for key, value in env.items()})
+
+    calendar_client = GoogleCalendarClient(
+        calendar_ids=list(calendar_ids),
+        api_endpoint=f'http://127.0.0.1:{calendar_port}{CALENDAR_API_PREFIX}',
+        credentials=AnonymousCredentials()
+    )
+    ha_client = HomeAssistantClient(
+        base_url=f'http://127.0.0.1:{ha_port}',
+        access_token='benchmark'
+    )
+    return main_cli.CalendarReminderApp(
+        headless=True, calendar_client=calendar_client, ha_client=ha_client)
+
+
+def run_poll_scenario(size, polls=5, churn=0, seed=0):
+    """
+    测量一个日历规模下每次刷新的开销
+
+    第一次刷新是全量同步，之后是增量同步；churn > 0 时每次刷新前
+    修改该数量的事件，模拟日历的正常变更。
+
+    Returns:
+        结果字典
+    """
+    with _subprocess_server(synthetic_calendar_server, calendar_sizes={'primary': size}, seed=seed) as calendar_port, \
+            _subprocess_server(FakeHomeAssistantServer) as ha_port, \
+            _workdir():
+        stats_url = f'http://127.0.0.1:{calendar_port}/_bench/stats'
+        app = build_app(calendar_port, ha_port)
+
+        samples = []
+        for i in range(polls):
+            if i and churn:
+                now = datetime.now(timezone.utc)
+                _post_json(f'http://127.0.0.1:{calendar_port}/_bench/upsert', {
+                    'calendar_id': 'primary',
+                    'events': [
+                        make_event(f'churn{i}-{j}', f'CHURN{i}-{j}',
+                                   now + timedelta(minutes=10 + j), now + timedelta(minutes=40 + j))
+                        for j in range(churn)
+                    ],
+                })
+
+            requests_before = _get_json(stats_url)['requests']
+            cpu_started = time.process_time()
+            wall_started = time.perf_counter()
+            app.check_events()
+            samples.append({
+                'cpu_ms': (time.process_time() - cpu_started) * 1000,
+                'wall_ms': (time.perf_counter() - wall_started) * 1000,
+                'http_calls': _get_json(stats_url)['requests'] - requests_before,
+                'events': POLL_EVENTS.labels().value,
+            })
+
+        # 峰值内存单独在一个新实例的首次（全量）刷新上测量，tracemalloc 不影响上面的 CPU 时间
+        cold_app = build_app(calendar_port, ha_port)
+        tracemalloc.start()
+        cold_app.check_events()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    steady = samples[1:] or samples
+    return {
+        'scenario': 'poll',
+        'calendar_events': size,
+        'polls': polls,
+        'churn': churn,
+        'first_poll': samples[0],
+        'steady_cpu_ms_mean': statistics.mean(sample['cpu_ms'] for sample in steady),
+        'steady_cpu_ms_max': max(sample['cpu_ms'] for sample in steady),
+        'steady_http_calls_mean': statistics.mean(sample['http_calls'] for sample in steady),
+        'events_in_window': samples[-1]['events'],
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def run_reminder_scenario(count=20, spread=20.0, lead=3.0, ha_latency=0.0, failure_rate=0.0,
+                          coalesce=0.0, retry_delay=2, max_attempts=3, seed=0):
+    """
+    测量提醒的播报时间精度
+
+    生成 count 个事件，它们的 5 分钟提醒在 [lead, lead + spread] 秒后依次到期，
+    运行完整的应用主循环，记录模拟 HA 收到每个提醒的时间。
+
+    Returns:
+        结果字典
+    """
+    now = time.time()
+    ideal = {}
+    events = []
+    for i in range(count):
+        fire_at = now + lead + (spread * i / max(1, count - 1))
+        start = datetime.fromtimestamp(fire_at + 5 * 60, timezone.utc)
+        events.append(make_event(f'bench{i}', f'BENCH{i}', start, start + timedelta(minutes=30)))
+        ideal[i] = fire_at
+
+    with _subprocess_server(FakeCalendarServer, calendars={'primary': events}) as calendar_port, \
+            _subprocess_server(FakeHomeAssistantServer, latency=ha_latency,
+                               failure_rate=failure_rate, seed=seed) as ha_port, \
+            _workdir():
+        app = build_app(
+            calendar_port, ha_port,
+            REMINDER_COALESCE_SECONDS=coalesce,
+            REMINDER_RETRY_DELAY=retry_delay,
+            REMINDER_MAX_ATTEMPTS=max_attempts
+        )
+        runner = threading.Thread(target=app.run, name='benchmark-app', daemon=True)
+        runner.start()
+
+        # 等最后一个提醒（包括失败重试）完成
+        deadline = max(ideal.values()) + 2 + ha_latency * 2
+        if failure_rate:
+            deadline += retry_delay * max_attempts
+        time.sleep(max(0.0, deadline - time.time()))
+
+        app.stop()
+        runner.join(10)
+
+        calendar_requests = _get_json(f'http://127.0.0.1:{calendar_port}/_bench/stats')['requests']
+        ha_stats = _get_json(f'http://127.0.0.1:{ha_port}/_bench/stats')
+
+    # 每个事件第一次成功播报的时间
+    announced = {}
+    for call in ha_stats['calls']:
+        if not call['ok']:
+            continue
+        message = call['data'].get('variables', {}).get('msg', '')
+        for match in re.finditer(r'BENCH(\d+)', message):
+            announced.setdefault(int(match.group(1)), call['received_at'])
+
+    errors = [announced[i] - ideal[i] for i in announced]
+    abs_errors = [abs(error) for error in errors]
+    return {
+        'scenario': 'reminders',
+        'reminders': count,
+        'announced': len(announced),
+        'missed': count - len(announced),
+        'ha_latency': ha_latency,
+        'failure_rate': failure_rate,
+        'coalesce_seconds': coalesce,
+        'ha_calls': len(ha_stats['calls']),
+        'http_calls_per_reminder': (calendar_requests + ha_stats['requests']) / max(1, len(announced)),
+        'timing_error_ms_mean': statistics.mean(errors) * 1000 if errors else None,
+        'timing_error_ms_p50': _percentile(abs_errors, 50) * 1000 if errors else None,
+        'timing_error_ms_p95': _percentile(abs_errors, 95) * 1000 if errors else None,
+        'timing_error_ms_max': max(abs_errors) * 1000 if errors else None,
+    }
+
+
+def _print_poll_results(results):
+    print(f'{"events":>8} {"first cpu ms":>13} {"first http":>11} {"steady cpu ms":>14} '
+          f'{"steady http":>12} {"polled":>10} {"peak KB":>10}')
+    for result in results:
+        print(f'{result["calendar_events"]:>8} {result["first_poll"]["cpu_ms"]:>13.1f} '
+              f'{result["first_poll"]["http_calls"]:>11} {result["steady_cpu_ms_mean"]:>14.2f} '
+              f'{result["steady_http_calls_mean"]:>12.1f} {result["events_in_window"]:>10} '
+              f'{result["peak_memory_kb"]:>10.0f}')
+
+
+def _print_reminder_result(result):
+    print(f'提醒 {result["reminders"]} 个：播报 {result["announced"]}，错过 {result["missed"]}，'
+          f'HA 调用 {result["ha_calls"]} 次，每个提醒 {result["http_calls_per_reminder"]:.2f} 次 HTTP 请求')
+    if result['timing_error_ms_mean'] is not None:
+        print(f'时间误差 (ms)：平均 {result["timing_error_ms_mean"]:.1f}，'
+              f'p50 {result["timing_error_ms_p50"]:.1f}，p95 {result["timing_error_ms_p95"]:.1f}，'
+              f'最大 {result["timing_error_ms_max"]:.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日历提醒服务基准测试')
+    parser.add_argument('scenario', choices=['poll', 'reminders', 'all'])
+    parser.add_argument('--sizes', default='10,1000,10000,100000',
+                        help='poll 场景的日历事件数，逗号分隔')
+    parser.add_argument('--polls', type=int, default=5, help='poll 场景每个规模的刷新次数')
+    parser.add_argument('--churn', type=int, default=0, help='poll 场景每次刷新前修改的事件数')
+    parser.add_argument('--count', type=int, default=20, help='reminders 场景的提醒数')
+    parser.add_argument('--spread', type=float, default=20.0, help='提醒到期时间的分布范围（秒）')
+    parser.add_argument('--ha-latency', type=float, default=0.0, help='模拟 HA 的响应延迟（秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='模拟 HA 的失败率')
+    parser.add_argument('--coalesce', type=float, default=0.0, help='提醒合并窗口（秒）')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    setup_logging(level=args.log_level)
+
+    results = []
+    if args.scenario in ('poll', 'all'):
+        poll_results = [
+            run_poll_scenario(int(size), polls=args.polls, churn=args.churn)
+            for size in args.sizes.split(',')
+        ]
+        _print_poll_results(poll_results)
+        results.extend(poll_results)
+
+    if args.scenario in ('reminders', 'all'):
+        result = run_reminder_scenario(
+            count=args.count, spread=args.spread, ha_latency=args.ha_latency,
+            failure_rate=args.failure_rate, coalesce=args.coalesce)
+        _print_reminder_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Google Calendar 推送通知（events.watch）接收模块"""
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class WatchReceiver:
+    """
+    events.watch 通知接收端
+
+    内嵌一个小型 HTTP 服务，接收 Google 推送的变更通知。
+    Google 只通过请求头传递通知内容（请求体为空）：
+        X-Goog-Channel-ID      通道 ID
+        X-Goog-Channel-Token   注册通道时设置的校验令牌
+        X-Goog-Resource-ID     被监听资源的 ID
+        X-Goog-Resource-State  sync（通道建立）/ exists（资源变更）/ not_exists
+        X-Goog-Message-Number  消息序号
+    """
+
+    def __init__(self, host, port, on_change, token=None):
+        """
+        初始化通知接收端
+
+        Args:
+            host: 监听地址
+            port: 监听端口（0 表示随机端口）
+            on_change: 收到变更通知时的回调，参数为 (channel_id, resource_state)
+            token: 通道校验令牌，设置后会拒绝令牌不匹配的请求
+        """
+        self.on_change = on_change
+        self.token = token
+        # 只接受这些通道的通知，由 WatchChannelManager 维护
+        self.channel_ids = set()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        """实际监听的端口"""
+        return self._server.server_address[1]
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status = receiver.handle_notification(self.headers)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # 通知很频繁，不输出默认的访问日志
+                pass
+
+        return Handler
+
+    def handle_notification(self, headers):
+        """
+        处理一条推送通知
+
+        Args:
+            headers: 请求头（支持 .get() 的映射）
+
+        Returns:
+            HTTP 状态码
+        """
+        channel_id = headers.get('X-Goog-Channel-ID')
+        resource_state = headers.get('X-Goog-Resource-State')
+
+        if self.token and headers.get('X-Goog-Channel-Token') != self.token:
+            logger.warning('拒绝推送通知: 通道令牌不匹配 (channel=%s)', channel_id)
+            return 403
+
+        if channel_id not in self.channel_ids:
+            # 已停止或未知的通道：返回 200 让 Google 不再重试
+            return 200
+
+        if resource_state == 'sync':
+            # 通道建立时的握手通知，无需同步
+            return 200
+
+        logger.info('收到日历变更通知 (state=%s, #%s)',
+                    resource_state, headers.get('X-Goog-Message-Number'))
+        try:
+            self.on_change(channel_id, resource_state)
+        except Exception as e:
+            logger.exception('处理推送通知时出错: %s', e)
+        return 200
+
+    def start(self):
+        """在后台线程中启动 HTTP 服务"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='watch-receiver', daemon=True)
+        self._thread.start()
+        logger.info('推送通知接收端已启动: 端口 %d', self.port)
+
+    def stop(self):
+        """停止 HTTP 服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class WatchChannelManager:
+    """
+    events.watch 通道管理
+
+    注册通道并在过期前续订：先注册新通道，再停止旧通道，
+    保证续订期间不会漏掉通知。
+    """
+
+    def __init__(self, calendar_client, receiver, address, calendar_id='primary',
+                 ttl=604800, renew_margin=3600):
+        """
+        初始化通道管理
+
+        Args:
+            calendar_client: GoogleCalendarClient 实例
+            receiver: WatchReceiver 实例
+            address: Google 推送通知的回调地址（必须是公网可访问的 HTTPS URL）
+            calendar_id: 要监听的日历 ID
+            ttl: 通道有效期（秒），Google 可能会缩短
+            renew_margin: 提前多少秒续订
+        """
+        self.calendar_client = calendar_client
+        self.receiver = receiver
+        self.address = address
+        self.calendar_id = calendar_id
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        # 当前通道：{'id', 'resourceId', 'expiration'}，expiration 为 Unix 时间戳（秒）
+        self.channel = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self):
+        """注册新通道并停止旧通道"""
+        channel_id = str(uuid.uuid4())
+        # 先放行新通道的通知，避免错过注册后立即到达的 sync 消息
+        self.receiver.channel_ids.add(channel_id)
+        try:
+            response = self.calendar_client.watch_events(
+                channel_id=channel_id,
+                address=self.address,
+                token=self.receiver.token,
+                ttl=self.ttl,
+                calendar_id=self.calendar_id
+            )
+        except Exception:
+            self.receiver.channel_ids.discard(channel_id)
+            raise
+
+        old_channel = self.channel
+        self.channel = {
+            'id': response['id'],
+            'resourceId': response['resourceId'],
+            'expiration': int(response['expiration']) / 1000,
+        }
+        expires = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.channel['expiration']))
+        logger.info('已为日历 %s 注册推送通道 %s，有效期至 %s', self.calendar_id, channel_id, expires)
+
+        if old_channel:
+            self._stop_channel(old_channel)
+
+    def _stop_channel(self, channel):
+        """停止通道（失败时忽略，通道会自然过期）"""
+        self.receiver.channel_ids.discard(channel['id'])
+        try:
+            self.calendar_client.stop_watch(channel['id'], channel['resourceId'])
+        except Exception as e:
+            logger.warning('停止推送通道失败（将自然过期）: %s', e)
+
+    def _renew_loop(self):
+        """在通道过期前续订"""
+        while not self._stop.is_set():
+            if self.channel is None:
+                delay = 0
+            else:
+                delay = max(0, self.channel['expiration'] - self.renew_margin - time.time())
+
+            if self._stop.wait(delay):
+                break
+
+            try:
+                self.register()
+            except Exception as e:
+                logger.error('注册推送通道失败，60 秒后重试: %s', e)
+                if self._stop.wait(60):
+                    break
+
+    def start(self):
+        """启动后台续订任务（首次注册也在后台完成）"""
+        self._thread = threading.Thread(
+            target=self._renew_loop, name='watch-renew', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止续订并停止当前通道"""
+        self._stop.set()
+        if self.channel:
+            self._stop_channel(self.channel)
+            self.channel = None
@@ -0,0 +1,82 @@
+"""时钟模块 - 可替换的时间来源，重放模拟时使用虚拟时钟"""
+import threading
+import time
+from datetime import datetime
+
+
+class Clock:
+    """
+    系统时钟
+
+    应用中所有读取当前时间和等待的地方都通过时钟对象完成，
+    重放模拟时替换为 VirtualClock，时间可以远快于真实时间流逝。
+    """
+
+    def time(self):
+        """当前墙上时钟时间（Unix 时间戳，秒）"""
+        return time.time()
+
+    def monotonic(self):
+        """单调时钟时间（秒），只用于计算间隔"""
+        return time.monotonic()
+
+    def now(self, tz=None):
+        """
+        当前时间
+
+        Args:
+            tz: 时区，None 表示本地时间（naive datetime，与 datetime.now() 一致）
+        """
+        return datetime.fromtimestamp(self.time(), tz)
+
+    def wait(self, event, timeout=None):
+        """
+        等待 threading.Event 被设置或超时
+
+        Returns:
+            事件是否已被设置
+        """
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """
+    虚拟时钟：时间只在调用 advance() / set() 或等待时前进
+
+    用于单线程的重放模拟：等待不会真正睡眠，而是直接把时间推进到超时时刻。
+    单调时钟与墙上时钟相同。
+    """
+
+    def __init__(self, start):
+        """
+        初始化虚拟时钟
+
+        Args:
+            start: 起始时间（Unix 时间戳，秒）
+        """
+        self._now = float(start)
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self._now
+
+    def monotonic(self):
+        return self._now
+
+    def set(self, timestamp):
+        """把时间设置到指定时刻（不会倒退）"""
+        with self._lock:
+            self._now = max(self._now, float(timestamp))
+
+    def advance(self, seconds):
+        """把时间向前推进指定秒数"""
+        with self._lock:
+            self._now += max(0.0, seconds)
+
+    def wait(self, event, timeout=None):
+        if not event.is_set() and timeout is not None:
+            self.advance(timeout)
+        return event.is_set()
+
+
+SYSTEM_CLOCK = Clock()
@@ -99,6 +99,22 @@ copy_files() {
     cp "$SCRIPT_DIR/main_cli.py" "$INSTALL_DIR/"
     cp "$SCRIPT_DIR/google_calendar_cli.py" "$INSTALL_DIR/"
     cp "$SCRIPT_DIR/home_assistant.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/scheduler.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/calendar_watch.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/event_cache.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/announcer.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/state_store.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/log_setup.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/metrics.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/clock.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/tenants.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/reminder_plan.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/refresh_policy.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/resilience.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/startup_profile.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/http_transport.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/recurrence.py" "$INSTALL_DIR/"
+    cp "$SCRIPT_DIR/event_record.py" "$INSTALL_DIR/"
     cp "$SCRIPT_DIR/requirements.txt" "$INSTALL_DIR/"
 
     # 复制 .env.example（始终复制，作为参考）
@@ -146,6 +162,12 @@ copy_files() {
         cp "$SCRIPT_DIR/reminded_events.json" "$INSTALL_DIR/"
         print_info "已复制 reminded_events.json (提醒记录)"
     fi
+
+    # 恢复 reminded_events.journal（快照之后追加的提醒记录）
+    if [ -n "$BACKUP_DIR" ] && [ -f "$BACKUP_DIR/reminded_events.journal" ]; then
+        cp "$BACKUP_DIR/reminded_events.journal" "$INSTALL_DIR/"
+        print_info "已从备份恢复 reminded_events.journal (提醒记录日志)"
+    fi
 }
 
 # 函数：安装 Python 依赖
@@ -177,11 +199,14 @@ EnvironmentFile=$INSTALL_DIR/.env
 ExecStart=/usr/bin/python3 $INSTALL_DIR/main_cli.py --headless
 Restart=always
 RestartSec=10
-StandardOutput=append:$LOG_FILE
+StandardOutput=journal
 StandardError=append:$ERROR_LOG_FILE
 
 # 环境变量
 Environment="PYTHONUNBUFFERED=1"
+# 日志由程序写入并按大小轮转（旧文件压缩为 .gz），不再追加到无限增长的文件
+Environment="LOG_FILE=$LOG_FILE"
+Environment="LOG_CONSOLE=false"
 
 # 健康检查和资源限制
 TimeoutStopSec=30
@@ -204,7 +229,7 @@ setup_logs() {
     chmod 644 "$ERROR_LOG_FILE"
 
     print_info "日志文件:"
-    print_info "  - 标准输出: $LOG_FILE"
+    print_info "  - 运行日志: $LOG_FILE（按大小轮转，旧文件压缩为 .gz）"
     print_info "  - 错误输出: $ERROR_LOG_FILE"
 }
 
@@ -0,0 +1,149 @@
+"""本地事件缓存模块 - 使用 SQLite 持久化已同步的日历事件"""
+import json
+import sqlite3
+import threading
+import time
+
+
+class EventCache:
+    """
+    持久化的日历事件缓存
+
+    保存每个日历已同步的事件和同步令牌，用于：
+    - 启动时预热本地事件集，无需任何网络请求即可开始调度提醒
+    - 重启后直接使用保存的 syncToken 增量同步，而不是重新全量同步
+    - Google 日历不可用时继续基于缓存数据提醒
+
+    事件按 (calendar_id, start_ts) 和 start_ts 建立索引。
+    """
+
+    def __init__(self, path='event_cache.db'):
+        """
+        初始化事件缓存
+
+        Args:
+            path: SQLite 数据库文件路径
+        """
+        self.path = path
+        # 多个同步线程共享同一个连接，由锁保证串行访问
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    calendar_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    start_ts REAL NOT NULL,
+                    end_ts REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (calendar_id, event_id)
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_events_start ON events (start_ts)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_events_calendar_start ON events (calendar_id, start_ts)')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    calendar_id TEXT PRIMARY KEY,
+                    sync_token TEXT,
+                    synced_until REAL
+                )
+            ''')
+
+    def load(self, calendar_id, now=None):
+        """
+        加载一个日历的缓存
+
+        Args:
+            calendar_id: 日历 ID
+            now: 当前时间戳，已结束的事件不会被加载
+
+        Returns:
+            (events, sync_token, synced_until)
+            events: {event_id: event}
+            sync_token: 同步令牌，没有缓存时为 None
+            synced_until: 全量同步覆盖到的时间戳，没有缓存时为 None
+        """
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT event_id, data FROM events WHERE calendar_id = ? AND end_ts > ? '
+                'ORDER BY start_ts',
+                (calendar_id, now)
+            ).fetchall()
+            state = self._conn.execute(
+                'SELECT sync_token, synced_until FROM sync_state WHERE calendar_id = ?',
+                (calendar_id,)
+            ).fetchone()
+
+        events = {event_id: json.loads(data) for event_id, data in rows}
+        sync_token, synced_until = state if state else (None, None)
+        return events, sync_token, synced_until
+
+    def replace_calendar(self, calendar_id, events, sync_token, synced_until):
+        """
+        全量同步后替换一个日历的全部缓存
+
+        Args:
+            calendar_id: 日历 ID
+            events: [(event_id, start_ts, end_ts, event), ...]
+            sync_token: 新的同步令牌
+            synced_until: 全量同步覆盖到的时间戳
+        """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM events WHERE calendar_id = ?', (calendar_id,))
+            self._insert(calendar_id, events)
+            self._save_sync_state(calendar_id, sync_token, synced_until)
+
+    def apply_changes(self, calendar_id, upserts, deletes, sync_token, synced_until):
+        """
+        增量同步后写入变更
+
+        Args:
+            calendar_id: 日历 ID
+            upserts: 新增或修改的事件 [(event_id, start_ts, end_ts, event), ...]
+            deletes: 被取消或已结束的事件 ID 列表
+            sync_token: 新的同步令牌
+            synced_until: 全量同步覆盖到的时间戳
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'DELETE FROM events WHERE calendar_id = ? AND event_id = ?',
+                [(calendar_id, event_id) for event_id in deletes]
+            )
+            self._insert(calendar_id, upserts)
+            self._save_sync_state(calendar_id, sync_token, synced_until)
+
+    def clear(self, calendar_id):
+        """删除一个日历的缓存（例如同步令牌失效时）"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM events WHERE calendar_id = ?', (calendar_id,))
+            self._conn.execute('DELETE FROM sync_state WHERE calendar_id = ?', (calendar_id,))
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _insert(self, calendar_id, events):
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO events (calendar_id, event_id, start_ts, end_ts, data) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [
+                (calendar_id, event_id, start_ts, end_ts, json.dumps(event, ensure_ascii=False))
+                for event_id, start_ts, end_ts, event in events
+            ]
+        )
+
+    def _save_sync_state(self, calendar_id, sync_token, synced_until):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, synced_until) '
+            'VALUES (?, ?, ?)',
+            (calendar_id, sync_token, synced_until)
+        )
@@ -0,0 +1,99 @@
+"""事件记录模块 - 把 Calendar API 返回的事件一次性转换为紧凑、不可变的记录"""
+from datetime import datetime
+
+from reminder_plan import clean_event_name
+
+# 没有标题的事件显示的名称
+UNTITLED_EVENT = '无标题事件'
+
+
+def event_timestamp(value):
+    """
+    把事件的 start / end 字段转换为 Unix 时间戳
+
+    Args:
+        value: {'dateTime': ...}（定时日程）或 {'date': ...}（全天日程，按本地时区的 0 点）
+
+    Returns:
+        float 时间戳
+    """
+    moment = value.get('dateTime') or value['date']
+    # 全天日程解析出的是 naive 时间，timestamp() 按本地时区处理
+    return datetime.fromisoformat(moment.replace('Z', '+00:00')).timestamp()
+
+
+class EventRecord:
+    """
+    一个可提醒的事件
+
+    同步或查询时由 API 返回的事件字典转换而来，之后每次轮询直接使用预先解析好的
+    时间戳、去掉标记的名称和提醒时间点，不再解析 ISO 时间或匹配标题标记；
+    只保留提醒用到的字段，缓存大量事件时占用的内存也远小于原始字典。
+
+    记录是不可变的：事件被修改（etag 变化）时整体替换为新的记录。
+    """
+
+    __slots__ = ('id', 'etag', 'calendar_id', 'start_ts', 'end_ts', 'summary', 'name', 'offsets')
+
+    def __init__(self, id, etag, calendar_id, start_ts, end_ts, summary, name, offsets):
+        """
+        Args:
+            id: 事件 ID
+            etag: 事件版本
+            calendar_id: 事件所属的日历
+            start_ts: 开始时间戳
+            end_ts: 结束时间戳
+            summary: 原始标题（含提醒标记）
+            name: 去掉提醒标记的事件名称
+            offsets: 提醒时间点（分钟），从大到小排序的元组
+        """
+        setter = object.__setattr__
+        setter(self, 'id', id)
+        setter(self, 'etag', etag)
+        setter(self, 'calendar_id', calendar_id)
+        setter(self, 'start_ts', start_ts)
+        setter(self, 'end_ts', end_ts)
+        setter(self, 'summary', summary)
+        setter(self, 'name', name)
+        setter(self, 'offsets', offsets)
+
+    @classmethod
+    def from_event(cls, event, calendar_id, rules):
+        """
+        转换 API 返回的事件
+
+        Args:
+            event: Google Calendar 事件对象
+            calendar_id: 事件所属的日历
+            rules: 提醒规则（ReminderRules）
+
+        Returns:
+            EventRecord
+        """
+        summary = event.get('summary', UNTITLED_EVENT)
+        start_ts = event_timestamp(event['start'])
+        end = event.get('end')
+        return cls(
+            event['id'],
+            event.get('etag'),
+            calendar_id,
+            start_ts,
+            event_timestamp(end) if end else start_ts,
+            summary,
+            clean_event_name(summary),
+            rules.compile(summary, calendar_id),
+        )
+
+    def with_rules(self, rules):
+        """按另一套提醒规则重新计算提醒时间点，返回新的记录"""
+        return EventRecord(self.id, self.etag, self.calendar_id, self.start_ts, self.end_ts,
+                           self.summary, self.name, rules.compile(self.summary, self.calendar_id))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'EventRecord 是不可变的，不能修改 {name}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'EventRecord 是不可变的，不能删除 {name}')
+
+    def __repr__(self):
+        return f'EventRecord({self.id!r}, {self.name!r}, start_ts={self.start_ts})'
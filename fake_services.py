@@ -0,0 +1,510 @@
+"""本地模拟服务 - 用于基准测试的 Google Calendar 和 Home Assistant 替身"""
+import bisect
+import json
+import multiprocessing
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# 模拟 Calendar API 的路径前缀，GoogleCalendarClient 的 api_endpoint 指向这里
+CALENDAR_API_PREFIX = '/calendar/v3/'
+
+# 生成的事件中带额外提醒标记（如 "[10]"）的比例
+MARKED_RATIO = 0.1
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _format_time(value):
+    return value.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def generate_events(count, start=None, span=timedelta(days=30), seed=0, prefix='E'):
+    """
+    生成合成日历事件
+
+    事件开始时间在 [start, start + span) 内均匀分布，时长 15-120 分钟，
+    约 10% 的事件标题带有额外提醒标记
+
+    Args:
+        count: 事件数量
+        start: 最早的开始时间，默认为当前时间
+        span: 开始时间的分布范围
+        seed: 随机种子
+        prefix: 事件标题前缀
+
+    Returns:
+        Calendar API 格式的事件列表
+    """
+    rng = random.Random(seed)
+    start = start or datetime.now(timezone.utc)
+    span_seconds = span.total_seconds()
+
+    events = []
+    for i in range(count):
+        event_start = start + timedelta(seconds=rng.random() * span_seconds)
+        event_end = event_start + timedelta(minutes=rng.choice((15, 30, 45, 60, 90, 120)))
+        summary = f'{prefix}{i}'
+        if rng.random() < MARKED_RATIO:
+            summary += f' [{rng.choice((5, 10, 15, 30))}]'
+        events.append(make_event(f'{prefix.lower()}{i}', summary, event_start, event_end))
+    return events
+
+
+def make_event(event_id, summary, start, end):
+    """构造一个 Calendar API 格式的事件"""
+    return {
+        'id': event_id,
+        'etag': '"1"',
+        'status': 'confirmed',
+        'summary': summary,
+        'start': {'dateTime': _format_time(start)},
+        'end': {'dateTime': _format_time(end)},
+    }
+
+
+class _FakeCalendar:
+    """单个模拟日历：按开始时间排序的事件和变更版本号"""
+
+    def __init__(self, events):
+        self.version = 1
+        # {event_id: (event, 修改时的版本号)}
+        self.events = {}
+        self._index = None
+        self._max_duration = timedelta(0)
+        for event in events:
+            self._put(event)
+
+    def _put(self, event):
+        self.events[event['id']] = (event, self.version)
+        if event.get('status') != 'cancelled':
+            duration = _parse_time(event['end']['dateTime']) - _parse_time(event['start']['dateTime'])
+            self._max_duration = max(self._max_duration, duration)
+        self._index = None
+
+    def upsert(self, event):
+        self.version += 1
+        self._put(event)
+
+    def cancel(self, event_id):
+        entry = self.events.get(event_id)
+        if entry is None:
+            return
+        self.version += 1
+        self._put({'id': event_id, 'status': 'cancelled'})
+
+    def _sorted_index(self):
+        """按开始时间排序的 (开始时间, event_id) 索引，有变更时重建"""
+        if self._index is None:
+            index = []
+            for event_id, (event, _) in self.events.items():
+                if event.get('status') != 'cancelled':
+                    index.append((_parse_time(event['start']['dateTime']), event_id))
+            index.sort()
+            self._index = (index, [start for start, _ in index])
+        return self._index
+
+    def in_window(self, time_min, time_max):
+        """与 [time_min, time_max) 有重叠的事件，按开始时间排序"""
+        index, starts = self._sorted_index()
+        lo = 0 if time_min is None else bisect.bisect_left(starts, time_min - self._max_duration)
+        hi = len(index) if time_max is None else bisect.bisect_left(starts, time_max)
+
+        result = []
+        for _, event_id in index[lo:hi]:
+            event = self.events[event_id][0]
+            if time_min is None or _parse_time(event['end']['dateTime']) > time_min:
+                result.append(event)
+        return result
+
+    def changed_since(self, version):
+        """某个版本之后新增、修改或取消的事件"""
+        return [event for event, modified in self.events.values() if modified > version]
+
+
+class FakeCalendarServer:
+    """
+    模拟 Google Calendar v3 events.list
+
+    支持 timeMin / timeMax / maxResults / pageToken / syncToken，
+    最后一页返回 nextSyncToken，未知的 syncToken 返回 410。
+    /_bench/ 下的管理接口用于统计请求数和修改事件。
+    """
+
+    def __init__(self, calendars, host='127.0.0.1', port=0, latency=0.0):
+        """
+        初始化模拟服务
+
+        Args:
+            calendars: {calendar_id: [事件]}
+            host: 监听地址
+            port: 监听端口（0 表示随机端口）
+            latency: 每个请求的额外延迟（秒）
+        """
+        self.calendars = {calendar_id: _FakeCalendar(events)
+                          for calendar_id, events in calendars.items()}
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+        # 分页结果缓存：{(calendar_id, 查询参数, 版本号): [事件]}
+        self._pages = {}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        """实际监听的端口"""
+        return self._server.server_address[1]
+
+    @property
+    def api_endpoint(self):
+        """传给 GoogleCalendarClient 的 api_endpoint"""
+        return f'http://127.0.0.1:{self.port}{CALENDAR_API_PREFIX}'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, body = server.handle_get(self.path)
+                self._reply(status, body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = json.loads(self.rfile.read(length) or b'{}')
+                status, body = server.handle_post(self.path, data)
+                self._reply(status, body)
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle_get(self, path):
+        url = urlparse(path)
+        if url.path == '/_bench/stats':
+            return 200, {'requests': self.request_count}
+
+        with self._lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        parts = url.path[len(CALENDAR_API_PREFIX):].split('/')
+        if not url.path.startswith(CALENDAR_API_PREFIX) or len(parts) != 3 or parts[2] != 'events':
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+
+        calendar = self.calendars.get(unquote(parts[1]))
+        if calendar is None:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        return self._list(unquote(parts[1]), calendar, params)
+
+    def _list(self, calendar_id, calendar, params):
+        with self._lock:
+            version = calendar.version
+            sync_token = params.get('syncToken')
+            if sync_token:
+                try:
+                    since = int(sync_token.lstrip('v'))
+                except ValueError:
+                    since = None
+                if since is None or since > version:
+                    return 410, {'error': {'code': 410, 'message': 'Sync token is no longer valid'}}
+                key = (calendar_id, 'sync', since, version)
+            else:
+                key = (calendar_id, params.get('timeMin'), params.get('timeMax'), version)
+
+            items = self._pages.get(key)
+            if items is None:
+                if sync_token:
+                    items = calendar.changed_since(since)
+                else:
+                    time_min = _parse_time(params['timeMin']) if 'timeMin' in params else None
+                    time_max = _parse_time(params['timeMax']) if 'timeMax' in params else None
+                    items = calendar.in_window(time_min, time_max)
+                if len(self._pages) > 64:
+                    self._pages.clear()
+                self._pages[key] = items
+
+        offset = int(params.get('pageToken') or 0)
+        page_size = int(params.get('maxResults') or 250)
+        page = items[offset:offset + page_size]
+
+        body = {'kind': 'calendar#events', 'items': page}
+        if offset + page_size < len(items):
+            body['nextPageToken'] = str(offset + page_size)
+        else:
+            body['nextSyncToken'] = f'v{version}'
+        return 200, body
+
+    def handle_post(self, path, data):
+        url = urlparse(path)
+        if url.path == '/_bench/upsert':
+            calendar = self.calendars[data['calendar_id']]
+            with self._lock:
+                for event in data['events']:
+                    calendar.upsert(event)
+            return 200, {'version': calendar.version}
+        if url.path == '/_bench/cancel':
+            calendar = self.calendars[data['calendar_id']]
+            with self._lock:
+                for event_id in data['event_ids']:
+                    calendar.cancel(event_id)
+            return 200, {'version': calendar.version}
+        if url.path == CALENDAR_API_PREFIX + 'freeBusy':
+            return self._freebusy(data)
+        return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+
+    def _freebusy(self, data):
+        """freebusy.query：各日历在窗口内的忙碌时段（按窗口截断）"""
+        with self._lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        time_min, time_max = _parse_time(data['timeMin']), _parse_time(data['timeMax'])
+        calendars = {}
+        with self._lock:
+            for item in data.get('items', []):
+                calendar = self.calendars.get(item['id'])
+                if calendar is None:
+                    calendars[item['id']] = {'errors': [{'domain': 'global', 'reason': 'notFound'}]}
+                    continue
+                calendars[item['id']] = {'busy': [
+                    {'start': _format_time(max(_parse_time(event['start']['dateTime']), time_min)),
+                     'end': _format_time(min(_parse_time(event['end']['dateTime']), time_max))}
+                    for event in calendar.in_window(time_min, time_max)
+                    if event.get('transparency') != 'transparent'
+                ]}
+        return 200, {'kind': 'calendar#freeBusy', 'calendars': calendars}
+
+    def start(self):
+        """在后台线程中启动 HTTP 服务"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='fake-calendar', daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        """停止 HTTP 服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeHomeAssistantServer:
+    """
+    模拟 Home Assistant REST API
+
+    GET /api/、GET /api/services 和 POST /api/services/<domain>/<service>，
+    服务调用可配置延迟和失败率，并记录收到的每次调用
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, seed=0):
+        """
+        初始化模拟服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口（0 表示随机端口）
+            latency: 服务调用的响应延迟（秒）
+            failure_rate: 服务调用返回 500 的概率
+            seed: 随机种子
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.request_count = 0
+        # 服务调用记录：[{'received_at', 'domain', 'service', 'data', 'ok'}]
+        self.calls = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        """实际监听的端口"""
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self):
+        """传给 HomeAssistantClient 的 base_url"""
+        return f'http://127.0.0.1:{self.port}'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, body = server.handle_get(self.path)
+                self._reply(status, body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = json.loads(self.rfile.read(length) or b'{}')
+                status, body = server.handle_post(self.path, data)
+                self._reply(status, body)
+
+            def _reply(self, status, body):
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle_get(self, path):
+        path = urlparse(path).path
+        if path == '/_bench/stats':
+            with self._lock:
+                return 200, {'requests': self.request_count, 'calls': list(self.calls)}
+
+        with self._lock:
+            self.request_count += 1
+        if path == '/api/':
+            return 200, {'message': 'API running.'}
+        if path == '/api/services':
+            return 200, [
+                {'domain': 'script', 'services': {'turn_on': {}}},
+                {'domain': 'notify', 'services': {}},
+                {'domain': 'tts', 'services': {'baidu_say': {}}},
+            ]
+        return 404, {'message': 'Not Found'}
+
+    def handle_post(self, path, data):
+        received_at = time.time()
+        path = urlparse(path).path
+        with self._lock:
+            self.request_count += 1
+            failed = self._rng.random() < self.failure_rate
+
+        if not path.startswith('/api/services/'):
+            return 404, {'message': 'Not Found'}
+        if self.latency:
+            time.sleep(self.latency)
+
+        domain, _, service = path[len('/api/services/'):].partition('/')
+        with self._lock:
+            self.calls.append({
+                'received_at': received_at,
+                'domain': domain,
+                'service': service,
+                'data': data,
+                'ok': not failed,
+            })
+        if failed:
+            return 500, {'message': 'Simulated failure'}
+        return 200, []
+
+    def start(self):
+        """在后台线程中启动 HTTP 服务"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='fake-home-assistant', daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        """停止 HTTP 服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _serve(factory, kwargs, conn):
+    server = factory(**kwargs)
+    conn.send(server.port)
+    conn.close()
+    server.serve_forever()
+
+
+def start_in_subprocess(factory, **kwargs):
+    """
+    在子进程中运行模拟服务，避免服务端的 CPU 和内存计入被测程序
+
+    Args:
+        factory: 返回服务实例的可调用对象（需可被 pickle，例如模块级函数或类）
+        **kwargs: 传给 factory 的参数
+
+    Returns:
+        (process, port)
+    """
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_serve, args=(factory, kwargs, child_conn), daemon=True)
+    process.start()
+    port = parent_conn.recv()
+    return process, port
+
+
+def synthetic_calendar_server(calendar_sizes, span_days=30, seed=0, latency=0.0, port=0,
+                              start_ts=None):
+    """
+    创建带合成日历的 FakeCalendarServer
+
+    Args:
+        calendar_sizes: {calendar_id: 事件数}
+        span_days: 事件开始时间的分布范围（天）
+        seed: 随机种子
+        latency: 每个请求的额外延迟（秒）
+        port: 监听端口
+        start_ts: 最早开始时间（Unix 时间戳），默认为当前时间
+    """
+    start = datetime.fromtimestamp(start_ts, timezone.utc) if start_ts else None
+    calendars = {
+        calendar_id: generate_events(size, start=start, span=timedelta(days=span_days),
+                                     seed=seed + i, prefix=f'C{i}E')
+        for i, (calendar_id, size) in enumerate(calendar_sizes.items())
+    }
+    return FakeCalendarServer(calendars, port=port, latency=latency)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='运行模拟的 Google Calendar / Home Assistant 服务')
+    parser.add_argument('--calendar-port', type=int, default=8801)
+    parser.add_argument('--events', type=int, default=1000, help='合成日历的事件数')
+    parser.add_argument('--ha-port', type=int, default=8802)
+    parser.add_argument('--ha-latency', type=float, default=0.0)
+    parser.add_argument('--ha-failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    calendar_server = synthetic_calendar_server({'primary': args.events}, port=args.calendar_port)
+    ha_server = FakeHomeAssistantServer(
+        port=args.ha_port, latency=args.ha_latency, failure_rate=args.ha_failure_rate)
+    calendar_server.start()
+    ha_server.start()
+    print(f'Calendar API: {calendar_server.api_endpoint}')
+    print(f'Home Assistant: {ha_server.base_url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -1,7 +1,10 @@
 """Google Calendar API 集成模块"""
 import os
 import pickle
+import socket
 from datetime import datetime, timedelta, timezone
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -11,6 +14,24 @@ from googleapiclient.errors import HttpError
 # 如果修改这些作用域，请删除 token.pickle 文件
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 
+# 增量同步：每次全量同步覆盖的时间跨度
+# 查询窗口超出该范围时会重新全量同步一次
+SYNC_WINDOW = timedelta(days=7)
+
+# 查询事件时每页的最大事件数（API 允许的上限为 2500）
+PAGE_SIZE = 250
+
+# 同步时的临时错误：网络故障、限流或服务端暂时不可用，可以继续使用本地事件集
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (TransportError, httplib2.HttpLib2Error, ConnectionError, TimeoutError, socket.timeout)
+
+
+def is_transient_error(error):
+    """是否为临时错误（认证、权限等其他错误需要处理，不能继续使用旧数据）"""
+    if isinstance(error, HttpError):
+        return error.resp.status in TRANSIENT_STATUSES
+    return isinstance(error, TRANSIENT_ERRORS)
+
 
 class GoogleCalendarClient:
     """Google Calendar 客户端"""
@@ -24,6 +45,15 @@ class GoogleCalendarClient:
         """
         self.credentials_path = credentials_path
         self.service = None
+        self.creds = None
+
+        # 增量同步状态：本地维护的事件集 {event_id: event}
+        self.events = {}
+        # 上次同步返回的 nextSyncToken，None 表示需要全量同步
+        self.sync_token = None
+        # 全量同步覆盖到的时间上限
+        self.synced_until = None
+
         self._authenticate()
 
     def _authenticate(self):
@@ -48,8 +78,31 @@ class GoogleCalendarClient:
             with open('token.pickle', 'wb') as token:
                 pickle.dump(creds, token)
 
+        self.creds = creds
         self.service = build('calendar', 'v3', credentials=creds)
 
+    def _reauthenticate(self):
+        """
+        检测到 401 后刷新访问令牌并重建服务
+
+        有刷新令牌时直接刷新；没有刷新令牌或刷新令牌已失效时重新走授权流程
+        """
+        print('检测到认证错误 (401)，刷新 token 后重试...')
+        if self.creds and self.creds.refresh_token:
+            try:
+                self.creds.refresh(Request())
+            except RefreshError as e:
+                print(f'刷新 token 失败: {e}，重新授权...')
+            else:
+                with open('token.pickle', 'wb') as token:
+                    pickle.dump(self.creds, token)
+                self.service = build('calendar', 'v3', credentials=self.creds)
+                return
+
+        if os.path.exists('token.pickle'):
+            os.remove('token.pickle')
+        self._authenticate()
+
     def get_upcoming_events(self, time_min=None, time_max=None, max_results=10):
         """
         获取即将到来的日历事件
@@ -57,7 +110,7 @@ class GoogleCalendarClient:
         Args:
             time_min: 开始时间（datetime 对象），默认为当前时间
             time_max: 结束时间（datetime 对象），默认为 24 小时后
-            max_results: 最大返回结果数
+            max_results: 最大返回结果数，None 表示不限制（按 nextPageToken 翻页取完）
 
         Returns:
             事件列表
@@ -81,21 +134,165 @@ class GoogleCalendarClient:
             else:
                 time_max_str = time_max.isoformat() + 'Z'
 
+            events = []
+            page_token = None
+            while True:
+                page_size = PAGE_SIZE if max_results is None else min(max_results - len(events), PAGE_SIZE)
+                events_result = self.service.events().list(
+                    calendarId='primary',
+                    timeMin=time_min_str,
+                    timeMax=time_max_str,
+                    maxResults=page_size,
+                    singleEvents=True,
+                    orderBy='startTime',
+                    pageToken=page_token
+                ).execute()
+
+                events.extend(events_result.get('items', []))
+                page_token = events_result.get('nextPageToken')
+                if not page_token or (max_results is not None and len(events) >= max_results):
+                    break
+
+            return events if max_results is None else events[:max_results]
+
+        except HttpError as error:
+            print(f'获取日历事件时发生错误: {error}')
+            return []
+
+    def sync_events(self, time_max=None):
+        """
+        增量同步日历事件到本地事件集
+
+        首次调用（或查询窗口超出已同步范围）时做一次有界的全量同步并保存
+        nextSyncToken，之后只拉取新增、修改或取消的事件。
+        同步令牌失效（410 Gone）时自动重新全量同步，
+        访问令牌失效（401）时刷新令牌后重试一次。
+
+        Args:
+            time_max: 需要覆盖的时间上限（datetime 对象），默认为 1 小时后
+
+        Returns:
+            本次同步变更的事件数
+
+        Raises:
+            HttpError: 其他 API 错误（以及重试后仍然失败的 401）会直接抛出，由调用方处理
+        """
+        now = datetime.now(timezone.utc)
+        if time_max is None:
+            time_max = now + timedelta(hours=1)
+
+        try:
+            return self._sync_once(now, time_max)
+        except HttpError as error:
+            if error.resp.status == 410:
+                print('同步令牌已失效 (410 Gone)，重新全量同步...')
+                self.sync_token = None
+                return self._sync_once(now, time_max)
+            if error.resp.status == 401:
+                self._reauthenticate()
+                return self._sync_once(now, time_max)
+            raise
+
+    def _sync_once(self, now, time_max):
+        """执行一次同步：需要时全量同步，否则增量同步"""
+        if (self.sync_token is None or self.synced_until is None
+                or time_max > self.synced_until):
+            return self._full_sync(now)
+        return self._incremental_sync(now)
+
+    def _full_sync(self, now):
+        """全量同步 [now, now + SYNC_WINDOW] 范围内的事件"""
+        synced_until = now + SYNC_WINDOW
+        events = {}
+        sync_token = None
+        page_token = None
+
+        while True:
             events_result = self.service.events().list(
                 calendarId='primary',
-                timeMin=time_min_str,
-                timeMax=time_max_str,
-                maxResults=max_results,
+                timeMin=now.isoformat(),
+                timeMax=synced_until.isoformat(),
                 singleEvents=True,
-                orderBy='startTime'
+                pageToken=page_token
             ).execute()
 
-            events = events_result.get('items', [])
-            return events
+            for event in events_result.get('items', []):
+                if event.get('status') != 'cancelled':
+                    events[event['id']] = event
 
-        except HttpError as error:
-            print(f'获取日历事件时发生错误: {error}')
-            return []
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                sync_token = events_result.get('nextSyncToken')
+                break
+
+        self.events = events
+        self.sync_token = sync_token
+        self.synced_until = synced_until
+        print(f'  全量同步完成: {len(events)} 个事件')
+        return len(events)
+
+    def _incremental_sync(self, now):
+        """使用 syncToken 拉取自上次同步以来的变更"""
+        changed = 0
+        page_token = None
+
+        while True:
+            events_result = self.service.events().list(
+                calendarId='primary',
+                syncToken=self.sync_token,
+                singleEvents=True,
+                pageToken=page_token
+            ).execute()
+
+            for event in events_result.get('items', []):
+                changed += 1
+                if event.get('status') == 'cancelled':
+                    self.events.pop(event['id'], None)
+                else:
+                    self.events[event['id']] = event
+
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                self.sync_token = events_result.get('nextSyncToken')
+                break
+
+        # 移除已经结束的事件，避免本地事件集无限增长
+        for event_id, event in list(self.events.items()):
+            if self._as_aware(self.get_event_end_time(event)) <= now:
+                del self.events[event_id]
+
+        if changed:
+            print(f'  增量同步完成: {changed} 个事件有变更')
+        return changed
+
+    def get_synced_events(self, time_min, time_max):
+        """
+        从本地事件集中获取时间范围内的事件
+
+        与 events().list 的语义一致：返回在 [time_min, time_max) 内
+        有重叠的事件，按开始时间排序
+
+        Args:
+            time_min: 开始时间（timezone-aware datetime）
+            time_max: 结束时间（timezone-aware datetime）
+
+        Returns:
+            事件列表
+        """
+        events = [
+            event for event in self.events.values()
+            if self._as_aware(self.get_event_start_time(event)) < time_max
+            and self._as_aware(self.get_event_end_time(event)) > time_min
+        ]
+        events.sort(key=lambda event: self._as_aware(self.get_event_start_time(event)))
+        return events
+
+    @staticmethod
+    def _as_aware(dt):
+        """全天事件解析出的是 naive 时间，按本地时区处理以便比较"""
+        if dt.tzinfo is None:
+            return dt.astimezone()
+        return dt
 
     def get_event_start_time(self, event):
         """
@@ -117,6 +314,24 @@ class GoogleCalendarClient:
             # 全天事件
             return datetime.fromisoformat(start)
 
+    def get_event_end_time(self, event):
+        """
+        获取事件的结束时间
+
+        Args:
+            event: Google Calendar 事件对象
+
+        Returns:
+            datetime 对象，表示事件结束时间
+        """
+        end = event.get('end') or event['start']
+        end = end.get('dateTime', end.get('date'))
+
+        if 'T' in end:
+            return datetime.fromisoformat(end.replace('Z', '+00:00'))
+        else:
+            return datetime.fromisoformat(end)
+
     def get_event_summary(self, event):
         """
         获取事件摘要（标题）
@@ -1,253 +1,1152 @@
 """Google Calendar API 集成模块 - 支持 CLI 无浏览器环境"""
 import os
+import heapq
+import itertools
+import logging
 import pickle
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
-from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError, TransportError
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from event_record import EventRecord
+from http_transport import TRANSPORT_ERRORS, AuthorizedSessionHttp
+from recurrence import RecurrenceError, RecurrenceExpansion, instance_id, is_exception
+from reminder_plan import ReminderRules
+from metrics import (CALENDAR_API_CALLS, CALENDAR_API_ERRORS, CALENDAR_API_RETRIES,
+                     CALENDAR_CIRCUIT_OPEN, CALENDAR_FETCH_SECONDS)
+from resilience import CircuitBreaker, backoff_delay, parse_retry_after
+
+logger = logging.getLogger(__name__)
 
 # 如果修改这些作用域，请删除 token.pickle 文件
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 
+# 增量同步：每次全量同步覆盖的时间跨度
+# 查询窗口超出该范围时会重新全量同步一次
+SYNC_WINDOW = timedelta(days=7)
+
+# 分页查询时每页的事件数（API 上限 2500）
+PAGE_SIZE = 250
+
+# 可以退避重试的错误：限流和服务端临时故障
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# 403 中表示限流的错误原因（其他 403 是权限问题，重试没有意义）
+RATE_LIMIT_REASONS = {'ratelimitexceeded', 'userratelimitexceeded', 'rate_limit_exceeded'}
+# 403 中表示配额用完的错误原因：不重试，但计入断路器，避免继续消耗请求
+QUOTA_REASONS = {'quotaexceeded', 'dailylimitexceeded', 'resource_exhausted'}
+# 访问令牌剩余有效时间少于该秒数时在请求前同步刷新（后台刷新失败时的兜底）
+# 需要大于 google-auth 自己判断过期的提前量（3 分 45 秒），避免请求中途被隐式刷新
+TOKEN_EXPIRY_MARGIN = 300
+# 后台刷新线程：最长检查间隔，网络故障的重试间隔范围，刷新令牌失效后的重试间隔（秒）
+TOKEN_CHECK_INTERVAL = 600
+TOKEN_RETRY_MIN = 15
+TOKEN_RETRY_MAX = 300
+TOKEN_AUTH_RETRY = 1800
+
+# 网络层面的临时错误
+TRANSIENT_ERRORS = (socket.timeout, ConnectionError, TimeoutError, TransportError) + TRANSPORT_ERRORS
+
+
+class AuthorizationError(Exception):
+    """凭证已失效（刷新令牌被撤销等），需要重新授权"""
+
+
+def _token_request():
+    """
+    刷新访问令牌使用的 HTTP 请求对象
+
+    延迟导入：google.auth.transport.requests 会连带导入 service_account 和 cryptography，
+    启动时令牌还没过期就不需要，留给后台刷新线程在需要时导入
+    """
+    from google.auth.transport.requests import Request
+    return Request()
+
+
+# 部分响应：只下载用到的字段，减少传输量和解析时间
+EVENT_FIELDS = 'nextPageToken,nextSyncToken,items(id,etag,status,summary,start,end)'
+# 本地展开重复日程时还需要主事件的重复规则和例外对应的原始实例
+RECURRENCE_FIELDS = ('nextPageToken,nextSyncToken,items(id,etag,status,summary,start,end,'
+                     'recurrence,recurringEventId,originalStartTime)')
+
+# 本地展开重复日程时全量同步不限制时间上限（主事件和例外数量很少），
+# 用该时间作为"已同步到"的标记：之后只有修改才需要网络请求
+UNBOUNDED_SYNC = datetime(9999, 1, 1, tzinfo=timezone.utc)
+
+
+def _start_ts(record):
+    """按开始时间排序的 key"""
+    return record.start_ts
+
+
+class _CalendarSyncState:
+    """单个日历的增量同步状态"""
+
+    def __init__(self, calendar_id):
+        self.calendar_id = calendar_id
+        # 本地维护的事件集 {event_id: EventRecord}
+        self.events = {}
+        # 本地展开重复日程时的主事件和例外（原始数据） {event_id: event}
+        self.recurring = {}
+        # 上次同步返回的 nextSyncToken，None 表示需要全量同步
+        self.sync_token = None
+        # 全量同步覆盖到的时间上限
+        self.synced_until = None
+        # 本地展开重复日程时各主事件的展开结果 {主事件 ID: RecurrenceExpansion 或 None（规则无法解析）}
+        self.expansions = {}
+        self.lock = threading.Lock()
+
 
 class GoogleCalendarClient:
     """Google Calendar 客户端"""
 
-    def __init__(self, credentials_path='credentials.json', headless=False):
+    def __init__(self, credentials_path='credentials.json', headless=False,
+                 calendar_ids=None, max_workers=4, fetch_timeout=15, connect_timeout=3.05,
+                 read_timeout=10, cache=None, api_endpoint=None, credentials=None,
+                 token_path='token.pickle', executor=None, rate_limiter=None, max_retries=3,
+                 backoff_base=1.0, backoff_cap=30.0, breaker=None, refresh_margin=900,
+                 session=None, expand_recurrence=False, reminder_rules=None):
         """
         初始化 Google Calendar 客户端
 
         Args:
             credentials_path: Google API 凭证文件路径
             headless: 是否使用无头模式（CLI 环境，无浏览器）
+            calendar_ids: 要查询的日历 ID 列表，默认为 ['primary']
+            max_workers: 并发抓取日历的最大线程数
+            fetch_timeout: 每次同步等待所有日历的最长时间（秒）
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应的超时时间（秒）
+            cache: EventCache 实例，用于持久化同步结果，None 表示不缓存
+            api_endpoint: Calendar API 地址（例如本地的模拟服务），None 表示使用 Google 官方地址
+            credentials: 直接使用的凭证对象，设置后不读取 token.pickle、不走授权流程
+            token_path: 保存访问令牌和刷新令牌的文件路径
+            executor: 共享的抓取线程池（例如多租户模式下所有客户端共用），None 表示创建自己的线程池
+            rate_limiter: 请求限流的 TokenBucket（可在多个客户端之间共享），None 表示不限流
+            max_retries: 限流、服务端错误和网络错误的最大重试次数
+            backoff_base: 第一次重试的最长等待时间（秒），之后每次加倍（带随机抖动）
+            backoff_cap: 单次重试等待时间的上限（秒），Retry-After 超过该值时不再等待
+            breaker: CircuitBreaker，None 表示使用默认参数创建
+            refresh_margin: 后台线程在访问令牌过期前多少秒刷新
+            session: 共享的 requests.Session 连接池（例如多租户模式下所有客户端共用），
+                     None 表示创建自己的连接池
+            expand_recurrence: 增量同步时在本地展开重复日程：只同步主事件和例外，
+                               不再由服务端逐个返回实例
+            reminder_rules: 事件转换为 EventRecord 时计算提醒时间点的 ReminderRules，
+                            None 表示使用默认提醒时间点
         """
         self.credentials_path = credentials_path
+        self.token_path = token_path
         self.headless = headless
         self.service = None
         self.creds = None  # 保存凭证对象以便后续检查和刷新
-        self._authenticate()
+        self.api_endpoint = api_endpoint
+
+        # 本地展开重复日程（只用于增量同步）
+        self.expand_recurrence = expand_recurrence
+        self._event_fields = RECURRENCE_FIELDS if expand_recurrence else EVENT_FIELDS
+        self.reminder_rules = reminder_rules or ReminderRules()
+
+        # 多日历：每个日历有独立的增量同步状态
+        self.calendar_ids = list(calendar_ids or ['primary'])
+        self._calendars = {calendar_id: _CalendarSyncState(calendar_id) for calendar_id in self.calendar_ids}
+
+        # 并发抓取：有界线程池，所有线程共用一个连接池，复用 keep-alive 连接
+        self.fetch_timeout = fetch_timeout
+        workers = max(1, min(max_workers, len(self.calendar_ids)))
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='calendar-fetch')
+        # 抓取线程之外，刷新任务和推送通道续订也会发请求
+        self._transport = AuthorizedSessionHttp(
+            session=session, connect_timeout=connect_timeout, read_timeout=read_timeout,
+            pool_size=workers + 1)
+        self._in_flight = {}
+        self._auth_lock = threading.Lock()
+        # 后台刷新访问令牌
+        self.refresh_margin = refresh_margin
+        self._refresher = None
+        self._closed = threading.Event()
+        # 已发出的 API 请求数（用于每日调用预算）
+        self.api_calls = 0
+        self._calls_lock = threading.Lock()
+        # 请求保护：限流、退避重试和断路器
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker('Google Calendar')
+        # 每个日历最近一次成功查询的结果，全量查询失败时继续使用
+        self._last_listed = {}
+
+        # 持久化缓存：启动时预热本地事件集和同步令牌，不需要网络请求
+        self.cache = cache
+        if self.cache:
+            self._warm_from_cache()
+
+        if credentials is not None:
+            self.creds = credentials
+            self.service = self._build_service(credentials)
+        else:
+            self._authenticate()
+        self.start_credential_refresher()
+
+    def _warm_from_cache(self):
+        """从持久化缓存加载各日历的事件和同步令牌"""
+        for calendar_id, state in self._calendars.items():
+            try:
+                events, sync_token, synced_until = self.cache.load(calendar_id)
+            except Exception as e:
+                logger.warning('加载日历 %s 的缓存失败: %s', calendar_id, e)
+                continue
+            if (synced_until is not None
+                    and (synced_until >= UNBOUNDED_SYNC.timestamp()) != self.expand_recurrence):
+                # 缓存和同步令牌来自另一种重复日程展开方式，两种方式的同步令牌不能混用
+                logger.info('日历 %s 的缓存来自另一种重复日程展开方式，重新全量同步', calendar_id)
+                continue
+
+            with state.lock:
+                state.events, state.recurring = {}, {}
+                for event in events.values():
+                    self._store(calendar_id, state.events, state.recurring, event)
+            state.sync_token = sync_token
+            if synced_until is not None:
+                state.synced_until = datetime.fromtimestamp(synced_until, timezone.utc)
+            if events or sync_token:
+                logger.info('已从缓存加载日历 %s: %d 个事件', calendar_id, len(events))
+
+    def use_reminder_rules(self, rules):
+        """
+        改用另一套提醒规则，重新计算本地事件集中所有记录的提醒时间点
+
+        用于在客户端创建之后由提醒应用统一设置规则（例如外部创建的客户端）
+        """
+        self.reminder_rules = rules
+        for state in self._calendars.values():
+            with state.lock:
+                state.events = {event_id: record.with_rules(rules)
+                                for event_id, record in state.events.items()}
+                state.expansions.clear()
+        self._last_listed = {
+            calendar_id: [record.with_rules(rules) for record in records]
+            for calendar_id, records in self._last_listed.items()
+        }
+
+    def _ingest(self, event, calendar_id):
+        """把 API 返回的事件转换为 EventRecord（解析时间、清理标题、计算提醒时间点）"""
+        return EventRecord.from_event(event, calendar_id, self.reminder_rules)
+
+    def _store(self, calendar_id, records, recurring, event):
+        """
+        把同步结果中的一项保存到本地事件集
+
+        可提醒的事件转换为 EventRecord 保存；本地展开重复日程时主事件和例外另外保留原始数据，
+        用于展开实例和排除被修改或取消的实例
+
+        Args:
+            calendar_id: 日历 ID
+            records: 事件记录 {event_id: EventRecord}
+            recurring: 主事件和例外 {event_id: event}
+            event: 同步返回的事件（未取消，或本地展开时已取消的例外）
+        """
+        event_id = event['id']
+        if self.expand_recurrence and (event.get('recurrence') or is_exception(event)):
+            recurring[event_id] = event
+        if event.get('recurrence') or event.get('status') == 'cancelled':
+            records.pop(event_id, None)
+        else:
+            records[event_id] = self._ingest(event, calendar_id)
+
+    @staticmethod
+    def _discard(state, event_id):
+        """从本地事件集中删除一项（调用方持有 state.lock）"""
+        state.events.pop(event_id, None)
+        state.recurring.pop(event_id, None)
+
+    def _cache_row(self, event):
+        """将事件转换为缓存行 (event_id, start_ts, end_ts, event)"""
+        start, end = self._item_span(event)
+        return event['id'], start.timestamp(), end.timestamp(), event
+
+    def _item_span(self, event, state=None):
+        """
+        本地事件集中一项的时间范围 (start, end)，用于缓存索引和清理已结束的事件
+
+        本地展开重复日程时事件集中还有主事件和已取消的例外：
+        主事件结束于最后一个实例（无限重复时不结束），已取消的例外只有原始开始时间
+
+        Args:
+            event: 事件、主事件或例外
+            state: 日历的同步状态，用于取得主事件的展开结果
+        """
+        if event.get('recurrence'):
+            start = self._as_aware(self.get_event_start_time(event))
+            expansion = self._expansion(state, event) if state is not None else None
+            return start, (expansion and expansion.last_end()) or UNBOUNDED_SYNC
+        if 'start' not in event:
+            original = self._as_aware(self.get_event_start_time({'start': event['originalStartTime']}))
+            # 被取消的实例已经开始后就不会再提醒，保留一天足够
+            return original, original + timedelta(days=1)
+        return (self._as_aware(self.get_event_start_time(event)),
+                self._as_aware(self.get_event_end_time(event)))
+
+    def _keep_item(self, event):
+        """同步结果中的一项是否保存到本地事件集（本地展开时保留已取消的例外，用于排除对应的实例）"""
+        if event.get('status') != 'cancelled':
+            return True
+        return self.expand_recurrence and is_exception(event)
+
+    def _write_cache(self, method, *args):
+        """调用 EventCache 的写入方法；缓存写入失败不影响同步结果"""
+        if not self.cache:
+            return
+        try:
+            getattr(self.cache, method)(*args)
+        except Exception as e:
+            logger.warning('写入事件缓存失败: %s', e)
 
     def _authenticate(self):
-        """验证并初始化 Google Calendar 服务"""
+        """验证并初始化 Google Calendar 服务（只在启动时调用，可能进入交互式授权）"""
         creds = None
 
         # token.pickle 存储用户的访问和刷新令牌
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
+        if os.path.exists(self.token_path):
+            with open(self.token_path, 'rb') as token:
                 creds = pickle.load(token)
 
-        # 检查凭证是否需要刷新（提前5分钟刷新）
-        needs_refresh = False
-        if creds:
-            if creds.expired:
-                needs_refresh = True
-            elif creds.expiry:
-                # 提前5分钟刷新
-                # 确保 expiry 是 timezone-aware 的
-                if creds.expiry.tzinfo is None:
-                    # 如果 expiry 是 naive datetime，假设它是 UTC 时间
-                    expiry_aware = creds.expiry.replace(tzinfo=timezone.utc)
-                else:
-                    expiry_aware = creds.expiry
-                time_until_expiry = expiry_aware - datetime.now(timezone.utc)
-                if time_until_expiry.total_seconds() < 300:  # 5分钟 = 300秒
-                    needs_refresh = True
-
-        # 如果没有有效的凭证，让用户登录
-        if not creds or not creds.valid or needs_refresh:
-            if creds and creds.refresh_token and (creds.expired or needs_refresh):
-                try:
-                    print('刷新访问令牌...')
-                    creds.refresh(Request())
-                    # 保存刷新后的凭证
-                    with open('token.pickle', 'wb') as token:
-                        pickle.dump(creds, token)
-                    print('访问令牌刷新成功')
-                except Exception as e:
-                    print(f'刷新令牌失败: {e}')
-                    print('需要重新授权...')
-                    # 删除无效的 token 文件
-                    if os.path.exists('token.pickle'):
-                        os.remove('token.pickle')
-                    creds = None
-            
-            # 如果刷新失败或没有有效凭证，执行完整的授权流程
-            if not creds or not creds.valid:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.credentials_path, SCOPES)
-
-                if self.headless:
-                    # CLI 模式 - 使用 OOB（Out-of-Band）流程
-                    print('\n' + '=' * 60)
-                    print('CLI 授权模式（无浏览器环境）')
-                    print('=' * 60)
-                    print('请按照以下步骤操作：')
-                    print('1. 在任何设备的浏览器中访问下面的 URL')
-                    print('2. 使用你的 Google 账号登录并授权')
-                    print('3. 复制授权码并粘贴到下面')
-                    print('-' * 60)
-
-                    # 使用 OOB 流程（授权后显示授权码）
-                    flow.redirect_uri = 'urn:ietf:wg:oauth:2.0:oob'
-                    auth_url, _ = flow.authorization_url(prompt='consent')
-
-                    print(f'\n授权 URL:\n{auth_url}\n')
-                    print('-' * 60)
-
-                    # 等待用户输入授权码
-                    code = input('请输入授权码: ').strip()
-
-                    # 使用授权码获取凭证
-                    flow.fetch_token(code=code)
-                    creds = flow.credentials
-
-                    print('-' * 60)
-                    print('✓ 授权成功！')
-                    print('=' * 60 + '\n')
-                else:
-                    # 正常模式 - 自动打开浏览器
-                    creds = flow.run_local_server(port=0)
+        # 启动时令牌已过期或 5 分钟内过期：先刷新一次
+        transient_failure = False
+        if creds and creds.refresh_token and (
+                not creds.token or self._seconds_until_expiry(creds) < TOKEN_EXPIRY_MARGIN):
+            try:
+                logger.info('刷新访问令牌...')
+                creds.refresh(_token_request())
+                self._save_token(creds)
+                logger.info('访问令牌刷新成功')
+            except TransportError as e:
+                # 网络故障不代表凭证失效：保留凭证，由后台线程继续重试，先用缓存的日程提醒
+                logger.warning('刷新访问令牌失败（网络错误）: %s，保留现有凭证，稍后重试', e)
+                transient_failure = True
+            except Exception as e:
+                logger.error('刷新令牌失败: %s，需要重新授权...', e)
+                creds = None
+
+        # 没有可用的凭证（或刷新令牌已失效），执行完整的授权流程
+        if not transient_failure and (not creds or not creds.valid):
+            # 授权流程模块（oauthlib、requests_oauthlib）只在这里用到，不拖慢无头模式的正常启动
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(
+                self.credentials_path, SCOPES)
+
+            if self.headless:
+                # CLI 模式 - 使用 OOB（Out-of-Band）流程
+                # 交互式授权提示直接输出到终端，不经过日志
+                print('\n' + '=' * 60)
+                print('CLI 授权模式（无浏览器环境）')
+                print('=' * 60)
+                print('请按照以下步骤操作：')
+                print('1. 在任何设备的浏览器中访问下面的 URL')
+                print('2. 使用你的 Google 账号登录并授权')
+                print('3. 复制授权码并粘贴到下面')
+                print('-' * 60)
+
+                # 使用 OOB 流程（授权后显示授权码）
+                flow.redirect_uri = 'urn:ietf:wg:oauth:2.0:oob'
+                auth_url, _ = flow.authorization_url(prompt='consent')
 
-            # 保存凭证供下次使用
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
-                print('凭证已保存到 token.pickle')
+                print(f'\n授权 URL:\n{auth_url}\n')
+                print('-' * 60)
+
+                # 等待用户输入授权码
+                code = input('请输入授权码: ').strip()
+
+                # 使用授权码获取凭证
+                flow.fetch_token(code=code)
+                creds = flow.credentials
+
+                print('-' * 60)
+                print('✓ 授权成功！')
+                print('=' * 60 + '\n')
+            else:
+                # 正常模式 - 自动打开浏览器
+                creds = flow.run_local_server(port=0)
+
+            # 保存凭证供下次使用（新的凭证原子地替换旧文件）
+            self._save_token(creds)
+            logger.info('凭证已保存到 %s', self.token_path)
 
         self.creds = creds  # 保存到实例变量
-        self.service = build('calendar', 'v3', credentials=creds)
+        self.service = self._build_service(creds)
+
+    def _save_token(self, creds):
+        """保存凭证到 token 文件（先写临时文件再替换，保证原子性，文件权限 0600）"""
+        tmp_path = f'{self.token_path}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(creds, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.token_path)
+
+    @staticmethod
+    def _seconds_until_expiry(creds):
+        """访问令牌的剩余有效时间（秒），没有过期时间时返回无穷大"""
+        if creds.expiry is None:
+            return float('inf')
+        # google-auth 的 expiry 是 naive 的 UTC 时间
+        expiry = creds.expiry if creds.expiry.tzinfo else creds.expiry.replace(tzinfo=timezone.utc)
+        return (expiry - datetime.now(timezone.utc)).total_seconds()
+
+    def _refresh_credentials(self, margin=None, stale_token=None):
+        """
+        刷新访问令牌
+
+        在凭证的副本上刷新，成功后原子地替换 self.creds（各线程的 HTTP 传输在下次请求时
+        换用新凭证，不重建 service 对象、不重新建立连接），并保存 token 文件。
+        刷新失败时保留原有凭证和 token 文件，不会进入交互式授权。
+
+        Args:
+            margin: 剩余有效时间少于该秒数时才刷新
+            stale_token: 该访问令牌被服务端拒绝（401），仍是当前令牌时强制刷新
+
+        Returns:
+            是否刷新了令牌（其他线程已经刷新过时为 False）
+
+        Raises:
+            TransportError: 网络故障，稍后可以重试
+            AuthorizationError: 没有刷新令牌或刷新令牌已失效，需要重新授权
+        """
+        with self._auth_lock:
+            creds = self.creds
+            if stale_token is not None:
+                if creds.token != stale_token:
+                    return False
+            elif creds.token and self._seconds_until_expiry(creds) >= margin:
+                return False
+
+            if not creds.refresh_token:
+                raise AuthorizationError('访问令牌无效且没有刷新令牌，需要重新授权')
+
+            fresh = pickle.loads(pickle.dumps(creds))
+            started = time.monotonic()
+            try:
+                fresh.refresh(_token_request())
+            except TransportError:
+                raise
+            except RefreshError as e:
+                if getattr(e, 'retryable', False):
+                    # 令牌端点临时故障（5xx 等），凭证本身没有问题
+                    raise TransportError(f'令牌端点暂时不可用: {e}') from e
+                logger.error('刷新令牌已失效: %s，请停止服务后重新授权（%s 会保留，直到重新授权成功）',
+                             e, self.token_path)
+                raise AuthorizationError(f'刷新令牌已失效: {e}') from e
+            except Exception as e:
+                logger.error('刷新令牌已失效: %s，请停止服务后重新授权（%s 会保留，直到重新授权成功）',
+                             e, self.token_path)
+                raise AuthorizationError(f'刷新令牌已失效: {e}') from e
+
+            self.creds = fresh
+            try:
+                self._save_token(fresh)
+            except OSError as e:
+                logger.warning('保存 token 文件失败: %s', e)
+            logger.info('访问令牌刷新成功（耗时 %.2f 秒，%d 分钟后过期）',
+                        time.monotonic() - started, self._seconds_until_expiry(fresh) / 60)
+            return True
 
     def _ensure_valid_token(self):
         """
-        确保 token 有效，如果即将过期则提前刷新
-        在每次 API 调用前应该调用此方法
+        确保访问令牌有效，在每次 API 调用前调用
+
+        令牌由后台线程提前刷新，这里通常只是一次不加锁的过期时间检查；
+        只有令牌即将过期（后台刷新一直失败，或系统休眠后恢复）时才在当前线程同步刷新
         """
-        if not self.creds:
-            # 如果没有凭证，重新认证
-            self._authenticate()
+        creds = self.creds
+        if self._seconds_until_expiry(creds) >= TOKEN_EXPIRY_MARGIN and (
+                creds.token or not getattr(creds, 'refresh_token', None)):
+            # 令牌有效，或凭证不使用可刷新的令牌（例如直接传入的匿名凭证）
+            return
+        self._refresh_credentials(margin=TOKEN_EXPIRY_MARGIN)
+
+    def start_credential_refresher(self):
+        """启动后台线程，在访问令牌过期前 refresh_margin 秒刷新"""
+        if self._refresher is not None or not getattr(self.creds, 'refresh_token', None):
             return
+        self._refresher = threading.Thread(
+            target=self._credential_refresh_loop, name='credential-refresh', daemon=True)
+        self._refresher.start()
+
+    def _credential_refresh_loop(self):
+        """后台刷新访问令牌：网络故障时按指数退避重试，刷新令牌失效时低频重试"""
+        retry_delay = TOKEN_RETRY_MIN
+        while not self._closed.is_set():
+            wait = self._seconds_until_expiry(self.creds) - self.refresh_margin
+            if wait > 0:
+                # 定期醒来重新检查（系统休眠后单调时钟的等待时间不可靠）
+                self._closed.wait(min(wait, TOKEN_CHECK_INTERVAL))
+                continue
+            try:
+                self._refresh_credentials(margin=self.refresh_margin)
+            except TransportError as e:
+                logger.warning('后台刷新访问令牌失败（网络错误）: %s，%d 秒后重试', e, retry_delay)
+                self._closed.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, TOKEN_RETRY_MAX)
+            except AuthorizationError:
+                self._closed.wait(TOKEN_AUTH_RETRY)
+            except Exception as e:
+                logger.exception('后台刷新访问令牌出错: %s', e)
+                self._closed.wait(retry_delay)
+            else:
+                retry_delay = TOKEN_RETRY_MIN
+
+    def close(self):
+        """停止后台刷新线程，关闭连接池"""
+        self._closed.set()
+        self._transport.close()
+
+    def _build_service(self, creds):
+        """
+        构建 Calendar API 服务对象
+
+        使用 googleapiclient 随包附带的静态 discovery 文档，不在启动时联网下载；
+        请求通过共享的连接池发出，认证头由传输按当前凭证添加
+        """
+        self._transport.credentials = creds
+        client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+        return build('calendar', 'v3', http=self._transport, client_options=client_options,
+                     static_discovery=True)
+
+    def _http(self):
+        """
+        获取 HTTP 传输：所有线程共用一个线程安全的连接池
 
-        # 检查凭证是否需要刷新（提前5分钟刷新）
-        needs_refresh = False
-
-        if self.creds.expired:
-            needs_refresh = True
-        elif self.creds.expiry:
-            # 提前5分钟刷新
-            # 确保 expiry 是 timezone-aware 的
-            if self.creds.expiry.tzinfo is None:
-                # 如果 expiry 是 naive datetime，假设它是 UTC 时间
-                expiry_aware = self.creds.expiry.replace(tzinfo=timezone.utc)
+        凭证刷新后只替换传输使用的凭证引用，保留已建立的连接；
+        传输层不刷新令牌，401 由 _reauthenticate 统一处理
+        """
+        transport = self._transport
+        if transport.credentials is not self.creds:
+            transport.credentials = self.creds
+        return transport
+
+    def _execute(self, request):
+        """
+        通过共享的连接池执行 API 请求（启用 gzip 压缩响应）
+
+        请求经过断路器和令牌桶限流；限流（429、403 rateLimitExceeded）、服务端错误（5xx）
+        和网络错误按带抖动的指数退避重试，响应带 Retry-After 时按它等待。
+        重试用尽后计入断路器，断路器打开期间请求直接失败（CircuitOpenError），
+        调用方继续使用本地事件集或上次查询的结果。
+        """
+        # Google API 要求 User-Agent 中包含 gzip 才会压缩响应
+        request.headers['accept-encoding'] = 'gzip'
+        user_agent = request.headers.get('user-agent', '')
+        if 'gzip' not in user_agent:
+            request.headers['user-agent'] = f'{user_agent} (gzip)'.strip()
+        method = getattr(request, 'methodId', None) or 'unknown'
+
+        self.breaker.before_request()
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            with self._calls_lock:
+                self.api_calls += 1
+            CALENDAR_API_CALLS.labels(method).inc()
+            http = self._http()
+            # 本次请求携带的访问令牌：401 时据此判断其他线程是否已经换上了新令牌
+            sent_token = getattr(http.credentials, 'token', None)
+            try:
+                response = request.execute(http=http)
+            except Exception as error:
+                if isinstance(error, HttpError) and error.resp.status == 401:
+                    error.sent_token = sent_token
+                retryable, counts_as_failure, retry_after = self._classify_error(error)
+                status = error.resp.status if isinstance(error, HttpError) else type(error).__name__
+                attempt += 1
+                if (not retryable or attempt > self.max_retries
+                        or (retry_after or 0) > self.backoff_cap):
+                    if counts_as_failure:
+                        self.breaker.record_failure(retry_after)
+                    else:
+                        self.breaker.release()
+                    CALENDAR_CIRCUIT_OPEN.set(1 if self.breaker.is_open else 0)
+                    raise
+                delay = retry_after if retry_after is not None else backoff_delay(
+                    attempt, self.backoff_base, self.backoff_cap)
+                CALENDAR_API_RETRIES.labels(status).inc()
+                logger.warning('Calendar API 请求失败 (%s)，%.1f 秒后重试（第 %d/%d 次）',
+                               status, delay, attempt, self.max_retries)
+                time.sleep(delay)
             else:
-                expiry_aware = self.creds.expiry
-
-            time_until_expiry = expiry_aware - datetime.now(timezone.utc)
-            if time_until_expiry.total_seconds() < 300:  # 5分钟 = 300秒
-                needs_refresh = True
-
-        # 如果需要刷新
-        if needs_refresh:
-            if self.creds.refresh_token:
-                try:
-                    print('Token 即将过期，提前刷新...')
-                    self.creds.refresh(Request())
-                    # 保存刷新后的凭证
-                    with open('token.pickle', 'wb') as token:
-                        pickle.dump(self.creds, token)
-                    print('Token 刷新成功')
-                    # 重新构建 service 对象
-                    self.service = build('calendar', 'v3', credentials=self.creds)
-                except Exception as e:
-                    print(f'Token 刷新失败: {e}')
-                    print('需要重新授权...')
-                    # 删除无效的 token 文件
-                    if os.path.exists('token.pickle'):
-                        os.remove('token.pickle')
-                    # 重新认证
-                    self._authenticate()
+                self.breaker.record_success()
+                CALENDAR_CIRCUIT_OPEN.set(0)
+                return response
+
+    @staticmethod
+    def _classify_error(error):
+        """
+        判断 API 错误的类型
+
+        Returns:
+            (是否可以重试, 是否计入断路器, Retry-After 秒数或 None)
+        """
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            retry_after = parse_retry_after(error.resp.get('retry-after'))
+            if status in RETRYABLE_STATUSES:
+                return True, True, retry_after
+            if status == 403:
+                details = error.error_details if isinstance(error.error_details, list) else []
+                reasons = {str(detail.get('reason', '')).lower()
+                           for detail in details if isinstance(detail, dict)}
+                if reasons & RATE_LIMIT_REASONS:
+                    return True, True, retry_after
+                if reasons & QUOTA_REASONS:
+                    return False, True, retry_after
+            return False, False, None
+        if isinstance(error, TRANSIENT_ERRORS):
+            return True, True, None
+        return False, False, None
+
+    def _iter_pages(self, calendar_id, **params):
+        """
+        逐页查询事件列表
+
+        Args:
+            calendar_id: 日历 ID
+            **params: 传给 events().list 的其他参数
+
+        Yields:
+            每一页的响应（只包含 EVENT_FIELDS 中的字段），
+            最后一页包含 nextSyncToken
+        """
+        page_token = None
+        while True:
+            try:
+                page = self._execute(self.service.events().list(
+                    calendarId=calendar_id,
+                    maxResults=PAGE_SIZE,
+                    fields=self._event_fields,
+                    pageToken=page_token,
+                    **params
+                ))
+            except Exception as error:
+                status = error.resp.status if isinstance(error, HttpError) else type(error).__name__
+                CALENDAR_API_ERRORS.labels(calendar_id, status).inc()
+                raise
+            yield page
+
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    def iter_events(self, calendar_id, **params):
+        """
+        逐个返回事件，按需翻页
+
+        调用方可以流式处理事件而不必先构建完整列表，
+        也可以用 itertools.islice 在任意位置停止（不会再请求后续页面）。
+
+        Args:
+            calendar_id: 日历 ID
+            **params: 传给 events().list 的其他参数（timeMin、timeMax 等）
+
+        Yields:
+            事件对象
+        """
+        for page in self._iter_pages(calendar_id, **params):
+            yield from page.get('items', [])
+
+    def _reauthenticate(self, stale_token):
+        """
+        检测到 401 后刷新访问令牌（多个线程同时遇到时只刷新一次）
+
+        按被拒绝的请求实际携带的令牌判断：其他线程已经换上新令牌时直接重试，不再刷新。
+        不删除 token 文件、不在刷新任务中进入交互式授权
+
+        Args:
+            stale_token: 被拒绝的请求携带的访问令牌（_execute 记录在 HttpError.sent_token），
+                         None 时按当前令牌处理
+
+        Raises:
+            TransportError: 网络故障
+            AuthorizationError: 刷新令牌已失效，需要重新授权
+        """
+        logger.warning('检测到认证错误 (401)，刷新访问令牌后重试...')
+        self._refresh_credentials(stale_token=stale_token or self.creds.token)
+
+    def _run_concurrently(self, fn, calendar_ids, timeout=None):
+        """
+        在线程池中对每个日历并发执行 fn(calendar_id)
+
+        Returns:
+            (results, errors, pending)
+            results: {calendar_id: 返回值}
+            errors: {calendar_id: 异常}
+            pending: 超时仍未完成的日历 ID 列表
+        """
+        futures = {}
+        for calendar_id in calendar_ids:
+            # 上次超时的任务仍在运行时不重复提交，直接继续等待它
+            key = (fn.__name__, calendar_id)
+            future = self._in_flight.get(key)
+            if future is None or future.done():
+                future = self._executor.submit(fn, calendar_id)
+                self._in_flight[key] = future
+            futures[future] = calendar_id
+
+        done, not_done = wait(futures, timeout=timeout)
+
+        results, errors = {}, {}
+        for future in done:
+            calendar_id = futures[future]
+            error = future.exception()
+            if error is not None:
+                errors[calendar_id] = error
             else:
-                print('没有 refresh_token，需要重新授权...')
-                # 删除无效的 token 文件
-                if os.path.exists('token.pickle'):
-                    os.remove('token.pickle')
-                # 重新认证
-                self._authenticate()
+                results[calendar_id] = future.result()
+
+        pending = [futures[future] for future in not_done]
+        return results, errors, pending
 
-    def get_upcoming_events(self, time_min=None, time_max=None, max_results=10):
+    def get_upcoming_events(self, time_min=None, time_max=None, max_results=10, errors=None):
         """
         获取即将到来的日历事件
 
+        所有配置的日历并发查询，结果合并后按开始时间排序。
+        单个日历查询失败或超时不影响其他日历，该日历使用上次成功查询的结果。
+
         Args:
             time_min: 开始时间（datetime 对象），默认为当前时间
             time_max: 结束时间（datetime 对象），默认为 24 小时后
-            max_results: 最大返回结果数
+            max_results: 每个日历的最大返回结果数，None 表示不限制（自动翻页）
+            errors: 传入字典时记录查询失败的日历 {calendar_id: 异常}
 
         Returns:
-            事件列表
+            EventRecord 列表
         """
         # 在调用 API 前确保 token 有效
         self._ensure_valid_token()
 
-        try:
-            if time_min is None:
-                time_min = datetime.now(timezone.utc)
-            if time_max is None:
-                time_max = time_min + timedelta(hours=24)
-
-            # 将时间转换为 RFC3339 格式
-            # 如果时间已经是 timezone-aware 的，直接使用 isoformat()
-            # 如果是 naive 的，添加 'Z' 表示 UTC
-            if time_min.tzinfo is not None:
-                time_min_str = time_min.isoformat()
-            else:
-                time_min_str = time_min.isoformat() + 'Z'
+        if time_min is None:
+            time_min = datetime.now(timezone.utc)
+        if time_max is None:
+            time_max = time_min + timedelta(hours=24)
 
-            if time_max.tzinfo is not None:
-                time_max_str = time_max.isoformat()
-            else:
-                time_max_str = time_max.isoformat() + 'Z'
+        # 将时间转换为 RFC3339 格式
+        # 如果时间已经是 timezone-aware 的，直接使用 isoformat()
+        # 如果是 naive 的，添加 'Z' 表示 UTC
+        if time_min.tzinfo is not None:
+            time_min_str = time_min.isoformat()
+        else:
+            time_min_str = time_min.isoformat() + 'Z'
+
+        if time_max.tzinfo is not None:
+            time_max_str = time_max.isoformat()
+        else:
+            time_max_str = time_max.isoformat() + 'Z'
+
+        def list_calendar(calendar_id):
+            return self._list_events(calendar_id, time_min_str, time_max_str, max_results)
 
-            events_result = self.service.events().list(
-                calendarId='primary',
+        results, failed, pending = self._run_concurrently(
+            list_calendar, self.calendar_ids, timeout=self.fetch_timeout)
+        self._last_listed.update(results)
+        if errors is not None:
+            errors.update(failed)
+
+        for calendar_id, error in failed.items():
+            logger.error('获取日历 %s 的事件时发生错误: %s', calendar_id, error)
+        for calendar_id in pending:
+            logger.warning('获取日历 %s 的事件超时', calendar_id)
+        for calendar_id in [*failed, *pending]:
+            if calendar_id in self._last_listed:
+                logger.warning('日历 %s 本次使用上次查询的结果', calendar_id)
+                results[calendar_id] = self._last_listed[calendar_id]
+
+        return self._merge_events((calendar_id, results[calendar_id]) for calendar_id in self.calendar_ids
+                                  if calendar_id in results)
+
+    def _list_events(self, calendar_id, time_min_str, time_max_str, max_results):
+        """查询单个日历的事件（自动翻页）并转换为 EventRecord，遇到 401 时重新认证并重试一次"""
+        def list_all():
+            started = time.monotonic()
+            events = self.iter_events(
+                calendar_id,
                 timeMin=time_min_str,
                 timeMax=time_max_str,
-                maxResults=max_results,
                 singleEvents=True,
                 orderBy='startTime'
-            ).execute()
-
-            events = events_result.get('items', [])
+            )
+            events = [self._ingest(event, calendar_id)
+                      for event in itertools.islice(events, max_results)]
+            CALENDAR_FETCH_SECONDS.labels(calendar_id, 'list').observe(time.monotonic() - started)
             return events
 
+        try:
+            return list_all()
         except HttpError as error:
             # 如果是认证错误，尝试重新刷新一次 token 后重试
             if error.resp.status == 401:
-                print(f'检测到认证错误 (401)，尝试刷新 token 并重试...')
-                try:
-                    # 强制重新认证
-                    if os.path.exists('token.pickle'):
-                        os.remove('token.pickle')
-                    self._authenticate()
-
-                    # 重试一次 API 调用
-                    events_result = self.service.events().list(
-                        calendarId='primary',
-                        timeMin=time_min_str,
-                        timeMax=time_max_str,
-                        maxResults=max_results,
-                        singleEvents=True,
-                        orderBy='startTime'
-                    ).execute()
-
-                    events = events_result.get('items', [])
-                    return events
-                except Exception as retry_error:
-                    print(f'重新认证后仍然失败: {retry_error}')
-                    return []
+                self._reauthenticate(getattr(error, 'sent_token', None))
+                return list_all()
+            raise
+
+    def sync_events(self, time_max=None, calendar_ids=None):
+        """
+        增量同步所有日历的事件到本地事件集
+
+        每个日历首次调用（或查询窗口超出已同步范围）时做一次有界的全量同步
+        并保存 nextSyncToken，之后只拉取新增、修改或取消的事件。
+        同步令牌失效（410 Gone）时自动重新全量同步。
+
+        各日历在线程池中并发同步，最多等待 fetch_timeout 秒：
+        超时的日历继续在后台同步，本次先使用它上次同步的数据，
+        因此一个缓慢的日历不会拖慢其他日历的提醒。
+
+        Args:
+            time_max: 需要覆盖的时间上限（datetime 对象），默认为 1 小时后
+            calendar_ids: 只同步这些日历（例如收到推送通知的日历），默认同步全部
+
+        Returns:
+            同步失败的日历 {calendar_id: 异常}，全部成功时为空字典
+        """
+        # 在调用 API 前确保 token 有效
+        self._ensure_valid_token()
+
+        now = datetime.now(timezone.utc)
+        if time_max is None:
+            time_max = now + timedelta(hours=1)
+
+        def sync_calendar(calendar_id):
+            return self._sync_calendar(calendar_id, now, time_max)
+
+        _, errors, pending = self._run_concurrently(
+            sync_calendar, calendar_ids or self.calendar_ids, timeout=self.fetch_timeout)
+
+        for calendar_id, error in errors.items():
+            logger.error('同步日历 %s 失败: %s', calendar_id, error)
+        for calendar_id in pending:
+            logger.warning('同步日历 %s 超时，继续在后台同步，本次使用上次同步的数据', calendar_id)
+
+        return errors
+
+    def _sync_calendar(self, calendar_id, now, time_max):
+        """同步单个日历，处理 410 和 401"""
+        state = self._calendars[calendar_id]
+        try:
+            return self._sync_once(calendar_id, state, now, time_max)
+        except HttpError as error:
+            if error.resp.status == 410:
+                logger.warning('日历 %s 同步令牌已失效 (410 Gone)，重新全量同步...', calendar_id)
+                state.sync_token = None
+                return self._sync_once(calendar_id, state, now, time_max)
+            if error.resp.status == 401:
+                self._reauthenticate(getattr(error, 'sent_token', None))
+                return self._sync_once(calendar_id, state, now, time_max)
+            raise
+
+    def _sync_once(self, calendar_id, state, now, time_max):
+        """执行一次同步：需要时全量同步，否则增量同步"""
+        started = time.monotonic()
+        if (state.sync_token is None or state.synced_until is None
+                or time_max > state.synced_until):
+            mode, result = 'full', self._full_sync(calendar_id, state, now)
+        else:
+            mode, result = 'incremental', self._incremental_sync(calendar_id, state, now)
+        CALENDAR_FETCH_SECONDS.labels(calendar_id, mode).observe(time.monotonic() - started)
+        return result
+
+    def _full_sync(self, calendar_id, state, now):
+        """
+        全量同步 [now, now + SYNC_WINDOW] 范围内的事件
+
+        本地展开重复日程时同步 now 之后的全部主事件、例外和普通事件，不限制时间上限
+        """
+        if self.expand_recurrence:
+            synced_until = UNBOUNDED_SYNC
+            params = {'timeMin': now.isoformat(), 'singleEvents': False}
+        else:
+            synced_until = now + SYNC_WINDOW
+            params = {'timeMin': now.isoformat(), 'timeMax': synced_until.isoformat(),
+                      'singleEvents': True}
+        items = {}
+        sync_token = None
+
+        for page in self._iter_pages(calendar_id, **params):
+            for event in page.get('items', []):
+                if self._keep_item(event):
+                    items[event['id']] = event
+            sync_token = page.get('nextSyncToken')
+
+        records, recurring = {}, {}
+        for event in items.values():
+            self._store(calendar_id, records, recurring, event)
+
+        with state.lock:
+            state.events = records
+            state.recurring = recurring
+            state.sync_token = sync_token
+            state.synced_until = synced_until
+
+        self._write_cache(
+            'replace_calendar', calendar_id,
+            [self._cache_row(event) for event in items.values()],
+            sync_token, synced_until.timestamp())
+        logger.info('日历 %s 全量同步完成: %d 个事件', calendar_id, len(items))
+        return len(items)
+
+    def _incremental_sync(self, calendar_id, state, now):
+        """使用 syncToken 拉取自上次同步以来的变更"""
+        changes = []
+        sync_token = None
+
+        for page in self._iter_pages(
+                calendar_id,
+                syncToken=state.sync_token,
+                singleEvents=not self.expand_recurrence):
+            changes.extend(page.get('items', []))
+            sync_token = page.get('nextSyncToken')
+
+        upserts, deletes = [], []
+        with state.lock:
+            for event in changes:
+                if self._keep_item(event):
+                    self._store(calendar_id, state.events, state.recurring, event)
+                    upserts.append(event)
+                else:
+                    self._discard(state, event['id'])
+                    deletes.append(event['id'])
+                    if self.expand_recurrence:
+                        # 整个重复日程被删除：同时删除它的例外
+                        for exception_id in [event_id for event_id, item in state.recurring.items()
+                                             if item.get('recurringEventId') == event['id']]:
+                            self._discard(state, exception_id)
+                            deletes.append(exception_id)
+
+            # 移除已经结束的事件（和已经结束的重复日程），避免本地事件集无限增长
+            now_ts = now.timestamp()
+            for event_id, record in list(state.events.items()):
+                if record.end_ts <= now_ts:
+                    self._discard(state, event_id)
+                    deletes.append(event_id)
+            for event_id, event in list(state.recurring.items()):
+                if self._item_span(event, state)[1] <= now:
+                    self._discard(state, event_id)
+                    deletes.append(event_id)
+
+            state.sync_token = sync_token
+            synced_until = state.synced_until
+            kept = [event for event in upserts
+                    if event['id'] in state.events or event['id'] in state.recurring]
+
+        self._write_cache(
+            'apply_changes', calendar_id,
+            [self._cache_row(event) for event in kept],
+            deletes, sync_token, synced_until.timestamp())
+
+        if changes:
+            logger.info('日历 %s 增量同步完成: %d 个事件有变更', calendar_id, len(changes))
+        return len(changes)
+
+    def query_freebusy(self, time_min, time_max, calendar_ids=None):
+        """
+        查询日历在时间范围内的忙碌时段（freebusy.query）
+
+        一次请求即可覆盖所有日历，适合作为"是否有变化"的低成本探测：
+        忙碌时段没有变化时通常不需要完整同步。注意它只反映"忙碌"的事件，
+        标题修改和"空闲"状态的事件不会体现在结果中。
+
+        Args:
+            time_min: 开始时间（timezone-aware datetime）
+            time_max: 结束时间（timezone-aware datetime）
+            calendar_ids: 要查询的日历，默认为全部
+
+        Returns:
+            每个日历的忙碌时段 {calendar_id: ((start, end), ...)}；
+            某个日历查询出错时其值为 None
+        """
+        self._ensure_valid_token()
+
+        calendar_ids = calendar_ids or self.calendar_ids
+        body = {
+            'timeMin': time_min.isoformat(),
+            'timeMax': time_max.isoformat(),
+            'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+        }
+        try:
+            response = self._execute(self.service.freebusy().query(body=body))
+        except Exception as error:
+            status = error.resp.status if isinstance(error, HttpError) else type(error).__name__
+            CALENDAR_API_ERRORS.labels('freebusy', status).inc()
+            raise
+
+        calendars = response.get('calendars', {})
+        busy = {}
+        for calendar_id in calendar_ids:
+            result = calendars.get(calendar_id)
+            if result is None or result.get('errors'):
+                busy[calendar_id] = None
             else:
-                print(f'获取日历事件时发生错误: {error}')
-                return []
+                busy[calendar_id] = tuple((period['start'], period['end'])
+                                          for period in result.get('busy', []))
+        return busy
+
+    def watch_events(self, channel_id, address, token=None, ttl=None, calendar_id='primary'):
+        """
+        注册 events.watch 推送通道
+
+        Args:
+            channel_id: 通道 ID（UUID）
+            address: 接收通知的 HTTPS 回调地址
+            token: 通道校验令牌，会原样出现在通知的 X-Goog-Channel-Token 头中
+            ttl: 通道有效期（秒）
+            calendar_id: 要监听的日历 ID
+
+        Returns:
+            Channel 资源，包含 id、resourceId 和 expiration（毫秒时间戳）
+        """
+        self._ensure_valid_token()
+
+        body = {
+            'id': channel_id,
+            'type': 'web_hook',
+            'address': address,
+        }
+        if token:
+            body['token'] = token
+        if ttl:
+            body['params'] = {'ttl': str(int(ttl))}
+
+        return self._execute(self.service.events().watch(calendarId=calendar_id, body=body))
+
+    def stop_watch(self, channel_id, resource_id):
+        """
+        停止推送通道
+
+        Args:
+            channel_id: 通道 ID
+            resource_id: watch_events 返回的 resourceId
+        """
+        self._ensure_valid_token()
+        self._execute(self.service.channels().stop(
+            body={'id': channel_id, 'resourceId': resource_id}
+        ))
+
+    def get_synced_events(self, time_min, time_max):
+        """
+        从本地事件集中获取时间范围内的事件
+
+        与 events().list 的语义一致：返回在 [time_min, time_max) 内
+        有重叠的事件。所有日历的事件合并为一个按开始时间排序的列表，
+        同一事件出现在多个日历中时只保留一次。
+
+        Args:
+            time_min: 开始时间（timezone-aware datetime）
+            time_max: 结束时间（timezone-aware datetime）
+
+        Returns:
+            EventRecord 列表
+        """
+        min_ts, max_ts = time_min.timestamp(), time_max.timestamp()
+        per_calendar = []
+        for calendar_id in self.calendar_ids:
+            state = self._calendars[calendar_id]
+            with state.lock:
+                if self.expand_recurrence:
+                    candidates = self._expand_events(state, time_min, time_max)
+                else:
+                    candidates = list(state.events.values())
+
+            records = [record for record in candidates
+                       if record.start_ts < max_ts and record.end_ts > min_ts]
+            records.sort(key=_start_ts)
+            per_calendar.append((calendar_id, records))
+
+        return self._merge_events(per_calendar)
+
+    def _expansion(self, state, master):
+        """
+        主事件的展开结果（按 etag 缓存，主事件被修改后重新编译规则）
+
+        Returns:
+            RecurrenceExpansion，规则无法解析时为 None
+        """
+        expansion = state.expansions.get(master['id'], False)
+        if expansion is False or (expansion is not None and expansion.etag != master.get('etag')):
+            try:
+                expansion = RecurrenceExpansion(
+                    master, ingest=lambda event: self._ingest(event, state.calendar_id))
+            except RecurrenceError as e:
+                logger.warning('重复日程 %s 无法在本地展开，已跳过: %s',
+                               self.get_event_summary(master), e)
+                expansion = None
+            state.expansions[master['id']] = expansion
+        return expansion
+
+    def _expand_events(self, state, time_min, time_max):
+        """
+        本地展开：普通事件、被修改的例外和主事件在时间范围内的实例（调用方持有 state.lock）
+
+        被修改或取消的实例（例外）替代对应的展开实例；被移动的例外按它自己的时间出现
+        """
+        masters, overridden = [], set()
+        for event in state.recurring.values():
+            if event.get('recurrence'):
+                masters.append(event)
+            else:
+                overridden.add(instance_id(event['recurringEventId'], event['originalStartTime']))
+
+        records = list(state.events.values())
+        for master in masters:
+            expansion = self._expansion(state, master)
+            if expansion is not None:
+                records.extend(record for record in expansion.instances(time_min, time_max)
+                               if record.id not in overridden)
+
+        # 丢弃已删除的主事件的展开结果
+        for master_id in state.expansions.keys() - {master['id'] for master in masters}:
+            del state.expansions[master_id]
+        return records
+
+    def _merge_events(self, per_calendar):
+        """
+        将各日历已排序的事件列表归并为一个按开始时间排序的列表，并按事件 ID 去重
+
+        同一事件出现在多个日历中时保留日历列表中靠前的日历的记录
+
+        Args:
+            per_calendar: 可迭代的 (calendar_id, 已排序的 EventRecord 列表)
+        """
+        merged = []
+        seen = set()
+        for record in heapq.merge(*(records for _, records in per_calendar), key=_start_ts):
+            if record.id not in seen:
+                seen.add(record.id)
+                merged.append(record)
+        return merged
+
+    def get_event_calendar_id(self, record):
+        """
+        获取事件所属的日历 ID
+
+        Args:
+            record: EventRecord
+
+        Returns:
+            日历 ID
+        """
+        return record.calendar_id
+
+    @staticmethod
+    def _as_aware(dt):
+        """全天事件解析出的是 naive 时间，按本地时区处理以便比较"""
+        if dt.tzinfo is None:
+            return dt.astimezone()
+        return dt
 
     def get_event_start_time(self, event):
         """
@@ -269,6 +1168,24 @@ class GoogleCalendarClient:
             # 全天事件
             return datetime.fromisoformat(start)
 
+    def get_event_end_time(self, event):
+        """
+        获取事件的结束时间
+
+        Args:
+            event: Google Calendar 事件对象
+
+        Returns:
+            datetime 对象，表示事件结束时间
+        """
+        end = event.get('end') or event['start']
+        end = end.get('dateTime', end.get('date'))
+
+        if 'T' in end:
+            return datetime.fromisoformat(end.replace('Z', '+00:00'))
+        else:
+            return datetime.fromisoformat(end)
+
     def get_event_summary(self, event):
         """
         获取事件摘要（标题）
@@ -1,24 +1,92 @@
 """Home Assistant API 集成模块"""
-import requests
 import json
+import logging
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from log_setup import LazyJson
+from metrics import HA_CALL_ERRORS, HA_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# media_player 实体可用的播报服务，按探测顺序排列
+MEDIA_PLAYER_ROUTES = [
+    ('xiaomi_miot', 'intelligent_speaker'),
+    ('tts', 'baidu_say'),
+]
 
 
 class HomeAssistantClient:
     """Home Assistant 客户端"""
 
-    def __init__(self, base_url, access_token):
+    def __init__(self, base_url, access_token, pool_size=4, max_retries=2,
+                 backoff_factor=0.3, connect_timeout=3.05, read_timeout=10, session=None,
+                 route_cache_path=None, route_ttl=7 * 24 * 3600):
         """
         初始化 Home Assistant 客户端
 
         Args:
             base_url: Home Assistant 实例的 URL（例如：http://192.168.1.100:8123）
             access_token: Home Assistant 长期访问令牌
+            pool_size: 连接池大小（保持的长连接数）
+            max_retries: 连接失败时的最大重试次数
+            backoff_factor: 重试退避系数（第 n 次重试前等待 backoff_factor * 2^(n-1) 秒）
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应的超时时间（秒）
+            session: 共享的 requests.Session，None 表示创建新的连接池
+            route_cache_path: media_player 可用播报服务的缓存文件，None 表示不持久化
+            route_ttl: 缓存的播报服务有效期（秒），过期后重新探测
         """
         self.base_url = base_url.rstrip('/')
         self.headers = {
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json',
         }
+        # 连接超时和读取超时分开设置
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = session or self.create_session(pool_size, max_retries, backoff_factor)
+
+        # media_player 可用播报服务缓存：{entity_id: {'domain', 'service', 'verified_at'}}
+        self.route_cache_path = route_cache_path
+        self.route_ttl = route_ttl
+        self._routes = self._load_routes()
+        # discover_services() 查询到的可用服务，None 表示未查询
+        self.available_services = None
+
+    @staticmethod
+    def create_session(pool_size=4, max_retries=2, backoff_factor=0.3, pool_connections=1):
+        """
+        创建带连接池和重试策略的 Session
+
+        可以在多个客户端之间共享（例如多租户模式），认证头由各客户端在请求时传入；
+        pool_connections 为缓存的主机连接池数量，共享时应不少于 Home Assistant 实例数。
+
+        连接保持 keep-alive，后续请求复用已建立的 TCP/TLS 连接。
+        重试策略：
+        - 连接失败（请求尚未发出）时所有方法都会重试
+        - 502/503/504 和读取超时只对幂等方法（GET 等）重试，
+          避免 POST 服务调用被重复执行导致音箱重复播报
+        """
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_size,
+                              max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
 
     def call_service(self, domain, service, service_data=None):
         """
@@ -33,34 +101,37 @@ class HomeAssistantClient:
             响应对象
         """
         url = f'{self.base_url}/api/services/{domain}/{service}'
+        metric_label = f'{domain}.{service}'
 
-        print(f'      → 请求详情:')
-        print(f'        方法: POST')
-        print(f'        URL: {url}')
-        print(f'        请求体: {json.dumps(service_data or {}, ensure_ascii=False, indent=8)}')
+        # 请求/响应详情只在 DEBUG 级别输出，序列化推迟到真正输出时
+        logger.debug('→ POST %s 请求体: %s', url, LazyJson(service_data or {}))
 
+        started = time.monotonic()
         try:
-            response = requests.post(
+            response = self.session.post(
                 url,
                 headers=self.headers,
                 json=service_data or {},
-                timeout=10
+                timeout=self.timeout
             )
 
-            print(f'      ← 响应详情:')
-            print(f'        状态码: {response.status_code}')
-            print(f'        响应头: {dict(response.headers)}')
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('← %s %s 响应头: %s', response.status_code, url, dict(response.headers))
 
             response.raise_for_status()
 
             response_data = response.json()
-            print(f'        响应体: {json.dumps(response_data, ensure_ascii=False, indent=8)}')
+            logger.debug('← 响应体: %s', LazyJson(response_data))
 
+            HA_CALL_SECONDS.labels(metric_label).observe(time.monotonic() - started)
             return response_data
         except requests.exceptions.RequestException as e:
-            print(f'        ✗ 错误: {e}')
-            if hasattr(e, 'response') and e.response is not None:
-                print(f'        错误响应: {e.response.text}')
+            HA_CALL_SECONDS.labels(metric_label).observe(time.monotonic() - started)
+            HA_CALL_ERRORS.labels(metric_label).inc()
+            if getattr(e, 'response', None) is not None:
+                logger.warning('调用服务 %s.%s 失败: %s，错误响应: %s', domain, service, e, e.response.text)
+            else:
+                logger.warning('调用服务 %s.%s 失败: %s', domain, service, e)
             return None
 
     def xiaomi_speaker_say(self, entity_id, message):
@@ -82,7 +153,7 @@ class HomeAssistantClient:
         """
         # 方式 1: 使用 Home Assistant Script（最推荐）
         if entity_id.startswith('script.'):
-            print(f'      使用 Home Assistant Script: {entity_id}')
+            logger.debug('使用 Home Assistant Script: %s', entity_id)
 
             # 调用 script.turn_on 服务，传递 entity_id 和 msg 参数
             service_data = {
@@ -96,13 +167,10 @@ class HomeAssistantClient:
             # 构造的 API 路径: /api/services/script/turn_on
             result = self.call_service('script', 'turn_on', service_data)
 
-            if result is not None:
-                print(f'      ✓ Script 调用成功')
-            else:
-                print(f'      ✗ Script 调用失败，请检查：')
-                print(f'        1. Script 是否存在: {entity_id}')
-                print(f'        2. 在 HA 开发者工具 -> 服务 中测试该 script')
-                print(f'        3. Script 配置中的字段名是否为 "msg"')
+            if result is None:
+                logger.error('Script 调用失败，请检查：1. Script 是否存在: %s；'
+                             '2. 在 HA 开发者工具 -> 服务 中测试该 script；'
+                             '3. Script 配置中的字段名是否为 "msg"', entity_id)
 
             return result
 
@@ -110,7 +178,7 @@ class HomeAssistantClient:
         if entity_id.startswith('notify.'):
             # 保持完整的 entity_id（包括 'notify.' 前缀）
             service_name = entity_id
-            print(f'      使用小米官方 notify 服务: {service_name}')
+            logger.debug('使用小米官方 notify 服务: %s', service_name)
 
             service_data = {
                 'message': message
@@ -120,38 +188,137 @@ class HomeAssistantClient:
             # 构造的 API 路径: /api/services/notify/{service_name}
             result = self.call_service('notify', service_name, service_data)
 
-            if result is not None:
-                print(f'      ✓ notify 服务调用成功')
-            else:
-                print(f'      ✗ notify 服务调用失败，请检查：')
-                print(f'        1. 服务名称是否正确: {entity_id}')
-                print(f'        2. 小米官方集成是否已配置')
-                print(f'        3. 在 HA 开发者工具 -> 服务 中测试该服务')
+            if result is None:
+                logger.error('notify 服务调用失败，请检查：1. 服务名称是否正确: %s；'
+                             '2. 小米官方集成是否已配置；'
+                             '3. 在 HA 开发者工具 -> 服务 中测试该服务', entity_id)
 
             return result
 
         # 方式 3: 使用 media_player 实体（传统方式）
-        print(f'      使用传统 media_player 方式')
+        logger.debug('使用传统 media_player 方式')
+        return self._media_player_say(entity_id, message)
+
+    def _media_player_say(self, entity_id, message):
+        """
+        通过 media_player 实体播报
+
+        依次尝试 MEDIA_PLAYER_ROUTES 中的服务，记住第一个可用的服务，
+        之后直接使用它，只有调用失败或缓存过期后才重新探测
+        """
+        failed_route = None
+        route = self._get_cached_route(entity_id)
+        if route is not None:
+            domain, service = route
+            logger.debug('使用已缓存的服务 %s.%s', domain, service)
+            result = self.call_service(domain, service, self._route_data(route, entity_id, message))
+            if result is not None:
+                return result
+            logger.warning('已缓存的服务 %s.%s 调用失败，重新探测...', domain, service)
+            self._forget_route(entity_id)
+            failed_route = route
+
+        for route in MEDIA_PLAYER_ROUTES:
+            domain, service = route
+            if route == failed_route:
+                # 刚刚失败过，本次不再重复调用
+                continue
+            if self.available_services is not None and route not in self.available_services:
+                logger.debug('跳过 %s.%s（Home Assistant 中不存在该服务）', domain, service)
+                continue
+
+            logger.info('尝试 %s.%s 服务...', domain, service)
+            result = self.call_service(domain, service, self._route_data(route, entity_id, message))
+            if result is not None:
+                self._remember_route(entity_id, route)
+                return result
 
-        # 方法 1: 使用 xiaomi_miot 集成的 intelligent_speaker 服务
-        print(f'      尝试 xiaomi_miot.intelligent_speaker 服务...')
-        service_data = {
+        return None
+
+    @staticmethod
+    def _route_data(route, entity_id, message):
+        """构造各服务需要的服务数据"""
+        # xiaomi_miot.intelligent_speaker 使用 text 字段，其他 TTS 服务使用 message 字段
+        text_field = 'text' if route == ('xiaomi_miot', 'intelligent_speaker') else 'message'
+        return {
             'entity_id': entity_id,
-            'text': message
+            text_field: message
         }
 
-        result = self.call_service('xiaomi_miot', 'intelligent_speaker', service_data)
+    def _get_cached_route(self, entity_id):
+        """获取未过期的已缓存服务"""
+        cached = self._routes.get(entity_id)
+        if cached is None:
+            return None
+        if time.time() - cached['verified_at'] > self.route_ttl:
+            logger.info('已缓存的服务已过期，重新探测...')
+            self._forget_route(entity_id)
+            return None
+        return cached['domain'], cached['service']
+
+    def _remember_route(self, entity_id, route):
+        """记住可用的服务并持久化"""
+        domain, service = route
+        self._routes[entity_id] = {
+            'domain': domain,
+            'service': service,
+            'verified_at': time.time(),
+        }
+        logger.info('已记住 %s 的可用服务: %s.%s', entity_id, domain, service)
+        self._save_routes()
+
+    def _forget_route(self, entity_id):
+        """删除已缓存的服务"""
+        if self._routes.pop(entity_id, None) is not None:
+            self._save_routes()
+
+    def _load_routes(self):
+        """从文件加载已缓存的服务"""
+        if not self.route_cache_path or not os.path.exists(self.route_cache_path):
+            return {}
+        try:
+            with open(self.route_cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning('加载音箱服务缓存失败: %s', e)
+            return {}
+
+    def _save_routes(self):
+        """保存已缓存的服务到文件（先写临时文件再替换，保证原子性）"""
+        if not self.route_cache_path:
+            return
+        try:
+            tmp_path = f'{self.route_cache_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._routes, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.route_cache_path)
+        except Exception as e:
+            logger.warning('保存音箱服务缓存失败: %s', e)
+
+    def discover_services(self):
+        """
+        查询 Home Assistant 中可用的服务（/api/services）
 
-        if result is None:
-            # 方法 2: 如果上面的方法失败，尝试使用通用 TTS 服务
-            print('      尝试备用 TTS 方法 (tts.baidu_say)...')
-            service_data = {
-                'entity_id': entity_id,
-                'message': message
-            }
-            result = self.call_service('tts', 'baidu_say', service_data)
+        查询成功后，探测播报服务时会跳过不存在的服务
+
+        Returns:
+            可用服务的集合 {(domain, service), ...}，失败时返回 None
+        """
+        url = f'{self.base_url}/api/services'
 
-        return result
+        try:
+            response = self.session.get(url, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+            self.available_services = {
+                (domain['domain'], service)
+                for domain in response.json()
+                for service in domain.get('services', {})
+            }
+            logger.info('已获取 Home Assistant 服务列表: %d 个服务', len(self.available_services))
+            return self.available_services
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.warning('获取服务列表失败: %s', e)
+            return None
 
     def test_connection(self):
         """
@@ -163,12 +330,12 @@ class HomeAssistantClient:
         url = f'{self.base_url}/api/'
 
         try:
-            response = requests.get(url, headers=self.headers, timeout=5)
+            response = self.session.get(url, headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
-            print('成功连接到 Home Assistant!')
+            logger.info('成功连接到 Home Assistant!')
             return True
         except requests.exceptions.RequestException as e:
-            print(f'连接 Home Assistant 失败: {e}')
+            logger.error('连接 Home Assistant 失败: %s', e)
             return False
 
     def get_entity_state(self, entity_id):
@@ -184,9 +351,9 @@ class HomeAssistantClient:
         url = f'{self.base_url}/api/states/{entity_id}'
 
         try:
-            response = requests.get(url, headers=self.headers, timeout=5)
+            response = self.session.get(url, headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f'获取实体状态失败: {e}')
+            logger.warning('获取实体状态失败: %s', e)
             return None
@@ -0,0 +1,95 @@
+"""Google API 的 HTTP 传输 - 基于 requests 连接池的线程安全授权会话"""
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+
+# 传输层的临时错误（连接失败、超时、响应中途断开）
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+
+def create_session(pool_size=4, pool_connections=1):
+    """
+    创建 Google API 使用的连接池
+
+    连接保持 keep-alive，后续请求复用已建立的 TCP/TLS 连接；不带认证信息，
+    可以在多个客户端之间共享（例如多租户模式下所有租户访问同一个 googleapis.com）。
+    传输层不重试，重试由调用方按错误类型决定（见 GoogleCalendarClient._execute）。
+
+    Args:
+        pool_size: 每个主机保持的最大连接数，应不少于同时发请求的线程数
+        pool_connections: 缓存的主机连接池数量
+
+    Returns:
+        requests.Session
+    """
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_size,
+                          max_retries=0)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class AuthorizedSessionHttp:
+    """
+    供 googleapiclient 使用的授权 HTTP 传输（与 httplib2.Http.request 接口兼容）
+
+    底层是 requests.Session：urllib3 连接池是线程安全的，并发抓取多个日历的线程
+    共用同一个实例和已建立的连接；连接超时和读取超时分开设置。
+    每个请求按当前凭证添加 Authorization 头，传输层不刷新令牌（由调用方统一刷新），
+    令牌刷新后替换 credentials 属性即可，不需要重建连接。
+    """
+
+    def __init__(self, credentials=None, session=None, connect_timeout=3.05, read_timeout=10,
+                 pool_size=4):
+        """
+        初始化传输
+
+        Args:
+            credentials: google-auth 凭证对象
+            session: 共享的 requests.Session（见 create_session），None 表示创建自己的连接池
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应的超时时间（秒）
+            pool_size: 自己创建连接池时保持的最大连接数
+        """
+        self.credentials = credentials
+        self.timeout = (connect_timeout, read_timeout)
+        self._owns_session = session is None
+        self.session = session or create_session(pool_size)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        """
+        发送请求
+
+        Args:
+            uri: 请求地址
+            method: HTTP 方法
+            body: 请求体
+            headers: 请求头
+            redirections: 最多跟随的重定向次数（0 表示不跟随）
+            connection_type: 与 httplib2 接口兼容，不使用
+
+        Returns:
+            (httplib2.Response, 响应内容 bytes)
+        """
+        headers = dict(headers or {})
+        if self.credentials is not None:
+            self.credentials.apply(headers)
+        response = self.session.request(method, uri, data=body, headers=headers,
+                                        timeout=self.timeout, allow_redirects=redirections > 0)
+
+        info = dict(response.headers)
+        info['status'] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        # requests 已经解压了 gzip 响应，与 httplib2 一样去掉 content-encoding
+        if 'content-encoding' in resp:
+            resp['-content-encoding'] = resp.pop('content-encoding')
+        return resp, response.content
+
+    def close(self):
+        """关闭自己创建的连接池（共享的连接池由创建者关闭）"""
+        if self._owns_session:
+            self.session.close()
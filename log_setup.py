@@ -0,0 +1,190 @@
+"""日志配置模块 - 分级、结构化、非阻塞的日志输出"""
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+from datetime import datetime
+
+# 文本格式
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# LogRecord 自带的属性；其余属性（通过 extra= 传入）作为结构化字段输出
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    JSON 格式：每条日志一行，便于 jq / 日志系统检索
+
+    通过 logger.info(..., extra={'event_id': ...}) 传入的字段原样输出
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    只在调用线程里完成参数插值，格式化和写文件都交给后台线程
+
+    标准库的 QueueHandler.prepare() 会在调用线程里完整格式化一遍消息，
+    这里只做必要的插值（参数对象之后可能被修改）和异常文本化。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _gzip_namer(name):
+    return f'{name}.gz'
+
+
+def _gzip_rotator(source, dest):
+    """轮转时把旧日志压缩为 .gz"""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def parse_levels(spec):
+    """
+    解析按模块设置的日志级别
+
+    Args:
+        spec: 例如 'home_assistant=DEBUG,google_calendar_cli=WARNING'
+
+    Returns:
+        {logger 名称: 级别}
+    """
+    levels = {}
+    for item in (spec or '').split(','):
+        name, sep, level = item.partition('=')
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level='INFO', fmt='text', log_file=None, max_bytes=10 * 1024 * 1024,
+                  backup_count=5, console=True, levels=None):
+    """
+    配置根日志
+
+    所有日志先放入内存队列，由后台线程统一格式化并写入控制台和文件，
+    业务线程不会被磁盘 I/O 阻塞。日志文件按大小轮转，旧文件压缩为 .gz。
+
+    Args:
+        level: 日志级别（DEBUG / INFO / WARNING / ERROR）
+        fmt: 输出格式，'text' 或 'json'
+        log_file: 日志文件路径，None 表示只输出到控制台
+        max_bytes: 单个日志文件的最大字节数，超过后轮转
+        backup_count: 保留的压缩日志数量
+        console: 是否输出到标准输出
+        levels: 按模块设置的日志级别 {logger 名称: 级别}
+
+    Returns:
+        QueueListener 实例（进程退出时自动停止）
+    """
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
+
+    handlers = []
+    if console or not log_file:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        file_handler.namer = _gzip_namer
+        file_handler.rotator = _gzip_rotator
+        handlers.append(file_handler)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    for name, module_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    # 第三方库的调试日志过于冗长，除非单独指定，否则只输出警告
+    for name in ('googleapiclient', 'urllib3', 'google_auth_httplib2'):
+        if name not in (levels or {}):
+            logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+
+def _stop_listener(listener):
+    """进程退出时写完队列中剩余的日志（已手动停止时跳过）"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def setup_logging_from_env():
+    """
+    按环境变量配置日志
+
+    LOG_LEVEL / LOG_FORMAT / LOG_FILE / LOG_MAX_BYTES / LOG_BACKUP_COUNT /
+    LOG_CONSOLE / LOG_LEVELS，说明见 .env.example
+    """
+    return setup_logging(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        fmt=os.getenv('LOG_FORMAT', 'text').lower(),
+        log_file=os.getenv('LOG_FILE') or None,
+        max_bytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+        console=os.getenv('LOG_CONSOLE', 'true').lower() == 'true',
+        levels=parse_levels(os.getenv('LOG_LEVELS'))
+    )
+
+
+class LazyJson:
+    """
+    延迟序列化：只有日志真正输出时才调用 json.dumps
+
+    用法：logger.debug('响应体: %s', LazyJson(data))
+    """
+
+    __slots__ = ('data', 'indent')
+
+    def __init__(self, data, indent=None):
+        self.data = data
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.data, ensure_ascii=False, indent=self.indent, default=str)
@@ -4,8 +4,10 @@ import re
 import time
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from google_calendar import GoogleCalendarClient
+from googleapiclient.errors import HttpError
+from google_calendar import TRANSIENT_ERRORS, GoogleCalendarClient, is_transient_error
 from home_assistant import HomeAssistantClient
+from log_setup import setup_logging_from_env
 
 # 加载环境变量
 load_dotenv()
@@ -43,6 +45,9 @@ class CalendarReminderApp:
         # 检查间隔（秒）
         self.check_interval = int(os.getenv('CHECK_INTERVAL', '60'))
 
+        # 增量同步：只在首次全量同步，之后通过 syncToken 拉取变更
+        self.incremental_sync = os.getenv('INCREMENTAL_SYNC', 'true').lower() == 'true'
+
     def parse_extra_reminder_time(self, event_summary):
         """
         从事件标题中解析额外的提醒时间
@@ -140,11 +145,23 @@ class CalendarReminderApp:
         print(f'\n[{check_time}] 查询 Google Calendar...')
         print(f'  查询时间范围: {now.strftime("%Y-%m-%d %H:%M")} ~ {time_max.strftime("%Y-%m-%d %H:%M")} (UTC)')
 
-        events = self.calendar_client.get_upcoming_events(
-            time_min=now,
-            time_max=time_max,
-            max_results=50
-        )
+        if self.incremental_sync:
+            # 同步变更后从本地维护的事件集中读取
+            try:
+                self.calendar_client.sync_events(time_max=time_max)
+            except (HttpError,) + TRANSIENT_ERRORS as e:
+                # 只有网络故障和服务端临时错误才继续使用本地事件集，
+                # 认证、权限等错误交给主循环报告，不能静默地一直使用旧数据
+                if not is_transient_error(e):
+                    raise
+                print(f'  ✗ 同步失败，使用本地事件集: {e}')
+            events = self.calendar_client.get_synced_events(now, time_max)
+        else:
+            events = self.calendar_client.get_upcoming_events(
+                time_min=now,
+                time_max=time_max,
+                max_results=None
+            )
 
         if not events:
             print(f'  未找到即将到来的日程')
@@ -211,6 +228,7 @@ class CalendarReminderApp:
         print(f'消息模板：{self.message_template}')
         print(f'  可用占位符：{{event_name}} {{minutes}}')
         print(f'检查间隔：每 {self.check_interval} 秒')
+        print(f'同步模式：{"增量同步 (syncToken)" if self.incremental_sync else "全量查询"}')
         print(f'小米音箱实体 ID: {self.speaker_entity_id}')
         print('-' * 50)
 
@@ -235,6 +253,8 @@ class CalendarReminderApp:
 
 def main():
     """主函数"""
+    setup_logging_from_env()
+
     # 检查必要的环境变量
     required_vars = ['HA_BASE_URL', 'HA_ACCESS_TOKEN', 'XIAOMI_SPEAKER_ENTITY_ID']
     missing_vars = [var for var in required_vars if not os.getenv(var)]
@@ -1,113 +1,323 @@
 """CLI 环境下的日历提醒主程序"""
+import logging
 import os
-import re
+import threading
 import time
-import json
 from datetime import datetime, timedelta, timezone
+from startup_profile import STARTUP, import_breakdown
 from dotenv import load_dotenv
 from google_calendar_cli import GoogleCalendarClient
 from home_assistant import HomeAssistantClient
+from scheduler import ReminderScheduler
+from calendar_watch import WatchReceiver, WatchChannelManager
+from event_cache import EventCache
+from announcer import AnnouncementDispatcher
+from clock import SYSTEM_CLOCK
+from refresh_policy import RefreshPolicy
+from resilience import CircuitBreaker, TokenBucket
+from reminder_plan import (MAX_REMINDER_MINUTES, ReminderPlanner, ReminderRules, clean_event_name,
+                           parse_calendar_minutes, parse_minutes)
+from state_store import ReminderStateStore
+from log_setup import setup_logging_from_env
+from metrics import (MetricsServer, MAIN_LOOP_SECONDS, POLL_EVENTS, POLLS,
+                     REMINDER_LAG_SECONDS, REMINDERS)
+
+STARTUP.mark('导入模块')
 
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class CalendarReminderApp:
     """日历提醒应用"""
 
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, calendar_client=None, ha_client=None, clock=SYSTEM_CLOCK,
+                 config=None, fetch_executor=None, ha_session=None, rate_limiter=None,
+                 calendar_session=None, wakeup=None, refresh_wakeup=None):
         """
         初始化应用
 
         Args:
             headless: 是否为 CLI 无浏览器环境
+            calendar_client: 使用已创建的 GoogleCalendarClient（例如连接模拟服务的客户端），
+                             None 表示按环境变量创建
+            ha_client: 使用已创建的 HomeAssistantClient，None 表示按环境变量创建
+            clock: 时钟对象，所有读取当前时间的地方都通过它，重放模拟时使用虚拟时钟
+            config: 覆盖环境变量的配置 {变量名: 值}（例如多租户模式下每个租户的配置），
+                    未覆盖的变量仍从环境变量读取
+            fetch_executor: 共享的日历抓取线程池，None 表示客户端自己创建
+            ha_session: 共享的 Home Assistant 连接池（requests.Session），None 表示客户端自己创建
+            rate_limiter: 共享的 Google API 限流令牌桶，None 表示按 CALENDAR_RATE_LIMIT 创建
+            calendar_session: 共享的 Google API 连接池（requests.Session），None 表示客户端自己创建
+            wakeup: 共享的提醒调度唤醒事件，None 表示使用自己的事件
+            refresh_wakeup: 共享的日历刷新唤醒事件，None 表示使用自己的事件
         """
+        self.clock = clock
+        self.config = dict(config or {})
+
         # 初始化 Google Calendar 客户端
-        self.calendar_client = GoogleCalendarClient(
-            credentials_path=os.getenv('GOOGLE_CREDENTIALS_PATH', 'credentials.json'),
-            headless=headless
+        # GOOGLE_CALENDAR_IDS 为逗号分隔的日历 ID 列表，各日历并发抓取
+        calendar_ids = [
+            calendar_id.strip()
+            for calendar_id in self._getenv('GOOGLE_CALENDAR_IDS', 'primary').split(',')
+            if calendar_id.strip()
+        ]
+        # 增量同步：只在首次全量同步，之后通过 syncToken 拉取变更
+        self.incremental_sync = self._getenv('INCREMENTAL_SYNC', 'true').lower() == 'true'
+        # 重复日程展开方式：server 由服务端逐个返回实例，local 只同步主事件和例外并在本地展开（需要增量同步）
+        self.expand_recurrence = (self.incremental_sync
+                                  and self._getenv('RECURRENCE_EXPANSION', 'server').lower() == 'local')
+
+        # 提醒规则：默认提醒时间点（分钟）和按日历设置的默认时间点，标题标记 [10] / [30,10,2]
+        # 见 ReminderRules；同步时即为每个事件算好提醒时间点
+        self.reminder_rules = ReminderRules(
+            default_minutes=parse_minutes(self._getenv('REMINDER_DEFAULT_MINUTES', '5,1')) or (5, 1),
+            calendar_minutes=parse_calendar_minutes(self._getenv('REMINDER_CALENDAR_MINUTES'))
         )
 
+        if calendar_client is None:
+            # 本地事件缓存：持久化同步结果，重启后无需联网即可开始提醒
+            cache_path = self._getenv('EVENT_CACHE_PATH', 'event_cache.db')
+            event_cache = EventCache(cache_path) if self.incremental_sync and cache_path else None
+
+            # 请求保护：令牌桶限流，限流/服务端错误按指数退避重试，连续失败后断路
+            if rate_limiter is None:
+                rate = float(self._getenv('CALENDAR_RATE_LIMIT', '5'))
+                if rate > 0:
+                    rate_limiter = TokenBucket(rate, int(self._getenv('CALENDAR_RATE_BURST', '10')))
+            breaker = CircuitBreaker(
+                'Google Calendar',
+                failure_threshold=int(self._getenv('CALENDAR_BREAKER_THRESHOLD', '5')),
+                cooldown=float(self._getenv('CALENDAR_BREAKER_COOLDOWN', '30'))
+            )
+
+            calendar_client = GoogleCalendarClient(
+                credentials_path=self._getenv('GOOGLE_CREDENTIALS_PATH', 'credentials.json'),
+                token_path=self._getenv('GOOGLE_TOKEN_PATH', 'token.pickle'),
+                headless=headless,
+                calendar_ids=calendar_ids,
+                max_workers=int(self._getenv('CALENDAR_FETCH_WORKERS', '4')),
+                fetch_timeout=float(self._getenv('CALENDAR_FETCH_TIMEOUT', '15')),
+                connect_timeout=float(self._getenv('CALENDAR_CONNECT_TIMEOUT', '3.05')),
+                read_timeout=float(self._getenv('CALENDAR_READ_TIMEOUT', '10')),
+                session=calendar_session,
+                expand_recurrence=self.expand_recurrence,
+                reminder_rules=self.reminder_rules,
+                cache=event_cache,
+                executor=fetch_executor,
+                rate_limiter=rate_limiter,
+                max_retries=int(self._getenv('CALENDAR_MAX_RETRIES', '3')),
+                backoff_base=float(self._getenv('CALENDAR_BACKOFF_BASE', '1')),
+                backoff_cap=float(self._getenv('CALENDAR_BACKOFF_MAX', '30')),
+                breaker=breaker,
+                refresh_margin=int(self._getenv('TOKEN_REFRESH_MARGIN', '900'))
+            )
+        else:
+            # 外部创建的客户端（基准测试、重放）同样按应用的提醒规则计算提醒时间点
+            calendar_client.use_reminder_rules(self.reminder_rules)
+        self.calendar_client = calendar_client
+        STARTUP.mark('日历客户端（缓存、凭证）')
+
         # 初始化 Home Assistant 客户端
-        self.ha_client = HomeAssistantClient(
-            base_url=os.getenv('HA_BASE_URL'),
-            access_token=os.getenv('HA_ACCESS_TOKEN')
-        )
+        if ha_client is None:
+            ha_client = HomeAssistantClient(
+                base_url=self._getenv('HA_BASE_URL'),
+                access_token=self._getenv('HA_ACCESS_TOKEN'),
+                pool_size=int(self._getenv('HA_POOL_SIZE', '4')),
+                max_retries=int(self._getenv('HA_MAX_RETRIES', '2')),
+                connect_timeout=float(self._getenv('HA_CONNECT_TIMEOUT', '3.05')),
+                read_timeout=float(self._getenv('HA_READ_TIMEOUT', '10')),
+                route_cache_path=self._getenv('SPEAKER_ROUTE_CACHE_PATH', 'speaker_routes.json') or None,
+                route_ttl=int(self._getenv('SPEAKER_ROUTE_TTL', str(7 * 24 * 3600))),
+                session=ha_session
+            )
+        self.ha_client = ha_client
+        STARTUP.mark('Home Assistant 客户端')
+        # 启动时查询 HA 的服务列表，直接选择可用的播报服务
+        self.discover_services = self._getenv('HA_DISCOVER_SERVICES', 'false').lower() == 'true'
 
         # 小米音箱实体 ID
-        self.speaker_entity_id = os.getenv('XIAOMI_SPEAKER_ENTITY_ID')
+        self.speaker_entity_id = self._getenv('XIAOMI_SPEAKER_ENTITY_ID')
+
+        # 播报调度器：在独立线程中调用 Home Assistant，提醒评估不会被阻塞
+        self.dispatcher = AnnouncementDispatcher(
+            self.ha_client, self.speaker_entity_id, clock=self.clock)
+        # 播报失败后的重试间隔（秒）和最大尝试次数
+        self.reminder_retry_delay = int(self._getenv('REMINDER_RETRY_DELAY', '10'))
+        self.reminder_max_attempts = int(self._getenv('REMINDER_MAX_ATTEMPTS', '3'))
 
         # 消息模板：支持 {event_name} 和 {minutes} 占位符
-        self.message_template = os.getenv(
+        self.message_template = self._getenv(
             'REMINDER_MESSAGE_TEMPLATE',
             '提醒：{event_name} 将在 {minutes} 分钟后开始'
         )
 
-        # 检查间隔（秒）
-        self.check_interval = int(os.getenv('CHECK_INTERVAL', '60'))
+        # 合并提醒：同一时间窗口内到期的多个提醒合并为一条消息播报
+        # 合并窗口（秒，默认 0）：窗口内稍后到期的提醒会被提前一并播报，
+        # 默认只合并同时到期的提醒，提醒不会早于截止时间播报
+        self.coalesce_window = float(self._getenv('REMINDER_COALESCE_SECONDS', '0'))
+        # 合并消息模板：支持 {count} 和 {event_list} 占位符
+        self.list_message_template = self._getenv(
+            'REMINDER_LIST_MESSAGE_TEMPLATE',
+            '提醒：{count} 个日程即将开始，{event_list}'
+        )
+        # 合并消息中每个日程的模板：支持 {event_name} 和 {minutes} 占位符
+        self.list_item_template = self._getenv(
+            'REMINDER_LIST_ITEM_TEMPLATE',
+            '{event_name} 将在 {minutes} 分钟后开始'
+        )
+        self.list_item_separator = self._getenv('REMINDER_LIST_SEPARATOR', '；')
 
-        # 健康检查：连续失败次数
+        # 提醒计划：按事件预先渲染的播报消息，事件的名称和提醒时间点不变时直接使用缓存
+        self.planner = ReminderPlanner(
+            message_template=self.message_template,
+            list_item_template=self.list_item_template,
+            rules=self.reminder_rules
+        )
+
+        # 检查间隔（秒）
+        self.check_interval = int(self._getenv('CHECK_INTERVAL', '60'))
+
+        # 提醒补发宽限期（秒）：主循环卡顿或服务重启后，超过触发时间不久的提醒仍会补发
+        self.reminder_grace = int(self._getenv('REMINDER_GRACE_SECONDS', '60'))
+
+        # 推送通知模式：注册 events.watch 通道，日历变更时立即同步
+        # 开启后轮询只作为低频兜底
+        self.watch_enabled = self._getenv('WATCH_ENABLED', 'false').lower() == 'true'
+        self.watch_receiver = None
+        # 每个日历一个推送通道
+        self.watch_managers = []
+
+        # 日历刷新策略：推送模式下使用固定的兜底轮询间隔；
+        # 否则近期没有提醒时最长 REFRESH_MAX_INTERVAL 秒刷新一次，提醒临近时逐步加密到 CHECK_INTERVAL
+        if self.watch_enabled:
+            min_interval = max_interval = int(self._getenv('WATCH_POLL_INTERVAL', '900'))
+        else:
+            min_interval = self.check_interval
+            max_interval = int(self._getenv('REFRESH_MAX_INTERVAL') or min_interval)
+        self.refresh_policy = RefreshPolicy(
+            min_interval=min_interval,
+            max_interval=max_interval,
+            daily_budget=int(self._getenv('CALENDAR_DAILY_API_BUDGET') or 0),
+            clock=self.clock
+        )
+        # 最长刷新间隔（秒）：每次查询的时间窗口需要覆盖到下次刷新
+        self.refresh_interval = self.refresh_policy.max_interval
+
+        # freebusy 探测：定时刷新时先用一次 freebusy.query 检查所有日历的忙碌时段，
+        # 没有变化时跳过完整同步；距上次完整同步超过 FREEBUSY_RESYNC_INTERVAL 秒时仍然完整同步
+        self.freebusy_probe = self._getenv('FREEBUSY_PROBE', 'false').lower() == 'true'
+        self.freebusy_resync_interval = max(
+            int(self._getenv('FREEBUSY_RESYNC_INTERVAL', '3600')), self.refresh_interval)
+        # 每次查询在最大提醒提前量之外还要覆盖到下次完整同步（秒）
+        self.query_horizon = (self.freebusy_resync_interval if self.freebusy_probe
+                              else self.refresh_interval)
+        # 上次完整同步时的探测窗口和结果
+        self._probe_window = None
+        self._probe_busy = None
+        self._last_full_refresh = None
+
+        # 指标端点（Prometheus 文本格式）：设置 METRICS_PORT 后开启，默认只监听本机
+        self.metrics_port = self._getenv('METRICS_PORT')
+        self.metrics_host = self._getenv('METRICS_HOST', '127.0.0.1')
+        self.metrics_server = None
+
+        # 健康检查：连续失败次数和第一次失败的时间（单调时钟）
         self.consecutive_failures = 0
-        # 失败通知阈值（次数）：半小时 = 1800秒 / check_interval
-        self.failure_threshold = int(1800 / self.check_interval)
+        self.failing_since = None
+        # 连续失败超过该时长（秒）后发送警报：半小时
+        # 刷新间隔不固定，按持续时间而不是失败次数判断
+        self.failure_alert_seconds = 1800
         # 上次发送故障通知的时间
         self.last_alert_time = None
         # 故障通知间隔（秒），避免重复通知
         self.alert_interval = 3600  # 1小时通知一次
 
         # 健康检查通知时间段（避免打扰休息）
-        self.alert_start_hour = int(os.getenv('HEALTH_ALERT_START_HOUR', '17'))
-        self.alert_end_hour = int(os.getenv('HEALTH_ALERT_END_HOUR', '21'))
+        self.alert_start_hour = int(self._getenv('HEALTH_ALERT_START_HOUR', '17'))
+        self.alert_end_hour = int(self._getenv('HEALTH_ALERT_END_HOUR', '21'))
 
-        # 持久化文件路径
-        self.state_file = 'reminded_events.json'
+        # 冷启动目标（秒）：从进程启动到第一次日历检查完成超过该时间时输出警告，0 表示不检查
+        self.startup_target = float(self._getenv('STARTUP_TARGET_SECONDS', '5'))
+
+        # 持久化：快照文件 + 追加日志，每次提醒只追加一行
+        self.state_file = self._getenv('STATE_FILE', 'reminded_events.json')
+        self.state_store = ReminderStateStore(
+            snapshot_path=self.state_file,
+            compact_every=int(self._getenv('STATE_COMPACT_EVERY', '200'))
+        )
 
         # 已提醒的事件：{event_id: {提醒时间点的集合}}
         # 例如：{'event123': {5, 1}} 表示已经在5分钟和1分钟前提醒过
+        # 与 state_store.state 是同一个对象，只通过 state_store 修改
         self.reminded_events = {}
         self._load_state()
+        STARTUP.mark('加载提醒状态')
+
+        # 提醒调度器：按每个提醒的绝对触发时间调度
+        self.scheduler = ReminderScheduler(clock=self.clock, wakeup=wakeup)
+        # 播报失败、等待重试的提醒：{(event_id, 提醒分钟数): (下一次的尝试次数, 重试时间, 事件开始时间)}
+        # 刷新重建调度表时沿用，避免重试被提前触发或尝试次数被重置
+        self._pending_retries = {}
+        # 保护 reminded_events 与调度表，避免刷新任务和主循环交错导致重复提醒
+        self._lock = threading.RLock()
+        # 唤醒日历刷新任务
+        self._refresh_wakeup = refresh_wakeup or threading.Event()
+        # 收到推送通知、等待定向同步的日历 ID；None 表示需要同步全部日历
+        self._pending_calendars = set()
+        # 调用 stop() 后主循环和刷新任务退出
+        self._stopped = threading.Event()
+
+    def _getenv(self, name, default=None):
+        """读取配置：优先使用 config 中的值，否则读取环境变量"""
+        value = self.config.get(name)
+        if value is None:
+            return os.getenv(name, default)
+        return str(value)
 
     def _load_state(self):
-        """从文件加载已提醒事件的状态"""
+        """从快照和追加日志加载已提醒事件的状态"""
         try:
-            if os.path.exists(self.state_file):
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # 将列表转换回集合
-                    self.reminded_events = {
-                        event_id: set(times)
-                        for event_id, times in data.items()
-                    }
-                print(f'已加载 {len(self.reminded_events)} 个事件的提醒记录')
+            self.reminded_events = self.state_store.load(now=self.clock.time())
+            logger.info('已加载 %d 个事件的提醒记录', len(self.reminded_events))
         except Exception as e:
-            print(f'加载状态文件失败: {e}')
-            self.reminded_events = {}
+            logger.error('加载状态文件失败: %s', e)
+            self.reminded_events = self.state_store.state = {}
 
-    def _save_state(self):
-        """保存已提醒事件的状态到文件"""
+    def _mark_reminded(self, event_id, reminder_time, end_ts=None):
+        """标记已在该时间点提醒，并追加写入日志；事件结束后该记录会被清理"""
         try:
-            # 将集合转换为列表以便 JSON 序列化
-            data = {
-                event_id: list(times)
-                for event_id, times in self.reminded_events.items()
-            }
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self.state_store.add(event_id, reminder_time, expires_at=end_ts)
+        except Exception as e:
+            logger.error('保存状态文件失败: %s', e)
+
+    def _update_reminded_expiry(self, event_id, end_ts):
+        """更新事件提醒记录的过期时间"""
+        try:
+            self.state_store.set_expiry(event_id, end_ts)
+        except Exception as e:
+            logger.error('保存状态文件失败: %s', e)
+
+    def _unmark_reminded(self, event_id, reminder_time):
+        """撤销该时间点的提醒标记"""
+        try:
+            self.state_store.discard(event_id, reminder_time)
         except Exception as e:
-            print(f'保存状态文件失败: {e}')
+            logger.error('保存状态文件失败: %s', e)
 
     def send_health_alert(self):
         """发送健康检查失败通知"""
-        now = datetime.now()
+        now = self.clock.now()
 
         # 检查当前时间是否在通知时间段内
         current_hour = now.hour
         if not (self.alert_start_hour <= current_hour < self.alert_end_hour):
-            print(f'\n[{now.strftime("%Y-%m-%d %H:%M:%S")}] 健康检查失败')
-            print(f'  连续失败次数: {self.consecutive_failures}')
-            print(f'  当前时间 {current_hour}:00 不在通知时间段内 ({self.alert_start_hour}:00-{self.alert_end_hour}:00)')
-            print(f'  跳过语音通知，避免打扰休息')
-            print('-' * 60)
+            logger.warning('健康检查失败（连续失败 %d 次），当前时间 %d:00 不在通知时间段内 '
+                           '(%d:00-%d:00)，跳过语音通知，避免打扰休息',
+                           self.consecutive_failures, current_hour,
+                           self.alert_start_hour, self.alert_end_hour)
             return  # 不在时间段内，不发送通知
 
         # 检查是否需要发送通知（避免过于频繁）
@@ -116,54 +326,44 @@ class CalendarReminderApp:
             if elapsed < self.alert_interval:
                 return  # 还未到下次通知时间
 
-        message = f'警告：日历提醒服务已连续 {int(self.consecutive_failures * self.check_interval / 60)} 分钟无法查询 Google 日历，请检查网络连接和服务状态！'
+        failing_minutes = int((self.clock.monotonic() - self.failing_since) / 60)
+        message = f'警告：日历提醒服务已连续 {failing_minutes} 分钟无法查询 Google 日历，请检查网络连接和服务状态！'
 
-        print(f'\n[{now.strftime("%Y-%m-%d %H:%M:%S")}] 发送健康检查警报')
-        print(f'  连续失败次数: {self.consecutive_failures}')
-        print(f'  消息内容: {message}')
+        logger.warning('发送健康检查警报（连续失败 %d 次）: %s', self.consecutive_failures, message)
 
-        result = self.ha_client.xiaomi_speaker_say(
-            entity_id=self.speaker_entity_id,
-            message=message
-        )
+        # 先记录通知时间，避免播报完成前重复提交；播报失败时在回调中恢复
+        previous_alert_time = self.last_alert_time
+        self.last_alert_time = now
 
-        if result:
-            print(f'  ✓ 警报发送成功!')
-            self.last_alert_time = now
-        else:
-            print(f'  ✗ 警报发送失败!')
-        print('-' * 60)
+        def on_done(announcement, result):
+            if announcement.ok:
+                logger.info('警报发送成功 (耗时 %.2f 秒)', announcement.latency)
+            else:
+                logger.error('警报发送失败')
+                self.last_alert_time = previous_alert_time
 
-    def parse_extra_reminder_time(self, event_summary):
-        """
-        从事件标题中解析额外的提醒时间
+        self.dispatcher.submit(message, on_done=on_done)
 
-        Args:
-            event_summary: 事件标题
+    def _record_fetch_failure(self, error):
+        """记录一次日历查询失败，达到阈值时发送警报"""
+        now = self.clock.monotonic()
+        if self.consecutive_failures == 0:
+            self.failing_since = now
+        self.consecutive_failures += 1
+        logger.error('查询失败: %s（连续失败 %d 次，持续 %d 秒）',
+                     error, self.consecutive_failures, now - self.failing_since)
 
-        Returns:
-            额外的提醒分钟数，如果没有标记则返回 0
+        # 持续失败超过阈值，发送警报
+        if now - self.failing_since >= self.failure_alert_seconds:
+            self.send_health_alert()
 
-        Examples:
-            "会议 [10]" -> 10
-            "普通会议" -> 0
-            "重要会议 [30]" -> 30
-        """
-        # 匹配 [数字] 格式，数字范围 1-60
-        match = re.search(r'\[(\d+)\]', event_summary)
-        if match:
-            extra_minutes = int(match.group(1))
-            # 限制在 1-60 分钟范围内
-            if 1 <= extra_minutes <= 60:
-                return extra_minutes
-        return 0
-
-    def get_reminder_times(self, event_summary):
+    def get_reminder_times(self, event_summary, calendar_id=None):
         """
         获取该事件的所有提醒时间点
 
         Args:
             event_summary: 事件标题
+            calendar_id: 事件所属的日历（用于按日历设置的默认时间点）
 
         Returns:
             提醒时间点列表（分钟），按从大到小排序
@@ -171,171 +371,638 @@ class CalendarReminderApp:
         Examples:
             "普通会议" -> [5, 1]
             "远程会议 [10]" -> [15, 11]  (5+10, 1+10)
+            "面试 [30,10,2]" -> [30, 10, 2]
         """
-        extra_time = self.parse_extra_reminder_time(event_summary)
+        return list(self.planner.compile(event_summary, calendar_id).offsets)
 
-        if extra_time > 0:
-            # 有额外标记：两次提醒都加上额外时间
-            # (5 + extra_time) 分钟前、(1 + extra_time) 分钟前
-            return [5 + extra_time, 1 + extra_time]
-        else:
-            # 普通日程：5 分钟前、1 分钟前
-            return [5, 1]
-
-    def send_reminder(self, event_summary, minutes_until):
-        """发送提醒"""
-        # 使用模板格式化消息
-        # 移除标题中的 [数字] 标记，只保留纯净的事件名称
-        clean_event_name = re.sub(r'\s*\[\d+\]\s*', ' ', event_summary).strip()
-
-        message = self.message_template.format(
-            event_name=clean_event_name,
-            minutes=minutes_until
-        )
+    def send_reminder(self, event_summary, minutes_until, on_done=None, context=None, message=None):
+        """
+        发送提醒
 
-        print(f'\n[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] 发送提醒')
-        print(f'  事件: {event_summary}')
-        print(f'  倒计时: {minutes_until} 分钟')
-        print(f'  消息内容: {message}')
+        消息放入播报队列后立即返回，由播报线程调用 Home Assistant
 
-        print(f'  调用 Home Assistant API...')
-        print(f'  - 实体/服务: {self.speaker_entity_id}')
+        Args:
+            event_summary: 事件摘要
+            minutes_until: 距离事件开始还有多少分钟
+            on_done: 播报完成后的回调，参数为 (announcement, result)
+            context: 原样传给回调的数据
+            message: 已渲染好的消息（来自提醒计划），None 表示按模板格式化
+        """
+        if message is None:
+            message = self.message_template.format(
+                event_name=clean_event_name(event_summary),
+                minutes=minutes_until
+            )
 
-        result = self.ha_client.xiaomi_speaker_say(
-            entity_id=self.speaker_entity_id,
-            message=message
-        )
+        logger.info('发送提醒: %s（%d 分钟后开始）', event_summary, minutes_until,
+                    extra={'event_summary': event_summary, 'minutes': minutes_until})
+        logger.debug('消息内容: %s，实体/服务: %s', message, self.speaker_entity_id)
+
+        return self.dispatcher.submit(message, on_done=on_done, context=context)
+
+    def send_reminders(self, reminders):
+        """
+        发送一批同时到期的提醒
+
+        多个提醒合并为一条消息，只调用一次 Home Assistant，
+        避免多条播报互相打断或排队
+
+        Args:
+            reminders: 提醒列表（调度表中的 payload）
+        """
+        now = self.clock.time()
+        items = [
+            (reminder, max(round((reminder['start_ts'] - now) / 60), 0))
+            for reminder in reminders
+        ]
+
+        # 消息使用提醒计划中预先渲染好的内容
+        if len(items) == 1:
+            reminder, minutes_until = items[0]
+            return self.send_reminder(
+                reminder['event_summary'], minutes_until,
+                on_done=self._on_reminder_done, context=reminders,
+                message=reminder['plan'].message(minutes_until))
+
+        event_list = self.list_item_separator.join(
+            reminder['plan'].list_item(minutes_until) for reminder, minutes_until in items)
+        message = self.list_message_template.format(count=len(items), event_list=event_list)
+
+        logger.info('发送合并提醒（%d 个日程）: %s', len(items),
+                    '，'.join(f'{reminder["event_summary"]}（{minutes_until} 分钟后）'
+                             for reminder, minutes_until in items))
+        logger.debug('消息内容: %s，实体/服务: %s', message, self.speaker_entity_id)
+
+        return self.dispatcher.submit(message, on_done=self._on_reminder_done, context=reminders)
+
+    def _on_reminder_done(self, announcement, result):
+        """
+        播报完成回调：把结果和耗时报告给提醒状态
+
+        播报失败时撤销该提醒时间点的标记，在有效期内稍后重试；
+        超过最大尝试次数后放弃，保留标记
+        """
+        for reminder in announcement.context:
+            self._report_reminder(reminder, announcement)
+
+    def _report_reminder(self, reminder, announcement):
+        """报告单个提醒的播报结果"""
+        event_id = reminder['event_id']
+        reminder_time = reminder['reminder_time']
+
+        REMINDERS.labels('ok' if announcement.ok else 'failed').inc()
+        if announcement.ok:
+            with self._lock:
+                self._pending_retries.pop((event_id, reminder_time), None)
+            # 播报开始时间与计划触发时间之差（合并播报中提前发送的提醒为负值）
+            fire_at = reminder['start_ts'] - reminder_time * 60
+            REMINDER_LAG_SECONDS.observe(announcement.started_at - fire_at)
+            logger.info('提醒发送成功: %s (%d 分钟) 排队 %.2f 秒，播报耗时 %.2f 秒',
+                        reminder['event_summary'], reminder_time,
+                        announcement.queue_delay, announcement.latency,
+                        extra={'event_id': event_id, 'reminder_time': reminder_time})
+            return
 
-        if result:
-            print(f'  ✓ 提醒发送成功!')
-            print(f'  响应内容: {result}')
+        logger.error('提醒发送失败: %s (%d 分钟) 耗时 %.2f 秒',
+                     reminder['event_summary'], reminder_time, announcement.latency,
+                     extra={'event_id': event_id, 'reminder_time': reminder_time})
+
+        retry_at = self.clock.time() + self.reminder_retry_delay
+        attempts = reminder.get('attempts', 1)
+        key = (event_id, reminder_time)
+        if attempts >= self.reminder_max_attempts or retry_at >= reminder['expires_at']:
+            # 放弃重试，保留标记，避免下次刷新时再次播报
+            with self._lock:
+                self._pending_retries.pop(key, None)
+            return
+
+        with self._lock:
+            self._unmark_reminded(event_id, reminder_time)
+
+            logger.info('将在 %d 秒后重试（第 %d 次）', self.reminder_retry_delay, attempts + 1)
+            self._pending_retries[key] = (attempts + 1, retry_at, reminder['start_ts'])
+            retry = dict(reminder, attempts=attempts + 1)
+            self.scheduler.add(key, retry_at, retry)
+
+    def check_events(self, calendar_ids=None):
+        """
+        检查即将到来的事件
+
+        Args:
+            calendar_ids: 只同步这些日历（推送通知触发的定向同步），默认同步全部
+
+        Returns:
+            是否所有日历都查询成功
+        """
+        now = self.clock.now(timezone.utc)
+
+        # 获取未来一段时间内的事件：覆盖最大提醒提前量和到下次完整同步的时间
+        horizon = self.query_horizon
+        if not self.incremental_sync:
+            # 全量查询模式没有本地事件集，直到下次刷新都只有这次查询到的日程：
+            # 预算限制让下次刷新更晚时，查询窗口也要覆盖到那时
+            horizon = max(horizon, self.refresh_policy.longest_interval())
+        time_max = now + timedelta(minutes=MAX_REMINDER_MINUTES, seconds=horizon)
+
+        logger.debug('查询 Google Calendar: %s ~ %s (UTC)', now, time_max)
+
+        errors = {}
+        try:
+            if self.incremental_sync:
+                # 同步变更后从本地维护的事件集中读取
+                errors = self.calendar_client.sync_events(
+                    time_max=time_max, calendar_ids=calendar_ids)
+                events = self.calendar_client.get_synced_events(now, time_max)
+            else:
+                events = self.calendar_client.get_upcoming_events(
+                    time_min=now,
+                    time_max=time_max,
+                    max_results=None,
+                    errors=errors
+                )
+        except Exception as e:
+            POLLS.labels('error').inc()
+            self._record_fetch_failure(e)
+            ok = False
+            if not self.incremental_sync:
+                return False  # 本次检查结束
+            # 同步失败时继续基于本地（缓存）事件集提醒
+            logger.warning('使用本地缓存的日程继续提醒')
+            events = self.calendar_client.get_synced_events(now, time_max)
         else:
-            print(f'  ✗ 提醒发送失败!')
-        print('-' * 60)
+            POLLS.labels('partial' if errors else 'ok').inc()
+            ok = not errors
+            if errors:
+                # 部分日历同步失败：其他日历照常提醒，失败的日历使用上次同步的数据
+                self._record_fetch_failure(
+                    '; '.join(f'{calendar_id}: {error}' for calendar_id, error in errors.items()))
+            else:
+                # 查询成功，重置失败计数
+                if self.consecutive_failures > 0:
+                    logger.info('日历查询恢复正常（之前连续失败 %d 次）', self.consecutive_failures)
+                self.consecutive_failures = 0
+                self.failing_since = None
 
-    def check_events(self):
-        """检查即将到来的事件"""
-        now = datetime.now(timezone.utc)
-        check_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        POLL_EVENTS.set(len(events))
 
-        # 获取未来 1 小时内的事件（确保能覆盖所有提醒时间）
-        time_max = now + timedelta(hours=1)
+        self._schedule_events(events)
 
-        print(f'\n[{check_time}] 查询 Google Calendar...')
-        print(f'  查询时间范围: {now.strftime("%Y-%m-%d %H:%M")} ~ {time_max.strftime("%Y-%m-%d %H:%M")} (UTC)')
+        # 清理已结束事件的提醒记录，仍在进行或即将开始的事件保留去重状态
+        with self._lock:
+            evicted = self.state_store.evict_expired(self.clock.time())
+        if evicted:
+            logger.info('已清理 %d 个已结束事件的提醒记录', evicted)
+        return ok
 
+    def refresh(self, calendar_ids=None, force=False):
+        """
+        按刷新策略刷新一次日历
+
+        定时刷新还没到期（或当天的 API 预算已用完）时不调用 API，只用本地事件集重建调度表；
+        开启 freebusy 探测时，忙碌时段没有变化也跳过完整同步。
+
+        Args:
+            calendar_ids: 只同步这些日历（推送通知触发的定向同步），默认同步全部
+            force: 立即刷新（收到推送通知时），不等待刷新到期、不做 freebusy 探测
+        """
+        policy = self.refresh_policy
+        periodic = calendar_ids is None
+        if periodic and not force and not policy.poll_due():
+            self._schedule_local_events()
+            return
+
+        calls_before = self.calendar_client.api_calls
         try:
-            events = self.calendar_client.get_upcoming_events(
-                time_min=now,
-                time_max=time_max,
-                max_results=50
-            )
+            if policy.budget_exhausted():
+                self._schedule_local_events()
+            elif not periodic:
+                self.check_events(calendar_ids=calendar_ids)
+            elif self.freebusy_probe and not force and self._probe_unchanged():
+                POLLS.labels('unchanged').inc()
+                self._schedule_local_events()
+            else:
+                if self.freebusy_probe:
+                    self._probe_baseline()
+                ok = self.check_events()
+                self._last_full_refresh = self.clock.monotonic() if ok else None
+        finally:
+            policy.record_calls(self.calendar_client.api_calls - calls_before)
+            if periodic:
+                policy.schedule(self.scheduler.next_deadline())
+
+    def next_refresh_delay(self):
+        """距下次调用 refresh() 的秒数（收到推送通知时会被提前唤醒）"""
+        return self.refresh_policy.wait_timeout()
+
+    def _probe_unchanged(self):
+        """
+        freebusy 探测：上次完整同步之后各日历的忙碌时段是否没有变化
 
-            # 查询成功，重置失败计数
-            if self.consecutive_failures > 0:
-                print(f'  ✓ 日历查询恢复正常（之前连续失败 {self.consecutive_failures} 次）')
-            self.consecutive_failures = 0
+        探测窗口固定为上次完整同步时的查询窗口（结果会按窗口截断，随当前时间滑动的窗口
+        会被误判为有变化）；距上次完整同步超过 freebusy_resync_interval 时不再探测，直接完整同步。
 
+        Returns:
+            True 表示可以跳过本次完整同步
+        """
+        if (self._probe_busy is None or self._last_full_refresh is None
+                or self.clock.monotonic() - self._last_full_refresh >= self.freebusy_resync_interval):
+            return False
+        try:
+            busy = self.calendar_client.query_freebusy(*self._probe_window)
         except Exception as e:
-            # 查询失败
-            self.consecutive_failures += 1
-            print(f'  ✗ 查询失败: {e}')
-            print(f'  连续失败次数: {self.consecutive_failures}/{self.failure_threshold}')
+            logger.warning('freebusy 探测失败: %s，执行完整同步', e)
+            return False
+        if busy != self._probe_busy or None in busy.values():
+            logger.debug('freebusy 探测：忙碌时段有变化，执行完整同步')
+            return False
+        logger.debug('freebusy 探测：忙碌时段没有变化，跳过完整同步')
+        return True
+
+    def _probe_baseline(self):
+        """完整同步前记录本次查询窗口的忙碌时段，作为之后探测的比较基准"""
+        now = self.clock.now(timezone.utc)
+        window = (now, now + timedelta(minutes=MAX_REMINDER_MINUTES, seconds=self.query_horizon))
+        try:
+            self._probe_busy = self.calendar_client.query_freebusy(*window)
+            self._probe_window = window
+        except Exception as e:
+            logger.warning('freebusy 探测失败: %s', e)
+            self._probe_busy = None
+
+    def _schedule_local_events(self):
+        """不调用 API，用本地事件集重建调度表，让调度表的时间窗口随当前时间向前滚动"""
+        if not self.incremental_sync:
+            # 全量查询模式没有本地事件集，上次查询的窗口已覆盖到下次刷新（见 check_events）
+            return
+        now = self.clock.now(timezone.utc)
+        time_max = now + timedelta(minutes=MAX_REMINDER_MINUTES, seconds=self.query_horizon)
+        self._schedule_events(self.calendar_client.get_synced_events(now, time_max))
+
+    def warm_start(self):
+        """
+        基于本地缓存的事件立即调度提醒
 
-            # 达到阈值，发送警报
-            if self.consecutive_failures >= self.failure_threshold:
-                self.send_health_alert()
+        启动时调用，不需要任何网络请求；之后由后台刷新任务更新
+        """
+        if not self.incremental_sync:
+            return
 
-            return  # 本次检查结束
+        now = self.clock.now(timezone.utc)
+        time_max = now + timedelta(minutes=MAX_REMINDER_MINUTES, seconds=self.query_horizon)
+        events = self.calendar_client.get_synced_events(now, time_max)
+        if events:
+            logger.info('使用缓存数据预热调度表')
+            self._schedule_events(events)
+
+    def _schedule_events(self, events):
+        """
+        根据事件列表重建提醒调度表
 
+        Args:
+            events: EventRecord 列表（时间、名称和提醒时间点在同步时已经算好）
+        """
         if not events:
-            print(f'  未找到即将到来的日程')
+            logger.debug('未找到即将到来的日程')
+            # 清空调度表，避免已删除的日程仍然被提醒
+            with self._lock:
+                self.scheduler.replace([])
+                self._pending_retries = {}
             return
 
-        print(f'  查询到 {len(events)} 个日程:')
+        # 每个日程的详情只在 DEBUG 级别输出，稳定轮询时不做格式化
+        verbose = logger.isEnabledFor(logging.DEBUG)
+
+        reminders = []
+        with self._lock:
+            for idx, record in enumerate(events, 1):
+                # 提醒计划（预先渲染的消息），事件未变化时直接使用缓存
+                plan = self.planner.plan(record)
+
+                reminded_at = self.reminded_events.get(record.id, set())
+                if reminded_at:
+                    # 事件可能被改期，提醒记录保留到最新的结束时间
+                    self._update_reminded_expiry(record.id, record.end_ts)
+
+                if verbose:
+                    if reminded_at:
+                        status = f'已提醒: {sorted(reminded_at, reverse=True)}分钟前'
+                    else:
+                        minutes_until = (record.start_ts - self.clock.time()) / 60
+                        status = f'{int(minutes_until)}分钟后'
+                    logger.debug('[%d] %s 开始时间: %s 提醒时间点: %s 分钟前 状态: %s',
+                                 idx, record.summary,
+                                 datetime.fromtimestamp(record.start_ts).strftime('%Y-%m-%d %H:%M:%S'),
+                                 list(plan.offsets), status)
+
+                reminders.extend(self._build_reminders(record, plan, reminded_at))
+
+            # 整体替换调度表，主循环会被唤醒并睡眠到新的最近截止时间
+            self.scheduler.replace(reminders)
+
+            # 已过期或事件已不在查询结果中的提醒不再重试
+            if self._pending_retries:
+                scheduled = {key for key, _, _ in reminders}
+                self._pending_retries = {key: retry for key, retry in self._pending_retries.items()
+                                         if key in scheduled}
+
+            # 清理已不在查询结果中的事件的计划缓存
+            if len(self.planner) > 2 * len(events):
+                self.planner.retain(record.id for record in events)
+
+        logger.debug('查询到 %d 个日程，待触发的提醒 %d 个', len(events), len(reminders))
+
+    def _build_reminders(self, record, plan, reminded_at):
+        """
+        计算事件每个提醒时间点的绝对触发时间
+
+        每个提醒的有效期从触发时间开始，持续 reminder_grace 秒，但不会超过
+        下一个（更晚的）提醒时间点，最后一个提醒不会超过事件开始时间。
+        这样主循环卡顿后醒来仍能补发过期的提醒，又不会重复播报。
+        播报失败、等待重试的提醒沿用重试时间和尝试次数。
 
-        for idx, event in enumerate(events, 1):
-            event_id = event['id']
-            start_time = self.calendar_client.get_event_start_time(event)
-            event_summary = self.calendar_client.get_event_summary(event)
+        Returns:
+            [(key, fire_at, payload), ...]，可直接传给 ReminderScheduler.replace()
+        """
+        now = self.clock.time()
+        start_ts = record.start_ts
+        reminder_times = plan.offsets
+        reminders = []
+
+        for i, reminder_time in enumerate(reminder_times):
+            if reminder_time in reminded_at:
+                continue
+
+            fire_at = start_ts - reminder_time * 60
+            next_time = reminder_times[i + 1] if i + 1 < len(reminder_times) else 0
+            expires_at = min(fire_at + self.reminder_grace, start_ts - next_time * 60)
+            if now >= expires_at:
+                continue
+
+            attempts = 1
+            retry = self._pending_retries.get((record.id, reminder_time))
+            # 事件改期后按新的时间重新开始
+            if retry is not None and retry[2] == start_ts:
+                attempts, fire_at, _ = retry
+
+            payload = {
+                'event_id': record.id,
+                'event_summary': record.summary,
+                'start_ts': start_ts,
+                'end_ts': record.end_ts,
+                'reminder_time': reminder_time,
+                'expires_at': expires_at,
+                'attempts': attempts,
+                'plan': plan,
+            }
+            reminders.append(((record.id, reminder_time), fire_at, payload))
 
-            # 计算距离事件开始的时间
-            time_until_event = start_time - datetime.now(start_time.tzinfo)
-            minutes_until = time_until_event.total_seconds() / 60
+        return reminders
 
-            # 获取该事件的所有提醒时间点
-            reminder_times = self.get_reminder_times(event_summary)
-            extra_time = self.parse_extra_reminder_time(event_summary)
+    def fire_due_reminders(self):
+        """
+        发送所有已到期的提醒（包括因卡顿而过期但仍在有效期内的提醒）
 
-            # 初始化该事件的提醒记录
-            if event_id not in self.reminded_events:
-                self.reminded_events[event_id] = set()
+        coalesce_window 秒内即将到期的提醒会被提前一并发送，合并为一条播报
 
-            # 构建状态显示
-            reminded_at = self.reminded_events[event_id]
-            if reminded_at:
-                status = f'已提醒: {sorted(reminded_at, reverse=True)}分钟前'
+        Returns:
+            提交的 Announcement，没有需要发送的提醒时返回 None
+        """
+        with self._lock:
+            # 合并窗口内即将到期的提醒一并取出，合并为一条播报
+            due = self.scheduler.pop_due(lookahead=self.coalesce_window)
+            to_send = []
+            for _, reminder in due:
+                event_id = reminder['event_id']
+                reminder_time = reminder['reminder_time']
+                now = self.clock.time()
+
+                if reminder_time in self.reminded_events.get(event_id, set()):
+                    continue
+                if now >= reminder['expires_at']:
+                    logger.warning('已错过 %s 的 %d 分钟提醒', reminder['event_summary'], reminder_time)
+                    continue
+
+                # 标记已在该时间点提醒，并追加写入日志
+                self._mark_reminded(event_id, reminder_time, reminder['end_ts'])
+                to_send.append(reminder)
+
+        # 同一批到期的提醒合并为一条消息，只放入播报队列，不等待 Home Assistant 响应
+        if not to_send:
+            return None
+        announcement = self.send_reminders(to_send)
+        for reminder in to_send:
+            logger.debug('已标记 %s 的 %d 分钟提醒', reminder['event_summary'], reminder['reminder_time'])
+        return announcement
+
+    def request_refresh(self, calendar_id=None):
+        """
+        请求立即刷新日历
+
+        Args:
+            calendar_id: 只同步该日历，默认同步全部日历
+        """
+        with self._lock:
+            if calendar_id is None or self._pending_calendars is None:
+                self._pending_calendars = None
             else:
-                status = f'{int(minutes_until)}分钟后'
-
-            # 显示事件信息
-            extra_info = f' [+{extra_time}分钟]' if extra_time > 0 else ''
-            print(f'  [{idx}] {event_summary}{extra_info}')
-            print(f'      开始时间: {start_time.strftime("%Y-%m-%d %H:%M:%S")}')
-            print(f'      提醒时间点: {reminder_times} 分钟前')
-            print(f'      状态: {status}')
-
-            # 检查是否需要在任何时间点提醒
-            for reminder_time in reminder_times:
-                # 如果还没在这个时间点提醒过
-                if reminder_time not in reminded_at:
-                    # 检查是否到达该提醒时间点
-                    # 只在接近提醒时间点时触发（容差范围：提醒时间点前后0.5分钟）
-                    # 这样可以避免因为检查间隔错过提醒，同时防止重复提醒
-                    if reminder_time - 0.5 <= minutes_until <= reminder_time + 0.5:
-                        # 发送提醒
-                        self.send_reminder(event_summary, int(minutes_until))
-                        # 标记已在该时间点提醒
-                        self.reminded_events[event_id].add(reminder_time)
-                        # 保存状态到文件
-                        self._save_state()
-                        print(f'      ✓ 已标记 {reminder_time} 分钟提醒')
-
-        # 清理过期的事件记录（超过 100 个）
-        if len(self.reminded_events) > 100:
-            print(f'  清理过期提醒记录...')
-            self.reminded_events.clear()
-            self._save_state()
+                self._pending_calendars.add(calendar_id)
+        self._refresh_wakeup.set()
+
+    def has_pending_refresh(self):
+        """是否有推送通知请求的刷新尚未执行"""
+        with self._lock:
+            return self._pending_calendars is None or bool(self._pending_calendars)
+
+    def take_pending_calendars(self):
+        """取出等待定向同步的日历，None 表示同步全部"""
+        with self._lock:
+            pending = self._pending_calendars
+            self._pending_calendars = set()
+        return sorted(pending) if pending else None
+
+    def _refresh_loop(self):
+        """日历刷新任务：独立于提醒触发，按刷新策略刷新日历并重建调度表"""
+        calendar_ids, force = None, False
+        while not self._stopped.is_set():
+            try:
+                self.refresh(calendar_ids=calendar_ids, force=force)
+            except Exception as e:
+                logger.exception('检查事件时出错: %s', e)
+            if not STARTUP.finished:
+                STARTUP.finish('第一次日历检查', self.startup_target)
+
+            # 等待下次刷新：推送通知到达时会被提前唤醒，只同步发生变更的日历
+            woken = self.clock.wait(self._refresh_wakeup, self.next_refresh_delay())
+            self._refresh_wakeup.clear()
+            if self._stopped.is_set():
+                break
+            pending = self.take_pending_calendars()
+            calendar_ids, force = (pending, True) if woken else (None, False)
+
+    def _on_calendar_change(self, channel_id, resource_state):
+        """推送通知回调：对发生变更的日历触发一次增量同步"""
+        for manager in self.watch_managers:
+            if manager.channel and manager.channel['id'] == channel_id:
+                self.request_refresh(manager.calendar_id)
+                return
+        self.request_refresh()
+
+    def start_watch(self):
+        """启动推送通知接收端并注册 events.watch 通道"""
+        address = self._getenv('WATCH_ADDRESS')
+        if not address:
+            logger.warning('已开启 WATCH_ENABLED 但未配置 WATCH_ADDRESS，仅使用轮询')
+            return
+
+        self.watch_receiver = WatchReceiver(
+            host=self._getenv('WATCH_LISTEN_HOST', '0.0.0.0'),
+            port=int(self._getenv('WATCH_LISTEN_PORT', '8765')),
+            on_change=self._on_calendar_change,
+            token=self._getenv('WATCH_TOKEN') or None
+        )
+        self.watch_receiver.start()
+
+        for calendar_id in self.calendar_client.calendar_ids:
+            manager = WatchChannelManager(
+                calendar_client=self.calendar_client,
+                receiver=self.watch_receiver,
+                address=address,
+                calendar_id=calendar_id,
+                ttl=int(self._getenv('WATCH_TTL', '604800')),
+                renew_margin=int(self._getenv('WATCH_RENEW_MARGIN', '3600'))
+            )
+            manager.start()
+            self.watch_managers.append(manager)
+
+    def stop_watch(self):
+        """停止推送通道和接收端"""
+        for manager in self.watch_managers:
+            manager.stop()
+        if self.watch_receiver:
+            self.watch_receiver.stop()
 
     def run(self):
         """运行主循环"""
-        print('日历提醒应用启动!')
-        print(f'提醒策略：')
-        print(f'  - 普通日程：5分钟前、1分钟前')
-        print(f'  - 标记日程（如"会议[10]"）：15分钟前(5+10)、11分钟前(1+10)')
-        print(f'消息模板：{self.message_template}')
-        print(f'  可用占位符：{{event_name}} {{minutes}}')
-        print(f'检查间隔：每 {self.check_interval} 秒')
-        print(f'健康检查：连续失败 {self.failure_threshold} 次（约 {int(self.failure_threshold * self.check_interval / 60)} 分钟）后发送警报')
-        print(f'  通知时间段：{self.alert_start_hour}:00 - {self.alert_end_hour}:00（避免打扰休息）')
-        print(f'小米音箱实体 ID: {self.speaker_entity_id}')
-        print('-' * 50)
-
-        if not self.ha_client.test_connection():
-            print('警告：无法连接到 Home Assistant，请检查配置!')
+        if not self.start():
             return
 
+        # 日历刷新作为独立的后台任务运行
+        refresher = threading.Thread(
+            target=self._refresh_loop, name='calendar-refresh', daemon=True)
+        refresher.start()
+
         try:
-            while True:
+            while not self._stopped.is_set():
+                # 睡眠到最近的提醒截止时间（调度表更新时会被提前唤醒）
+                self.scheduler.wait(max_wait=self.check_interval)
+                if self._stopped.is_set():
+                    break
+                started = time.monotonic()
                 try:
-                    self.check_events()
+                    self.fire_due_reminders()
                 except Exception as e:
-                    print(f'检查事件时出错: {e}')
+                    logger.exception('发送提醒时出错: %s', e)
+                MAIN_LOOP_SECONDS.observe(time.monotonic() - started)
+        except KeyboardInterrupt:
+            pass
 
-                time.sleep(self.check_interval)
+        self.shutdown()
 
-        except KeyboardInterrupt:
-            print('\n应用已停止')
+    def start(self):
+        """
+        检查连接并启动播报线程、指标端点和推送通道，用缓存数据预热调度表
+
+        不包含主循环和刷新任务（由 run() 或多租户的 TenantHost 负责）
+
+        Returns:
+            是否启动成功
+        """
+        logger.info('日历提醒应用启动!')
+        logger.info('提醒策略：普通日程 %s 分钟前；标记日程（如"会议[10]"）每个时间点推迟 10 分钟，'
+                    '"面试[30,10,2]" 使用标记中的时间点',
+                    '、'.join(str(minutes) for minutes in self.reminder_rules.default_minutes))
+        for calendar_id, minutes in self.reminder_rules.calendar_minutes.items():
+            logger.info('日历 %s 的默认提醒：%s 分钟前', calendar_id,
+                        '、'.join(str(m) for m in minutes))
+        logger.info('消息模板：%s（可用占位符：{event_name} {minutes}）', self.message_template)
+        logger.info('检查间隔：每 %d 秒（提醒按截止时间独立调度，补发宽限期 %d 秒）',
+                    self.check_interval, self.reminder_grace)
+        logger.info('同步模式：%s', '增量同步 (syncToken)' if self.incremental_sync else '全量查询')
+        if self.expand_recurrence:
+            logger.info('重复日程：本地展开（只同步主事件和例外）')
+        if self.watch_enabled:
+            logger.info('推送通知：已开启，兜底轮询间隔 %d 秒', self.refresh_interval)
+        policy = self.refresh_policy
+        if policy.adaptive:
+            logger.info('自适应刷新：近期没有提醒时每 %d 秒刷新一次，提醒临近时逐步加密到每 %d 秒',
+                        policy.max_interval, policy.min_interval)
+        if policy.daily_budget:
+            logger.info('每日 API 调用预算：%d 次', policy.daily_budget)
+        if self.freebusy_probe:
+            logger.info('freebusy 探测：已开启，忙碌时段没有变化时跳过完整同步')
+        logger.info('健康检查：连续失败 %d 分钟后发送警报，通知时间段 %d:00 - %d:00',
+                    self.failure_alert_seconds // 60, self.alert_start_hour, self.alert_end_hour)
+        logger.info('日历：%s', ', '.join(self.calendar_client.calendar_ids))
+        logger.info('小米音箱实体 ID: %s', self.speaker_entity_id)
+
+        if not self.ha_client.test_connection():
+            logger.error('无法连接到 Home Assistant，请检查配置!')
+            return False
+
+        if self.discover_services and self.speaker_entity_id.startswith('media_player.'):
+            self.ha_client.discover_services()
+        STARTUP.mark('连接 Home Assistant')
+
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(self.metrics_host, int(self.metrics_port))
+            self.metrics_server.start()
+
+        self.dispatcher.start()
+
+        # 先用缓存数据调度提醒，再在后台刷新（stale-while-revalidate）
+        self.warm_start()
+        STARTUP.mark('缓存预热调度表')
+
+        if self.watch_enabled:
+            self.start_watch()
+            STARTUP.mark('注册推送通道')
+
+        return True
+
+    def profile_startup(self):
+        """
+        启动耗时分析：启动并完成第一次日历检查后输出各阶段耗时和耗时最多的导入，然后退出
+
+        不进入主循环，不会播报提醒
+        """
+        if not self.start():
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.exception('检查事件时出错: %s', e)
+        STARTUP.finish('第一次日历检查', self.startup_target)
+        self.shutdown()
+
+        imports = ''.join(f'\n{seconds * 1000:>9.1f} ms  {name}'
+                          for name, seconds in import_breakdown('main_cli'))
+        logger.info('%s\n耗时最多的导入（python -X importtime，单独的子进程中测量）：%s',
+                    STARTUP.report(), imports)
+
+    def shutdown(self):
+        """停止推送通道、播报线程、凭证刷新线程和指标端点"""
+        self.stop_watch()
+        self.dispatcher.stop(timeout=5)
+        self.calendar_client.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        logger.info('应用已停止')
+
+    def stop(self):
+        """让 run() 的主循环和刷新任务退出（可从其他线程调用）"""
+        self._stopped.set()
+        self._refresh_wakeup.set()
+        self.scheduler.wakeup()
 
 
 def main():
@@ -345,18 +1012,29 @@ def main():
     # 检查是否为 headless 模式
     headless = '--headless' in sys.argv or '--cli' in sys.argv
 
+    setup_logging_from_env()
+
+    # 多租户模式：按租户配置文件在一个进程（或按租户分片的多个进程）中运行多个提醒管道
+    tenants_file = os.getenv('TENANTS_FILE')
+    if tenants_file:
+        from tenants import run_tenants
+        run_tenants(tenants_file, headless=headless,
+                    processes=int(os.getenv('TENANT_PROCESSES', '1')))
+        return
+
     # 检查必要的环境变量
     required_vars = ['HA_BASE_URL', 'HA_ACCESS_TOKEN', 'XIAOMI_SPEAKER_ENTITY_ID']
     missing_vars = [var for var in required_vars if not os.getenv(var)]
 
     if missing_vars:
-        print('错误：缺少以下环境变量:')
-        for var in missing_vars:
-            print(f'  - {var}')
-        print('\n请在 .env 文件中配置这些变量。')
+        logger.error('缺少以下环境变量: %s，请在 .env 文件中配置这些变量。', ', '.join(missing_vars))
         return
 
     app = CalendarReminderApp(headless=headless)
+    if '--profile-startup' in sys.argv:
+        # 启动耗时分析：执行到第一次日历检查完成，输出各阶段耗时后退出
+        app.profile_startup()
+        return
     app.run()
 
 
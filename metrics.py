@@ -0,0 +1,290 @@
+"""运行指标模块 - 以 Prometheus 文本格式暴露延迟和计数"""
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 默认的延迟分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    """转义标签值中的反斜杠、换行和双引号"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类：按标签值保存各个序列"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """获取某组标签值对应的序列"""
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type_name}',
+        ]
+        with self._lock:
+            series_items = sorted(self._series.items())
+        for key, series in series_items:
+            lines.extend(self._render_series(key, series))
+        return lines
+
+    def _render_series(self, key, series):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(series.value)}']
+
+
+class _CounterSeries:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeSeries(_CounterSeries):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramSeries:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    type_name = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount=1):
+        """没有标签时直接计数"""
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """可任意设置的当前值"""
+
+    type_name = 'gauge'
+
+    def _new_series(self):
+        return _GaugeSeries()
+
+    def set(self, value):
+        """没有标签时直接设置"""
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """分桶统计的分布（例如延迟）"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value):
+        """没有标签时直接记录"""
+        self.labels().observe(value)
+
+    def _render_series(self, key, series):
+        with series._lock:
+            counts = list(series.counts)
+            total, count = series.sum, series.count
+
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+        lines.append(f'{self.name}_bucket{labels} {count}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """输出 Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Google Calendar
+CALENDAR_FETCH_SECONDS = REGISTRY.histogram(
+    'calendar_fetch_seconds', '单个日历一次查询/同步的耗时（秒）', ['calendar', 'mode'])
+CALENDAR_API_ERRORS = REGISTRY.counter(
+    'calendar_api_errors_total', 'Google Calendar API 调用失败次数', ['calendar', 'status'])
+CALENDAR_API_CALLS = REGISTRY.counter(
+    'calendar_api_calls_total', 'Google Calendar API 请求次数', ['method'])
+CALENDAR_API_RETRIES = REGISTRY.counter(
+    'calendar_api_retries_total', 'Google Calendar API 退避重试次数', ['status'])
+CALENDAR_CIRCUIT_OPEN = REGISTRY.gauge(
+    'calendar_circuit_open', 'Google Calendar API 断路器是否打开（1 为打开）')
+
+# Home Assistant
+HA_CALL_SECONDS = REGISTRY.histogram(
+    'ha_call_service_seconds', 'Home Assistant call_service 的耗时（秒）', ['service'])
+HA_CALL_ERRORS = REGISTRY.counter(
+    'ha_call_service_errors_total', 'Home Assistant call_service 失败次数', ['service'])
+
+# 提醒应用
+POLL_EVENTS = REGISTRY.gauge(
+    'poll_events', '最近一次刷新查询到的日程数')
+POLLS = REGISTRY.counter(
+    'polls_total', '日历刷新次数', ['result'])
+REMINDER_LAG_SECONDS = REGISTRY.histogram(
+    'reminder_lag_seconds', '提醒实际开始播报时间与计划触发时间之差（秒）',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300))
+REMINDERS = REGISTRY.counter(
+    'reminders_total', '提醒播报次数', ['result'])
+MAIN_LOOP_SECONDS = REGISTRY.histogram(
+    'main_loop_iteration_seconds', '主循环每次处理到期提醒的耗时（不含等待，秒）',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+
+
+class MetricsServer:
+    """
+    指标 HTTP 端点
+
+    GET /metrics 返回 Prometheus 文本格式，默认只监听本机
+    """
+
+    def __init__(self, host='127.0.0.1', port=9108, registry=REGISTRY):
+        """
+        初始化指标端点
+
+        Args:
+            host: 监听地址
+            port: 监听端口（0 表示随机端口）
+            registry: 要暴露的指标注册表
+        """
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        """实际监听的端口"""
+        return self._server.server_address[1]
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 抓取很频繁，不输出默认的访问日志
+                pass
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动 HTTP 服务"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+        logger.info('指标端点已启动: http://%s:%d/metrics', *self._server.server_address[:2])
+
+    def stop(self):
+        """停止 HTTP 服务"""
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,289 @@
+"""重复日程本地展开模块 - 按主事件的 RRULE / RDATE / EXDATE 在滑动时间窗口内生成实例"""
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.rrule import rruleset, rrulestr
+
+logger = logging.getLogger(__name__)
+
+# 每次向后展开的最小跨度：查询窗口每次只前移几分钟，按天批量展开，避免每次查询都重新计算
+EXPANSION_STEP = timedelta(days=1)
+
+# RRULE 中的 UNTIL=YYYYMMDD[THHMMSS][Z]
+_UNTIL = re.compile(r'UNTIL=(\d{8})(?:T(\d{6}))?(Z?)', re.IGNORECASE)
+
+
+class RecurrenceError(ValueError):
+    """无法解析的重复规则"""
+
+
+def is_exception(event):
+    """是否为重复日程的例外（被修改或取消的单个实例）"""
+    return bool(event.get('recurringEventId')) and 'originalStartTime' in event
+
+
+def instance_id(master_id, original_start):
+    """
+    重复日程实例的事件 ID，与服务端展开（singleEvents=True）的实例 ID 格式一致
+
+    Args:
+        master_id: 主事件 ID
+        original_start: 实例原本的开始时间：事件的 {'dateTime': ...} / {'date': ...}，
+                        或 datetime（全天日程为当天 0 点的 naive datetime）
+
+    Returns:
+        定时日程为 <主事件 ID>_YYYYMMDDTHHMMSSZ（UTC），全天日程为 <主事件 ID>_YYYYMMDD
+    """
+    if isinstance(original_start, dict):
+        if 'dateTime' in original_start:
+            original_start = _parse_datetime(original_start['dateTime'])
+        else:
+            original_start = date.fromisoformat(original_start['date'])
+    if isinstance(original_start, datetime) and original_start.tzinfo is not None:
+        return f'{master_id}_{original_start.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}'
+    return f'{master_id}_{original_start:%Y%m%d}'
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _zone(name):
+    """按 IANA 时区名获取时区，未知的时区返回 None"""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning('未知的时区 %s，按事件时间中的 UTC 偏移展开', name)
+        return None
+
+
+def _fix_until(rule, dtstart):
+    """
+    统一 UNTIL 与 DTSTART 的类型（dateutil 要求两者同为 naive 或同为 UTC）
+
+    定时日程的 UNTIL 没有写成 UTC 时按日程的时区换算（只有日期时包含当天）；
+    全天日程的 UNTIL 按日期比较
+    """
+    match = _UNTIL.search(rule)
+    if not match:
+        return rule
+    day, clock, utc = match.groups()
+    until = datetime.strptime(day + (clock or '235959'), '%Y%m%d%H%M%S')
+    if dtstart.tzinfo is None:
+        value = f'{until:%Y%m%dT%H%M%S}'
+    elif utc:
+        return rule
+    else:
+        value = f'{until.replace(tzinfo=dtstart.tzinfo).astimezone(timezone.utc):%Y%m%dT%H%M%SZ}'
+    return f'{rule[:match.start()]}UNTIL={value}{rule[match.end():]}'
+
+
+def _parse_dates(value, params, dtstart):
+    """
+    解析 RDATE / EXDATE 的值，转换为与 DTSTART 可比较的 datetime
+
+    Args:
+        value: 逗号分隔的日期或日期时间
+        params: 属性参数（例如 ['TZID=Asia/Shanghai', 'VALUE=DATE']）
+        dtstart: 主事件的开始时间
+
+    Returns:
+        datetime 列表
+    """
+    params = dict(param.split('=', 1) for param in params if '=' in param)
+    tz = _zone(params.get('TZID'))
+    moments = []
+    for item in value.split(','):
+        item = item.strip().upper()
+        if not item:
+            continue
+        if 'T' in item:
+            moment = datetime.strptime(item.rstrip('Z'), '%Y%m%dT%H%M%S')
+            if item.endswith('Z'):
+                moment = moment.replace(tzinfo=timezone.utc)
+            elif tz is not None:
+                moment = moment.replace(tzinfo=tz)
+        else:
+            # 只有日期：对应当天与 DTSTART 同一时刻的实例
+            moment = datetime.combine(datetime.strptime(item, '%Y%m%d').date(), dtstart.time())
+
+        if dtstart.tzinfo is None:
+            # 全天日程只比较日期
+            moment = datetime.combine(moment.date(), dtstart.time())
+        elif moment.tzinfo is None:
+            # 没有时区的日期时间（floating）按日程的时区处理
+            moment = moment.replace(tzinfo=dtstart.tzinfo)
+        moments.append(moment)
+    return moments
+
+
+def build_ruleset(recurrence, dtstart):
+    """
+    把事件的 recurrence 字段（RFC 5545 的 RRULE / EXRULE / RDATE / EXDATE 行）编译为 rruleset
+
+    Args:
+        recurrence: 规则行列表
+        dtstart: 第一个实例的开始时间（定时日程为带时区的 datetime，全天日程为 naive datetime）
+
+    Returns:
+        dateutil.rrule.rruleset
+
+    Raises:
+        RecurrenceError: 规则无法解析
+    """
+    rules = rruleset()
+    for line in recurrence:
+        head, _, value = line.partition(':')
+        name, *params = head.split(';')
+        name = name.strip().upper()
+        try:
+            if name in ('RRULE', 'EXRULE'):
+                rule = rrulestr(_fix_until(value, dtstart), dtstart=dtstart)
+                (rules.rrule if name == 'RRULE' else rules.exrule)(rule)
+            elif name in ('RDATE', 'EXDATE'):
+                for moment in _parse_dates(value, params, dtstart):
+                    (rules.rdate if name == 'RDATE' else rules.exdate)(moment)
+        except (ValueError, TypeError) as e:
+            raise RecurrenceError(f'无法解析重复规则 {line!r}: {e}') from e
+    return rules
+
+
+class RecurrenceExpansion:
+    """
+    一个重复日程（主事件）的本地展开
+
+    生成的实例与服务端 singleEvents=True 返回的实例格式一致（id、start、end、
+    recurringEventId、originalStartTime），其他字段（标题等）和 etag 取自主事件；
+    可以在生成时转换为调用方使用的记录（例如 EventRecord），每个实例只转换一次。
+    展开结果缓存在滑动窗口内：窗口前移时只丢弃已结束的实例，向后只展开新增的一段；
+    主事件修改（etag 变化）后由调用方重新创建。例外（被修改或取消的实例）由调用方按实例 ID 处理。
+    """
+
+    def __init__(self, master, ingest=None):
+        """
+        编译主事件的重复规则
+
+        Args:
+            master: 带 recurrence 字段的主事件
+            ingest: 把生成的实例事件转换为记录的函数，None 表示返回事件字典
+
+        Raises:
+            RecurrenceError: 规则无法解析
+        """
+        self.master_id = master['id']
+        self.etag = master.get('etag')
+        start = master['start']
+        end = master.get('end') or start
+        self.all_day = 'dateTime' not in start
+        if self.all_day:
+            self._time_zone = None
+            self._dtstart = datetime.fromisoformat(start['date'])
+            dtend = datetime.fromisoformat(end['date'])
+        else:
+            # 按日程自己的时区展开，跨夏令时的实例保持相同的当地时间
+            self._time_zone = start.get('timeZone')
+            self._dtstart = _parse_datetime(start['dateTime'])
+            tz = _zone(self._time_zone)
+            if tz is not None:
+                self._dtstart = self._dtstart.astimezone(tz)
+            dtend = _parse_datetime(end['dateTime']).astimezone(self._dtstart.tzinfo)
+        self.duration = dtend - self._dtstart
+        self._rules = build_ruleset(master['recurrence'], self._dtstart)
+        # 所有 RRULE 都有 COUNT 或 UNTIL 时重复是有限的
+        self._finite = all(
+            'COUNT=' in line.upper() or 'UNTIL=' in line.upper()
+            for line in master['recurrence'] if line.upper().startswith('RRULE'))
+        self._template = {key: value for key, value in master.items() if key != 'recurrence'}
+        self._ingest = ingest
+
+        # 已展开的实例 [(start, end, event)]，按开始时间排序
+        self._instances = []
+        # 已展开的范围：结束时间晚于 _covered_from、开始时间早于 _covered_until 的实例都在列表中
+        self._covered_from = None
+        self._covered_until = None
+        self._last_end = False
+
+    def _bound(self, moment):
+        """把查询边界转换为与实例可比较的时间（全天日程按本地时区的 naive 时间）"""
+        if self.all_day:
+            return moment.astimezone().replace(tzinfo=None)
+        return moment
+
+    def _instance(self, start):
+        """生成一个实例事件"""
+        end = start + self.duration
+        if self.all_day:
+            start_field = {'date': start.date().isoformat()}
+            end_field = {'date': end.date().isoformat()}
+        else:
+            start_field = {'dateTime': start.isoformat()}
+            end_field = {'dateTime': end.isoformat()}
+            if self._time_zone:
+                start_field['timeZone'] = end_field['timeZone'] = self._time_zone
+        event = dict(self._template)
+        event.update(
+            id=instance_id(self.master_id, start),
+            start=start_field,
+            end=end_field,
+            recurringEventId=self.master_id,
+            originalStartTime=dict(start_field),
+        )
+        return self._ingest(event) if self._ingest else event
+
+    def instances(self, time_min, time_max):
+        """
+        与 [time_min, time_max) 有重叠的实例
+
+        Args:
+            time_min: 开始时间（timezone-aware datetime）
+            time_max: 结束时间（timezone-aware datetime）
+
+        Returns:
+            实例事件（或转换后的记录）列表，按开始时间排序
+        """
+        lo, hi = self._bound(time_min), self._bound(time_max)
+        if self._covered_from is None or lo < self._covered_from:
+            # 第一次查询，或窗口向前回退到已丢弃的范围：重新展开
+            self._instances = []
+            self._covered_from = lo
+            # 包含开始早于窗口、仍在进行中的实例
+            self._covered_until = lo - self.duration
+
+        # 窗口前移：丢弃已经结束的实例
+        ended = 0
+        while ended < len(self._instances) and self._instances[ended][1] <= lo:
+            ended += 1
+        if ended:
+            del self._instances[:ended]
+        self._covered_from = max(self._covered_from, lo)
+
+        # 窗口后移：只展开新增的一段
+        if hi > self._covered_until:
+            until = max(hi, self._covered_until + EXPANSION_STEP)
+            for start in self._rules.between(self._covered_until, until, inc=True):
+                if start < until:
+                    self._instances.append((start, start + self.duration, self._instance(start)))
+            self._covered_until = until
+
+        return [event for start, end, event in self._instances if start < hi and end > lo]
+
+    def last_end(self):
+        """
+        最后一个实例的结束时间（带时区），无限重复时返回 None
+
+        结果按主事件的版本缓存
+        """
+        if self._last_end is False:
+            self._last_end = None
+            if self._finite:
+                # 有限的规则：遍历一次找到最后一个实例（没有实例时按第一个实例的时间）
+                last = self._dtstart
+                for last in self._rules:
+                    pass
+                end = last + self.duration
+                self._last_end = end.astimezone() if self.all_day else end
+        return self._last_end
@@ -0,0 +1,165 @@
+"""刷新策略模块 - 按最近的提醒截止时间和每日 API 预算决定何时查询 Google 日历"""
+import logging
+from datetime import datetime, timedelta
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+# 判断刷新是否到期时允许的提前量（秒），避免等待超时的微小误差导致本次刷新被跳过
+DUE_TOLERANCE = 0.5
+
+
+class RefreshPolicy:
+    """
+    自适应日历刷新策略
+
+    - 调度表为空（近期没有提醒）时按 max_interval 低频刷新
+    - 有提醒即将到期时，刷新间隔取到截止时间剩余时间的一半，逐步加密到 min_interval，
+      保证提醒发出前至少再刷新一次，及时发现日程被修改或取消
+    - 设置每日 API 调用预算后，按当天剩余预算和剩余时间放慢刷新，
+      预算用完后当天不再调用 API（提醒继续基于本地事件集发送）
+
+    min_interval 与 max_interval 相同时等价于固定间隔轮询。
+    """
+
+    def __init__(self, min_interval, max_interval=None, daily_budget=0, clock=SYSTEM_CLOCK):
+        """
+        初始化刷新策略
+
+        Args:
+            min_interval: 最短刷新间隔（秒），提醒临近时使用
+            max_interval: 最长刷新间隔（秒），近期没有提醒时使用，默认与 min_interval 相同
+            daily_budget: 每天（本地时间）最多调用的 API 次数，0 表示不限制
+            clock: 时钟
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval or min_interval, min_interval)
+        self.daily_budget = daily_budget
+        self.clock = clock
+        # 下次刷新的单调时钟时间，None 表示立即刷新
+        self._next_poll_at = None
+        # 当天已调用的 API 次数
+        self._day = None
+        self._calls_today = 0
+        # 最近一次刷新调用的 API 次数，用于估算预算允许的刷新间隔
+        self._calls_per_poll = 1
+        self._exhausted_logged = False
+
+    @property
+    def adaptive(self):
+        """刷新间隔是否会随提醒截止时间变化"""
+        return self.max_interval > self.min_interval
+
+    def _roll_day(self):
+        """跨天时重置当天的调用计数"""
+        today = self.clock.now().date()
+        if today != self._day:
+            self._day = today
+            self._calls_today = 0
+            self._exhausted_logged = False
+
+    def record_calls(self, calls):
+        """
+        记录一次刷新调用的 API 次数
+
+        Args:
+            calls: 本次刷新实际发出的 API 请求数
+        """
+        self._roll_day()
+        self._calls_today += calls
+        if calls:
+            self._calls_per_poll = calls
+
+    @property
+    def calls_today(self):
+        """当天已调用的 API 次数"""
+        self._roll_day()
+        return self._calls_today
+
+    def budget_exhausted(self):
+        """当天的 API 调用预算是否已经用完"""
+        return bool(self.daily_budget) and self.calls_today >= self.daily_budget
+
+    def interval_for(self, next_deadline):
+        """
+        根据最近的提醒截止时间计算刷新间隔
+
+        Args:
+            next_deadline: 最近的提醒截止时间（时钟的单调时间），None 表示没有待发送的提醒
+
+        Returns:
+            刷新间隔（秒），在 [min_interval, max_interval] 之间
+        """
+        if next_deadline is None:
+            return self.max_interval
+        remaining = next_deadline - self.clock.monotonic()
+        return min(self.max_interval, max(self.min_interval, remaining / 2))
+
+    def budget_interval(self, pending_calls=0):
+        """
+        按每日预算允许的最短刷新间隔
+
+        Args:
+            pending_calls: 尚未记录的调用次数（估算即将进行的刷新之后的间隔时使用）
+
+        Returns:
+            秒数；不限制预算时为 0，当天预算用完时为到明天 0 点的时间
+        """
+        if not self.daily_budget:
+            return 0
+        self._roll_day()
+        now = self.clock.now()
+        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        seconds_left = (tomorrow - now).total_seconds()
+
+        remaining = self.daily_budget - self._calls_today - pending_calls
+        if remaining < self._calls_per_poll:
+            if not pending_calls and not self._exhausted_logged:
+                logger.warning('今日 API 调用预算已用完（%d/%d 次），明天之前只使用本地事件集提醒',
+                               self._calls_today, self.daily_budget)
+                self._exhausted_logged = True
+            return seconds_left
+        return seconds_left * self._calls_per_poll / remaining
+
+    def longest_interval(self):
+        """
+        即将进行的这次刷新到下一次刷新之间最长的间隔（秒）
+
+        自适应间隔不会超过 max_interval，但预算限制可能让下一次刷新更晚（预算用完时到明天 0 点）；
+        没有本地事件集时，这次查询的时间窗口需要覆盖该间隔
+
+        Returns:
+            秒数
+        """
+        return max(self.max_interval, self.budget_interval(pending_calls=self._calls_per_poll))
+
+    def schedule(self, next_deadline):
+        """
+        一次刷新完成后安排下次刷新
+
+        Args:
+            next_deadline: 刷新后最近的提醒截止时间（单调时间），None 表示没有待发送的提醒
+
+        Returns:
+            距下次刷新的秒数
+        """
+        delay = max(self.interval_for(next_deadline), self.budget_interval())
+        self._next_poll_at = self.clock.monotonic() + delay
+        return delay
+
+    def poll_due(self):
+        """是否到了下次刷新的时间"""
+        return (self._next_poll_at is None
+                or self.clock.monotonic() >= self._next_poll_at - DUE_TOLERANCE)
+
+    def wait_timeout(self):
+        """
+        刷新任务下次醒来前的等待时间
+
+        最多等待 max_interval：预算限制使下次刷新更晚时，中途醒来用本地事件集重建调度表，
+        让调度表的时间窗口继续向前滚动
+        """
+        if self._next_poll_at is None:
+            return 0
+        return max(0.0, min(self._next_poll_at - self.clock.monotonic(), self.max_interval))
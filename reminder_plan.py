@@ -0,0 +1,210 @@
+"""提醒规则模块 - 把事件标题编译为提醒计划，并按事件版本缓存"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# 最大提醒提前量（分钟），日历查询窗口需要覆盖它
+MAX_REMINDER_MINUTES = 65
+
+# 单个数字标记（如 "[10]"）的取值范围：所有默认提醒时间点都推迟该分钟数
+MAX_EXTRA_MINUTES = 60
+
+# 标题中的提醒标记：[10] 或 [30,10,2]（也接受中文逗号）
+MARKER_PATTERN = re.compile(r'\[(\d+(?:\s*[,，]\s*\d+)*)\]')
+_MARKER_CLEAN_PATTERN = re.compile(r'\s*\[\d+(?:\s*[,，]\s*\d+)*\]\s*')
+_NUMBER_SPLIT_PATTERN = re.compile(r'\s*[,，]\s*')
+
+
+def clean_event_name(event_summary):
+    """移除标题中的提醒标记，只保留纯净的事件名称"""
+    return _MARKER_CLEAN_PATTERN.sub(' ', event_summary).strip()
+
+
+def parse_minutes(spec):
+    """
+    解析逗号分隔的分钟数列表
+
+    Args:
+        spec: 例如 '5,1'
+
+    Returns:
+        从大到小排序、去重后的分钟数元组，超出 1-MAX_REMINDER_MINUTES 的值被忽略
+    """
+    minutes = set()
+    for item in _NUMBER_SPLIT_PATTERN.split(spec.strip()):
+        if item.isdigit() and 1 <= int(item) <= MAX_REMINDER_MINUTES:
+            minutes.add(int(item))
+    return tuple(sorted(minutes, reverse=True))
+
+
+def parse_calendar_minutes(spec):
+    """
+    解析按日历设置的默认提醒时间点
+
+    Args:
+        spec: 例如 'family@group.calendar.google.com=10,2;work@example.com=15,5'
+
+    Returns:
+        {calendar_id: 分钟数元组}
+    """
+    calendars = {}
+    for item in (spec or '').split(';'):
+        calendar_id, sep, minutes = item.partition('=')
+        if sep and calendar_id.strip():
+            parsed = parse_minutes(minutes)
+            if parsed:
+                calendars[calendar_id.strip()] = parsed
+    return calendars
+
+
+class ReminderPlan:
+    """
+    一个事件编译后的提醒计划
+
+    包含提醒时间点、去掉标记的事件名称，以及按每个提醒时间点预先渲染好的
+    播报消息和合并播报中的条目；实际剩余分钟数与提醒时间点不同时（例如补发）
+    才重新格式化。
+    """
+
+    __slots__ = ('offsets', 'event_name', '_message_template', '_list_item_template',
+                 '_messages', '_list_items')
+
+    def __init__(self, offsets, event_name, message_template, list_item_template):
+        self.offsets = offsets
+        self.event_name = event_name
+        self._message_template = message_template
+        self._list_item_template = list_item_template
+        self._messages = {
+            minutes: message_template.format(event_name=event_name, minutes=minutes)
+            for minutes in offsets
+        }
+        self._list_items = {
+            minutes: list_item_template.format(event_name=event_name, minutes=minutes)
+            for minutes in offsets
+        }
+
+    def message(self, minutes):
+        """单独播报的消息"""
+        message = self._messages.get(minutes)
+        if message is None:
+            message = self._message_template.format(event_name=self.event_name, minutes=minutes)
+        return message
+
+    def list_item(self, minutes):
+        """合并播报中该事件的条目"""
+        item = self._list_items.get(minutes)
+        if item is None:
+            item = self._list_item_template.format(event_name=self.event_name, minutes=minutes)
+        return item
+
+
+class ReminderRules:
+    """
+    提醒规则：把事件标题编译为提醒时间点
+
+    - 普通日程使用默认提醒时间点（可按日历分别设置，默认 5 分钟前、1 分钟前）
+    - 标题带单个数字标记（如 "会议 [10]"）：每个默认时间点都推迟该分钟数（1-60），
+      推迟后超过 65 分钟的时间点按 65 分钟提醒
+    - 标题带多个数字标记（如 "面试 [30,10,2]"）：直接使用这些时间点（1-65 分钟）
+
+    只依赖配置，事件同步时即可为每个事件算好提醒时间点（见 EventRecord）。
+    """
+
+    def __init__(self, default_minutes=(5, 1), calendar_minutes=None):
+        """
+        Args:
+            default_minutes: 默认提醒时间点（分钟）
+            calendar_minutes: 按日历设置的默认提醒时间点 {calendar_id: 分钟数元组}
+        """
+        self.default_minutes = tuple(sorted(default_minutes, reverse=True))
+        self.calendar_minutes = dict(calendar_minutes or {})
+
+    def compile(self, event_summary, calendar_id=None):
+        """
+        计算事件的提醒时间点
+
+        Returns:
+            从大到小排序的分钟数元组
+
+        Examples:
+            "普通会议" -> (5, 1)
+            "远程会议 [10]" -> (15, 11)
+            "面试 [30,10,2]" -> (30, 10, 2)
+        """
+        defaults = self.calendar_minutes.get(calendar_id, self.default_minutes)
+
+        match = MARKER_PATTERN.search(event_summary)
+        if not match:
+            return defaults
+        numbers = _NUMBER_SPLIT_PATTERN.split(match.group(1))
+        if len(numbers) > 1:
+            return parse_minutes(match.group(1)) or defaults
+        extra = int(numbers[0])
+        if not 1 <= extra <= MAX_EXTRA_MINUTES:
+            return defaults
+        if defaults[0] + extra > MAX_REMINDER_MINUTES:
+            # 不丢弃超出上限的时间点（否则较大的默认时间点可能让事件完全没有提醒）
+            logger.warning('日程 "%s" 的提醒时间点推迟 %d 分钟后超过 %d 分钟，按 %d 分钟提醒',
+                           event_summary, extra, MAX_REMINDER_MINUTES, MAX_REMINDER_MINUTES)
+        return tuple(sorted({min(minutes + extra, MAX_REMINDER_MINUTES) for minutes in defaults},
+                            reverse=True))
+
+
+class ReminderPlanner:
+    """
+    提醒计划的编译和缓存
+
+    提醒时间点和事件名称在同步时已经算好（EventRecord），这里按它们预先渲染播报消息。
+    计划按 (event_id, etag) 缓存：事件没有变化时每次刷新只做一次字典查找，
+    不再重复格式化消息；etag 变化（标题被修改等）时重新渲染。
+    """
+
+    def __init__(self, message_template, list_item_template, rules=None):
+        """
+        初始化提醒计划缓存
+
+        Args:
+            message_template: 单独播报的消息模板（{event_name} {minutes}）
+            list_item_template: 合并播报中每个日程的模板（{event_name} {minutes}）
+            rules: 提醒规则（ReminderRules），默认使用默认提醒时间点
+        """
+        self.message_template = message_template
+        self.list_item_template = list_item_template
+        self.rules = rules or ReminderRules()
+        # {event_id: (版本, calendar_id, ReminderPlan)}
+        self._plans = {}
+
+    def __len__(self):
+        return len(self._plans)
+
+    def plan(self, record):
+        """
+        获取事件的提醒计划（命中缓存时不重新渲染）
+
+        Args:
+            record: EventRecord
+
+        Returns:
+            ReminderPlan
+        """
+        # 没有 etag 的事件（例如重放的事件文件）使用标题作为版本
+        version = record.etag or record.summary
+        cached = self._plans.get(record.id)
+        if cached is not None and cached[0] == version and cached[1] == record.calendar_id:
+            return cached[2]
+
+        plan = ReminderPlan(record.offsets, record.name, self.message_template, self.list_item_template)
+        self._plans[record.id] = (version, record.calendar_id, plan)
+        return plan
+
+    def compile(self, event_summary, calendar_id=None):
+        """把事件标题编译为提醒计划（不使用缓存）"""
+        return ReminderPlan(self.rules.compile(event_summary, calendar_id), clean_event_name(event_summary),
+                            self.message_template, self.list_item_template)
+
+    def retain(self, event_ids):
+        """只保留这些事件的计划，清理已删除或已结束事件的缓存"""
+        event_ids = set(event_ids)
+        for event_id in [event_id for event_id in self._plans if event_id not in event_ids]:
+            del self._plans[event_id]
@@ -0,0 +1,402 @@
+"""重放模拟 - 在虚拟时钟上把日历事件送入提醒逻辑，验证提醒的时间策略
+
+虚拟时间直接跳到下一个提醒截止时间或下一次刷新，不会真正等待，
+几周的日程可以在几秒内重放完。输出每一次播报的计划时间和实际时间。
+
+用法：
+    python replay.py --generate 2000 --days 14
+    python replay.py --events events.json --start 2026-10-01T00:00:00+08:00 --end 2026-10-08T00:00:00+08:00
+    python replay.py --cache event_cache.db --calendar-ids primary --latency 0.5 --failure-rate 0.1
+    python replay.py --generate 200 --days 1 --failure-rate 1.0 --summary-only   # 重试回归检查
+    python replay.py --generate 200 --days 1 --failure-rate 1.0 --summary-only --check-interval 5 --refresh-max-interval 60
+
+提醒策略相关的环境变量（REMINDER_COALESCE_SECONDS、REMINDER_GRACE_SECONDS、
+REMINDER_RETRY_DELAY、CHECK_INTERVAL、REFRESH_MAX_INTERVAL 等）与正式运行时相同。
+汇总中的 API 请求数按正式客户端的方式计数（每个日历的每次同步一次，freebusy 探测一次），
+可以用来比较不同刷新策略的调用量。
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import statistics
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import main_cli
+from clock import VirtualClock
+from event_cache import EventCache
+from event_record import EventRecord
+from fake_services import generate_events
+from google_calendar_cli import GoogleCalendarClient
+from log_setup import setup_logging
+from reminder_plan import ReminderRules
+
+
+class ReplayCalendar:
+    """
+    内存中的只读日历，接口与 GoogleCalendarClient 中提醒应用用到的部分一致
+    """
+
+    # 事件解析与正式客户端保持一致
+    get_event_start_time = GoogleCalendarClient.get_event_start_time
+    get_event_end_time = GoogleCalendarClient.get_event_end_time
+    get_event_summary = GoogleCalendarClient.get_event_summary
+
+    def __init__(self, events, calendar_id='replay', event_calendars=None):
+        """
+        Args:
+            events: Calendar API 格式的事件列表（已取消的事件会被忽略）
+            calendar_id: 没有记录来源日历的事件所属的日历 ID
+            event_calendars: 事件的来源日历 {event_id: calendar_id}（用于按日历设置的默认提醒）
+        """
+        self._event_calendars = dict(event_calendars or {})
+        self.calendar_ids = list(dict.fromkeys([*self._event_calendars.values(), calendar_id]))
+        # 模拟发出的 API 请求数
+        self.api_calls = 0
+
+        rows = []
+        for event in events:
+            if event.get('status') == 'cancelled':
+                continue
+            start_ts = self._timestamp(self.get_event_start_time(event))
+            end_ts = self._timestamp(self.get_event_end_time(event))
+            rows.append((start_ts, end_ts, event))
+        rows.sort(key=lambda row: row[0])
+
+        self._starts = [row[0] for row in rows]
+        self._rows = rows
+        # 最长的事件时长，用于确定可能与查询窗口重叠的最早开始时间
+        self._max_duration = max((end_ts - start_ts for start_ts, end_ts, _ in rows), default=0)
+        # 与 _rows 一一对应的事件记录，提醒应用创建时按它的提醒规则重新计算
+        self.use_reminder_rules(ReminderRules())
+
+    @staticmethod
+    def _timestamp(value):
+        # 全天事件的时间是 naive 的，按本地时区处理
+        return (value if value.tzinfo else value.astimezone()).timestamp()
+
+    @property
+    def events(self):
+        """全部事件，按开始时间排序"""
+        return [event for _, _, event in self._rows]
+
+    def get_event_calendar_id(self, event):
+        return self._event_calendars.get(event['id'], self.calendar_ids[-1])
+
+    def use_reminder_rules(self, rules):
+        """按提醒规则把事件转换为 EventRecord（与正式客户端同步时的转换一致）"""
+        self._records = [EventRecord.from_event(event, self.get_event_calendar_id(event), rules)
+                         for _, _, event in self._rows]
+
+    def _window(self, time_min, time_max):
+        """与 [time_min, time_max) 有重叠的事件在 _rows 中的下标"""
+        min_ts, max_ts = time_min.timestamp(), time_max.timestamp()
+        lo = bisect.bisect_left(self._starts, min_ts - self._max_duration)
+        hi = bisect.bisect_left(self._starts, max_ts)
+        return [i for i in range(lo, hi) if self._rows[i][1] > min_ts]
+
+    def sync_events(self, time_max=None, calendar_ids=None):
+        """事件集不会变化，没有需要同步的内容（每个日历仍计一次请求）"""
+        self.api_calls += len(calendar_ids or self.calendar_ids)
+        return {}
+
+    def get_synced_events(self, time_min, time_max):
+        """返回与 [time_min, time_max) 有重叠的事件记录，按开始时间排序"""
+        return [self._records[i] for i in self._window(time_min, time_max)]
+
+    def get_upcoming_events(self, time_min=None, time_max=None, max_results=10, errors=None):
+        self.api_calls += len(self.calendar_ids)
+        events = self.get_synced_events(time_min, time_max)
+        return events if max_results is None else events[:max_results]
+
+    def close(self):
+        pass
+
+    def query_freebusy(self, time_min, time_max, calendar_ids=None):
+        """按事件集计算各日历的忙碌时段（不含"空闲"状态的事件，与 freebusy.query 一致）"""
+        self.api_calls += 1
+        busy = {calendar_id: [] for calendar_id in calendar_ids or self.calendar_ids}
+        for i in self._window(time_min, time_max):
+            start_ts, end_ts, event = self._rows[i]
+            if event.get('transparency') == 'transparent':
+                continue
+            periods = busy.get(self.get_event_calendar_id(event))
+            if periods is not None:
+                periods.append((max(start_ts, time_min.timestamp()), min(end_ts, time_max.timestamp())))
+        return {calendar_id: tuple(sorted(periods)) for calendar_id, periods in busy.items()}
+
+
+class ReplaySpeaker:
+    """
+    模拟的 Home Assistant：记录播报内容，按设定的延迟推进虚拟时钟，按失败率随机失败
+    """
+
+    def __init__(self, clock, latency=0.0, failure_rate=0.0, seed=0):
+        """
+        Args:
+            clock: 虚拟时钟
+            latency: 每次播报的耗时（秒）
+            failure_rate: 播报失败的概率
+            seed: 随机种子
+        """
+        self.clock = clock
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+    def test_connection(self):
+        return True
+
+    def xiaomi_speaker_say(self, entity_id, message):
+        self.clock.advance(self.latency)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            return None
+        return {}
+
+
+def replay(app, clock, end):
+    """
+    在虚拟时间中运行应用的刷新和提醒逻辑，直到 end
+
+    与 CalendarReminderApp.run() 的主循环一致：按刷新策略刷新日历，
+    在最近的提醒截止时间醒来发送到期的提醒。播报在当前线程中同步完成。
+
+    Args:
+        app: 使用虚拟时钟、ReplayCalendar 和 ReplaySpeaker 创建的 CalendarReminderApp
+        clock: 虚拟时钟
+        end: 结束时间（Unix 时间戳）
+
+    Returns:
+        按时间顺序的 Announcement 列表
+    """
+    announcements = []
+    next_refresh = clock.time()
+
+    while True:
+        deadline = app.scheduler.next_deadline()
+        wake_at = next_refresh if deadline is None else min(next_refresh, deadline)
+        if wake_at >= end:
+            break
+        clock.set(wake_at)
+
+        if clock.time() >= next_refresh:
+            app.refresh()
+            next_refresh = clock.time() + app.next_refresh_delay()
+
+        announcement = app.fire_due_reminders()
+        if announcement is not None:
+            app.dispatcher.run_pending()
+            announcements.append(announcement)
+
+    return announcements
+
+
+def expected_reminders(app, calendar, start, end):
+    """
+    计算 [start, end) 内按提醒策略应当触发的全部提醒
+
+    Returns:
+        {(event_id, 提醒分钟数): (计划时间, 事件标题)}
+    """
+    expected = {}
+    for event in calendar.events:
+        summary = calendar.get_event_summary(event)
+        start_ts = calendar._timestamp(calendar.get_event_start_time(event))
+        for reminder_time in app.get_reminder_times(summary, calendar.get_event_calendar_id(event)):
+            fire_at = start_ts - reminder_time * 60
+            if start <= fire_at < end:
+                expected[(event['id'], reminder_time)] = (fire_at, summary)
+    return expected
+
+
+def collect_results(announcements):
+    """把播报记录展开为每个提醒一行"""
+    rows = []
+    for announcement in announcements:
+        for reminder in announcement.context or ():
+            ideal = reminder['start_ts'] - reminder['reminder_time'] * 60
+            rows.append({
+                'event_id': reminder['event_id'],
+                'event_summary': reminder['event_summary'],
+                'reminder_time': reminder['reminder_time'],
+                'attempt': reminder.get('attempts', 1),
+                'ideal': ideal,
+                'actual': announcement.started_at,
+                'error': announcement.started_at - ideal,
+                'ok': announcement.ok,
+                'message': announcement.message,
+            })
+    return rows
+
+
+def check_retries(rows, max_attempts, retry_delay, coalesce_window=0):
+    """
+    检查失败重试是否遵守 REMINDER_MAX_ATTEMPTS 和 REMINDER_RETRY_DELAY
+
+    刷新会重建调度表，重试的时间和尝试次数必须在重建后保留，
+    否则失败的提醒会在刷新后立即重播，并且尝试次数被重置。
+
+    Args:
+        rows: collect_results() 的结果
+        max_attempts: 每个提醒的最大尝试次数
+        retry_delay: 两次尝试的最小间隔（秒）
+        coalesce_window: 提醒合并窗口（秒），重试可能随合并播报提前这么久发送
+
+    Returns:
+        违规说明的列表，没有违规时为空
+    """
+    attempts = {}
+    for row in rows:
+        attempts.setdefault((row['event_id'], row['reminder_time']), []).append(row)
+
+    problems = []
+    for (_, reminder_time), tries in attempts.items():
+        label = f'{tries[0]["event_summary"]} ({reminder_time} 分钟)'
+        if len(tries) > max_attempts:
+            problems.append(f'{label} 播报了 {len(tries)} 次，超过 {max_attempts} 次')
+        numbers = [row['attempt'] for row in tries]
+        if numbers != list(range(1, len(tries) + 1)):
+            problems.append(f'{label} 的尝试次数为 {numbers}')
+        for previous, row in zip(tries, tries[1:]):
+            if row['actual'] - previous['actual'] < retry_delay - coalesce_window:
+                problems.append(f'{label} 在上次失败后 {row["actual"] - previous["actual"]:.3f} 秒重试，'
+                                f'短于 {retry_delay} 秒')
+    return problems
+
+
+def _load_calendar(args):
+    if args.events:
+        with open(args.events, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 支持事件列表或 events.list 的响应（{'items': [...]}）
+        return ReplayCalendar(data['items'] if isinstance(data, dict) else data)
+
+    if args.cache:
+        cache = EventCache(args.cache)
+        try:
+            events = []
+            event_calendars = {}
+            for calendar_id in args.calendar_ids.split(','):
+                calendar_events, _, _ = cache.load(calendar_id.strip(), now=0)
+                for event_id, event in calendar_events.items():
+                    event_calendars.setdefault(event_id, calendar_id.strip())
+                    events.append(event)
+            return ReplayCalendar(events, event_calendars=event_calendars)
+        finally:
+            cache.close()
+
+    start = _parse_datetime(args.start) if args.start else datetime.now(timezone.utc)
+    return ReplayCalendar(generate_events(args.generate, start=start + timedelta(hours=1),
+                                          span=timedelta(days=args.days), seed=args.seed))
+
+
+def _parse_datetime(value):
+    value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value if value.tzinfo else value.astimezone()
+
+
+def _format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在虚拟时钟上重放日历，输出每次播报的计划时间与实际时间')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--events', help='事件 JSON 文件（事件列表或 events.list 响应）')
+    source.add_argument('--cache', help='事件缓存数据库（EVENT_CACHE_PATH）')
+    source.add_argument('--generate', type=int, default=500, help='生成的合成事件数（默认）')
+    parser.add_argument('--calendar-ids', default='primary', help='从缓存中读取的日历 ID，逗号分隔')
+    parser.add_argument('--days', type=float, default=7, help='合成事件的分布天数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--start', help='开始时间（ISO 8601），默认为最早的事件开始前 2 小时')
+    parser.add_argument('--end', help='结束时间（ISO 8601），默认为最后一个事件结束时')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟的播报耗时（秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='模拟的播报失败率')
+    parser.add_argument('--check-interval', type=int, help='覆盖 CHECK_INTERVAL（最短刷新间隔，秒）')
+    parser.add_argument('--refresh-max-interval', type=int, help='覆盖 REFRESH_MAX_INTERVAL（最长刷新间隔，秒）')
+    parser.add_argument('--json', help='把每次播报的记录写入 JSON 文件')
+    parser.add_argument('--summary-only', action='store_true', help='只输出汇总')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    setup_logging(level=args.log_level)
+
+    calendar = _load_calendar(args)
+    if not calendar.events:
+        print('没有可重放的事件')
+        return
+
+    first_start = calendar._starts[0]
+    last_end = max(end_ts for _, end_ts, _ in calendar._rows)
+    start = _parse_datetime(args.start).timestamp() if args.start else first_start - 2 * 3600
+    end = _parse_datetime(args.end).timestamp() if args.end else last_end
+
+    clock = VirtualClock(start)
+    speaker = ReplaySpeaker(clock, latency=args.latency, failure_rate=args.failure_rate, seed=args.seed)
+    os.environ.setdefault('XIAOMI_SPEAKER_ENTITY_ID', 'script.replay')
+
+    # 刷新越频繁，调度表重建越多，用较短的刷新间隔检验失败重试不会被刷新打乱
+    config = {}
+    if args.check_interval is not None:
+        config['CHECK_INTERVAL'] = args.check_interval
+    if args.refresh_max_interval is not None:
+        config['REFRESH_MAX_INTERVAL'] = args.refresh_max_interval
+
+    # 提醒状态写到临时目录，不影响正式运行的状态文件
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='calendar-replay-') as workdir:
+        os.chdir(workdir)
+        try:
+            app = main_cli.CalendarReminderApp(
+                headless=True, calendar_client=calendar, ha_client=speaker, clock=clock, config=config)
+            announcements = replay(app, clock, end)
+            app.state_store.close()
+        finally:
+            os.chdir(cwd)
+
+    rows = collect_results(announcements)
+    if not args.summary_only:
+        print(f'{"计划时间":<23} {"实际时间":<23} {"误差(秒)":>9}  结果  提醒')
+        for row in rows:
+            print(f'{_format_ts(row["ideal"]):<23} {_format_ts(row["actual"]):<23} '
+                  f'{row["error"]:>+9.3f}  {"成功" if row["ok"] else "失败"}  '
+                  f'{row["event_summary"]} ({row["reminder_time"]} 分钟)')
+
+    expected = expected_reminders(app, calendar, start, end)
+    delivered = {(row['event_id'], row['reminder_time']) for row in rows if row['ok']}
+    missed = sorted((fire_at, summary, key[1]) for key, (fire_at, summary) in expected.items()
+                    if key not in delivered)
+    errors = [abs(row['error']) for row in rows if row['ok']]
+
+    print(f'\n重放 {_format_ts(start)} ~ {_format_ts(end)}，{len(calendar.events)} 个事件')
+    print(f'应触发提醒 {len(expected)} 个，成功播报 {len(delivered)} 个，错过 {len(missed)} 个；'
+          f'播报 {len(announcements)} 次（失败 {sum(1 for a in announcements if not a.ok)} 次）；'
+          f'API 请求 {calendar.api_calls} 次')
+    if errors:
+        errors.sort()
+        print(f'时间误差（秒）：平均 {statistics.mean(errors):.3f}，'
+              f'p95 {errors[min(len(errors) - 1, int(len(errors) * 0.95))]:.3f}，最大 {errors[-1]:.3f}')
+    for fire_at, summary, reminder_time in missed:
+        print(f'错过: {_format_ts(fire_at)} {summary} ({reminder_time} 分钟)')
+
+    problems = check_retries(rows, app.reminder_max_attempts, app.reminder_retry_delay,
+                             app.coalesce_window)
+    for problem in problems:
+        print(f'重试异常: {problem}')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'start': start, 'end': end, 'announcements': rows,
+                       'missed': [{'ideal': fire_at, 'event_summary': summary, 'reminder_time': reminder_time}
+                                  for fire_at, summary, reminder_time in missed]},
+                      f, ensure_ascii=False, indent=2)
+
+    # 作为回归检查使用时，重试异常以非零状态退出
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""API 调用保护模块 - 令牌桶限流、带抖动的指数退避和断路器"""
+import email.utils
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """断路器处于打开状态，请求没有发出"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f'{name} 断路器已打开，{retry_in:.0f} 秒后重试')
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """
+    令牌桶限流
+
+    令牌按 rate 个/秒的速度补充，最多积累 capacity 个；每个请求消耗一个令牌，
+    没有令牌时等待。可以在多个线程（或多租户模式下的多个客户端）之间共享。
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 令牌桶容量（允许的突发请求数），默认与 rate 相同（至少为 1）
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """
+        获取一个令牌，必要时等待
+
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等待
+
+        Returns:
+            是否获取到令牌
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    断路器
+
+    连续失败达到 failure_threshold 次后打开，cooldown 秒内的请求直接失败，不再访问服务端；
+    冷却结束后进入半开状态，只放行一个试探请求：成功则关闭，失败则重新打开，
+    冷却时间加倍（最长 max_cooldown）。服务端给出 Retry-After 时至少打开到该时间之后。
+    """
+
+    def __init__(self, name, failure_threshold=5, cooldown=30, max_cooldown=600):
+        """
+        初始化断路器
+
+        Args:
+            name: 名称（用于日志）
+            failure_threshold: 打开断路器的连续失败次数
+            cooldown: 首次打开的冷却时间（秒）
+            max_cooldown: 连续打开时冷却时间的上限（秒）
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._failures = 0
+        self._current_cooldown = cooldown
+        # 打开状态持续到该单调时钟时间，None 表示关闭
+        self._open_until = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """断路器是否处于打开（含半开）状态"""
+        return self._open_until is not None
+
+    def before_request(self):
+        """
+        请求前调用：打开状态下直接抛出 CircuitOpenError
+
+        Raises:
+            CircuitOpenError: 冷却中，或半开状态下已有试探请求在进行
+        """
+        with self._lock:
+            if self._open_until is None:
+                return
+            retry_in = self._open_until - time.monotonic()
+            if retry_in > 0 or self._probe_in_flight:
+                raise CircuitOpenError(self.name, max(0.0, retry_in))
+            # 半开：放行一个试探请求
+            self._probe_in_flight = True
+
+    def record_success(self):
+        """请求成功：关闭断路器"""
+        with self._lock:
+            if self._open_until is not None:
+                logger.info('%s 断路器已关闭，服务恢复正常', self.name)
+            self._failures = 0
+            self._current_cooldown = self.cooldown
+            self._open_until = None
+            self._probe_in_flight = False
+
+    def record_failure(self, retry_after=None):
+        """
+        请求失败（服务不可用类的错误）：达到阈值或试探失败时打开断路器
+
+        Args:
+            retry_after: 服务端要求的等待时间（秒）
+        """
+        with self._lock:
+            self._failures += 1
+            probe_failed = self._probe_in_flight
+            self._probe_in_flight = False
+            if not probe_failed and self._failures < self.failure_threshold and not retry_after:
+                return
+
+            if probe_failed:
+                self._current_cooldown = min(self.max_cooldown, self._current_cooldown * 2)
+            cooldown = max(self._current_cooldown, retry_after or 0)
+            self._open_until = time.monotonic() + cooldown
+            logger.warning('%s 连续失败 %d 次，断路器打开 %.0f 秒', self.name, self._failures, cooldown)
+
+    def release(self):
+        """请求因与服务可用性无关的原因结束（例如 404）：释放半开状态的试探名额"""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """
+    指数退避等待时间（full jitter）
+
+    Args:
+        attempt: 第几次重试（从 1 开始）
+        base: 第一次重试的最长等待时间（秒）
+        cap: 等待时间上限（秒）
+
+    Returns:
+        [0, min(cap, base * 2^(attempt-1))] 之间的随机秒数
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 响应头
+
+    Args:
+        value: 秒数或 HTTP 日期
+
+    Returns:
+        需要等待的秒数，无法解析时返回 None
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
@@ -0,0 +1,147 @@
+"""提醒调度器 - 按每个提醒的绝对触发时间调度"""
+import heapq
+import itertools
+import threading
+
+from clock import SYSTEM_CLOCK
+
+
+class ReminderScheduler:
+    """
+    基于最小堆的提醒调度器
+
+    每个提醒按绝对触发时间（Unix 时间戳）加入调度，内部换算成单调时钟的
+    截止时间保存在最小堆中。主循环在单调时钟上睡眠到最近的截止时间，
+    醒来后取出所有已到期（包括因卡顿而过期）的提醒。
+
+    日历刷新在独立的任务中进行，刷新后调用 replace() 整体替换调度表，
+    并唤醒正在等待的主循环。
+    """
+
+    def __init__(self, clock=SYSTEM_CLOCK, wakeup=None):
+        """
+        初始化调度器
+
+        Args:
+            clock: 时钟对象，重放模拟时使用虚拟时钟
+            wakeup: 共享的唤醒事件（多租户模式下多个调度器由同一个主循环等待），
+                    None 表示使用自己的事件
+        """
+        self.clock = clock
+        # 最小堆：(单调时钟截止时间, 序号, key)
+        self._heap = []
+        # 当前有效的提醒：{key: (单调时钟截止时间, payload)}
+        self._entries = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = wakeup or threading.Event()
+
+    def replace(self, reminders):
+        """
+        整体替换调度表
+
+        Args:
+            reminders: 可迭代的 (key, fire_at, payload) 三元组
+                       key: 提醒的唯一标识，例如 (event_id, 提醒分钟数)
+                       fire_at: 触发时间（Unix 时间戳，秒）
+                       payload: 触发时原样返回的数据
+        """
+        # 用同一时刻的墙上时钟和单调时钟换算截止时间
+        # 每次刷新都会重新换算，因此能纠正系统时间的跳变
+        now_wall = self.clock.time()
+        now_mono = self.clock.monotonic()
+
+        entries = {}
+        for key, fire_at, payload in reminders:
+            entries[key] = (now_mono + (fire_at - now_wall), payload)
+
+        heap = [(deadline, next(self._counter), key)
+                for key, (deadline, _) in entries.items()]
+        heapq.heapify(heap)
+
+        with self._lock:
+            self._heap = heap
+            self._entries = entries
+
+        self.wakeup()
+
+    def add(self, key, fire_at, payload):
+        """
+        加入（或替换）单个提醒，例如播报失败后的重试
+
+        Args:
+            key: 提醒的唯一标识
+            fire_at: 触发时间（Unix 时间戳，秒）
+            payload: 触发时原样返回的数据
+        """
+        deadline = self.clock.monotonic() + (fire_at - self.clock.time())
+        with self._lock:
+            # 堆中旧的同 key 条目会在 pop_due 时被忽略
+            self._entries[key] = (deadline, payload)
+            heapq.heappush(self._heap, (deadline, next(self._counter), key))
+
+        self.wakeup()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def next_deadline(self):
+        """
+        获取最近的截止时间
+
+        Returns:
+            单调时钟时间戳，调度表为空时返回 None
+        """
+        with self._lock:
+            # 丢弃堆顶已被替换或取消的旧条目
+            while self._heap and self._entries.get(self._heap[0][2], (None,))[0] != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, lookahead=0):
+        """
+        取出所有已到期的提醒
+
+        Args:
+            lookahead: 同时取出在该秒数内即将到期的提醒（用于合并播报）
+
+        Returns:
+            [(key, payload), ...]，按截止时间排序
+        """
+        now_mono = self.clock.monotonic() + lookahead
+        due = []
+
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_mono:
+                deadline, _, key = heapq.heappop(self._heap)
+                entry = self._entries.get(key)
+                # 只处理与当前条目一致的堆元素，被替换掉的旧条目直接丢弃
+                if entry is not None and entry[0] == deadline:
+                    del self._entries[key]
+                    due.append((key, entry[1]))
+
+        return due
+
+    def wait(self, max_wait=None):
+        """
+        在单调时钟上睡眠到最近的截止时间
+
+        调度表被替换或调用 wakeup() 时会提前返回。
+
+        Args:
+            max_wait: 最长等待秒数，None 表示不限制
+        """
+        deadline = self.next_deadline()
+        timeout = max_wait
+        if deadline is not None:
+            remaining = max(0.0, deadline - self.clock.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        # threading.Event.wait 内部使用单调时钟计时
+        self.clock.wait(self._wakeup, timeout)
+        self._wakeup.clear()
+
+    def wakeup(self):
+        """唤醒正在等待的主循环"""
+        self._wakeup.set()
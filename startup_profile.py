@@ -0,0 +1,157 @@
+"""启动耗时分析 - 记录从进程启动到第一次日历检查完成的各阶段耗时"""
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def process_age():
+    """
+    当前进程已运行的秒数（包含解释器自身的启动时间）
+
+    Returns:
+        秒数；无法读取 /proc 时（非 Linux）返回 None
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # 第 2 个字段（进程名）可能包含空格，从右括号之后开始按空格切分
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        # starttime 是第 22 个字段，单位为时钟滴答（从系统启动算起）
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - started)
+
+
+class StartupProfile:
+    """
+    启动阶段计时
+
+    各模块在启动过程中调用 mark() 记录阶段，第一次日历检查完成后调用 finish()
+    记录冷启动总耗时；finish() 之后的 mark() 不再记录（例如多租户模式下创建的其他应用）。
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        # 本模块导入之前进程已运行的时间（解释器启动、site 导入等）
+        self._before = process_age()
+        self._last = self._started
+        self.phases = []
+        self.total = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        """是否已经完成第一次日历检查"""
+        return self.total is not None
+
+    def elapsed(self):
+        """从进程启动（无法获取时从本模块导入）到现在的秒数"""
+        return (self._before or 0.0) + time.perf_counter() - self._started
+
+    def mark(self, name):
+        """
+        结束一个启动阶段
+
+        Args:
+            name: 阶段名称，耗时从上一次 mark() 开始计算
+        """
+        with self._lock:
+            if self.finished:
+                return
+            now = time.perf_counter()
+            self.phases.append((name, now - self._last))
+            self._last = now
+
+    def finish(self, name, target=None):
+        """
+        结束最后一个阶段并记录冷启动总耗时（只有第一次调用生效）
+
+        Args:
+            name: 最后一个阶段的名称
+            target: 目标耗时（秒），超过时输出警告，None 或 0 表示不检查
+
+        Returns:
+            冷启动总耗时（秒）
+        """
+        self.mark(name)
+        with self._lock:
+            if self.finished:
+                return self.total
+            self.total = self.elapsed()
+
+        if target and self.total > target:
+            logger.warning('冷启动耗时 %.2f 秒，超过目标 %.2f 秒（使用 --profile-startup 查看各阶段耗时）',
+                           self.total, target)
+        else:
+            logger.info('冷启动完成：进程启动 %.2f 秒后完成第一次日历检查', self.total)
+        return self.total
+
+    def report(self):
+        """
+        各阶段耗时报告
+
+        Returns:
+            多行文本
+        """
+        lines = ['启动阶段耗时：']
+        if self._before is not None:
+            lines.append(f'{self._before * 1000:>9.1f} ms  解释器启动')
+        for name, seconds in self.phases:
+            lines.append(f'{seconds * 1000:>9.1f} ms  {name}')
+        if self.total is not None:
+            lines.append(f'{self.total * 1000:>9.1f} ms  合计（到第一次检查完成）')
+        return '\n'.join(lines)
+
+
+def import_breakdown(module, limit=10, max_depth=2):
+    """
+    在子进程中用 python -X importtime 导入模块，列出耗时最多的依赖
+
+    Args:
+        module: 要分析的模块名
+        limit: 最多列出的模块数
+        max_depth: 只统计导入树前几层的模块（更深层的耗时已计入上层）
+
+    Returns:
+        [(模块名, 累计耗时秒数)]，按耗时从大到小排列；子进程失败时返回空列表
+    """
+    import subprocess
+    try:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                capture_output=True, text=True, timeout=60,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning('分析导入耗时失败: %s', e)
+        return []
+
+    # 每行格式：import time: self [us] | cumulative | 缩进表示层级的模块名
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # importtime 按导入完成的顺序输出，依赖出现在导入它的模块之前；
+        # 层级为 0 的行结束一棵导入树，解释器启动时的导入（site 等）属于其他的树
+        if depth == 0:
+            if name.strip() == module:
+                break
+            entries = []
+            continue
+        if depth <= max_depth:
+            entries.append((name.strip(), int(parts[1]) / 1e6))
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return entries[:limit]
+
+
+# 进程内唯一的启动计时器：由主程序最先导入
+STARTUP = StartupProfile()
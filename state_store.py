@@ -0,0 +1,256 @@
+"""提醒状态持久化模块 - 快照 + 追加日志"""
+import heapq
+import json
+import logging
+import os
+import time
+
+# 快照文件格式版本（旧版本的快照是 {event_id: [提醒时间点]}，没有版本号）
+SNAPSHOT_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderStateStore:
+    """
+    已提醒记录的持久化存储
+
+    状态由两部分组成：
+    - 快照文件（reminded_events.json）：某一时刻的完整状态
+    - 追加日志（reminded_events.journal）：快照之后的每次变更，一行一条 JSON
+
+    每次提醒只向日志追加一行并 fsync，写入量与历史记录的多少无关；
+    日志累积到 compact_every 条后把当前状态原子地写成新快照并清空日志。
+    启动时加载快照再重放日志，崩溃时写了一半的最后一行会被忽略。
+
+    每条记录带有过期时间（事件结束时间），按过期时间排序的最小堆
+    让 evict_expired() 只需弹出堆顶已过期的记录，内存和快照大小
+    只与尚未结束的事件数量有关。
+    """
+
+    def __init__(self, snapshot_path='reminded_events.json', journal_path=None, compact_every=200,
+                 default_ttl=86400):
+        """
+        初始化状态存储
+
+        Args:
+            snapshot_path: 快照文件路径
+            journal_path: 追加日志路径，默认为快照文件同名的 .journal 文件
+            compact_every: 日志累积多少条后压缩为快照
+            default_ttl: 没有过期时间的记录（旧版本快照）从加载起保留的秒数
+        """
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or f'{os.path.splitext(snapshot_path)[0]}.journal'
+        self.compact_every = compact_every
+        self.default_ttl = default_ttl
+
+        # 已提醒的事件：{event_id: {提醒时间点的集合}}
+        self.state = {}
+        # 每个事件记录的过期时间：{event_id: Unix 时间戳}
+        self.expires = {}
+        # 按过期时间排序的最小堆：(过期时间, event_id)，过期时间被更新后旧元素惰性丢弃
+        self._expiry_heap = []
+        self._journal = None
+        self._journal_entries = 0
+
+    def load(self, now=None):
+        """
+        加载快照并重放日志，丢弃已过期的记录
+
+        Args:
+            now: 当前时间戳，默认为 time.time()
+
+        Returns:
+            已提醒的事件 {event_id: set(提醒时间点)}
+        """
+        if now is None:
+            now = time.time()
+
+        self.state = {}
+        self.expires = {}
+
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._load_snapshot(data, now)
+            except Exception as e:
+                logger.warning('加载状态快照失败: %s', e)
+
+        replayed = 0
+        lines = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 崩溃时写了一半的行，忽略
+                        continue
+                    self._apply(entry, now)
+                    replayed += 1
+
+        self._rebuild_heap()
+        evicted = self._evict(now)
+
+        if lines or evicted:
+            if lines:
+                logger.info('已重放 %d 条提醒记录日志', replayed)
+            # 启动时压缩一次：下次启动无需重放，也去掉了写了一半的行和已过期的记录
+            self.compact()
+
+        return self.state
+
+    def _load_snapshot(self, data, now):
+        """解析快照，兼容旧版本的 {event_id: [提醒时间点]} 格式"""
+        if data.get('version') == SNAPSHOT_VERSION:
+            for event_id, record in data['events'].items():
+                self.state[event_id] = set(record['reminded'])
+                self.expires[event_id] = record['expires_at']
+        else:
+            # 旧版本快照没有记录事件结束时间，从现在起保留 default_ttl 秒
+            for event_id, times in data.items():
+                self.state[event_id] = set(times)
+                self.expires[event_id] = now + self.default_ttl
+
+    def add(self, event_id, reminder_time, expires_at=None):
+        """
+        记录已在某个时间点提醒过
+
+        Args:
+            event_id: 事件 ID
+            reminder_time: 提醒时间点（分钟）
+            expires_at: 记录的过期时间（通常为事件结束时间），None 表示沿用已有的过期时间
+        """
+        entry = {'op': 'add', 'id': event_id, 'm': reminder_time}
+        if expires_at is not None:
+            entry['exp'] = expires_at
+        self._write(entry)
+
+    def discard(self, event_id, reminder_time):
+        """撤销某个时间点的提醒记录（例如播报失败需要重试）"""
+        self._write({'op': 'discard', 'id': event_id, 'm': reminder_time})
+
+    def set_expiry(self, event_id, expires_at):
+        """
+        更新事件记录的过期时间（例如事件被改期）
+
+        只在已有记录且过期时间发生变化时写入日志
+        """
+        if event_id in self.state and self.expires.get(event_id) != expires_at:
+            self._write({'op': 'expire', 'id': event_id, 'exp': expires_at})
+
+    def evict_expired(self, now=None):
+        """
+        丢弃已过期的记录
+
+        只弹出堆顶已过期的元素，开销与被丢弃的记录数成正比。
+        被丢弃的记录不写日志：日志和快照中的记录都带有过期时间，
+        重启加载时同样会被丢弃，下次压缩时从快照中移除。
+
+        Args:
+            now: 当前时间戳，默认为 time.time()
+
+        Returns:
+            丢弃的事件数
+        """
+        if now is None:
+            now = time.time()
+        return self._evict(now)
+
+    def clear(self):
+        """清空所有提醒记录"""
+        self.state.clear()
+        self.expires.clear()
+        self._expiry_heap = []
+        self.compact()
+
+    def compact(self):
+        """把当前状态原子地写成新快照并清空日志"""
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'events': {
+                event_id: {
+                    'reminded': sorted(times),
+                    'expires_at': self.expires.get(event_id),
+                }
+                for event_id, times in self.state.items()
+            },
+        }
+
+        tmp_path = f'{self.snapshot_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # 快照已包含所有变更，清空日志
+        self._close_journal()
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+        self._journal_entries = 0
+
+    def close(self):
+        """关闭日志文件"""
+        self._close_journal()
+
+    def _apply(self, entry, now=None):
+        """把一条日志应用到内存状态"""
+        event_id = entry['id']
+        op = entry['op']
+        if op == 'add':
+            self.state.setdefault(event_id, set()).add(entry['m'])
+            if 'exp' in entry:
+                self._set_expires(event_id, entry['exp'])
+            elif event_id not in self.expires:
+                self._set_expires(event_id, (now or time.time()) + self.default_ttl)
+        elif op == 'discard':
+            times = self.state.get(event_id)
+            if times is not None:
+                times.discard(entry['m'])
+        elif op == 'expire':
+            if event_id in self.state:
+                self._set_expires(event_id, entry['exp'])
+
+    def _set_expires(self, event_id, expires_at):
+        if self.expires.get(event_id) != expires_at:
+            self.expires[event_id] = expires_at
+            heapq.heappush(self._expiry_heap, (expires_at, event_id))
+
+    def _rebuild_heap(self):
+        self._expiry_heap = [(expires_at, event_id) for event_id, expires_at in self.expires.items()]
+        heapq.heapify(self._expiry_heap)
+
+    def _evict(self, now):
+        evicted = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, event_id = heapq.heappop(heap)
+            # 过期时间已被更新的旧元素直接丢弃
+            if self.expires.get(event_id) != expires_at:
+                continue
+            del self.expires[event_id]
+            self.state.pop(event_id, None)
+            evicted += 1
+        return evicted
+
+    def _write(self, entry):
+        """更新内存状态并追加一条持久化日志"""
+        self._apply(entry)
+
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+        self._journal_entries += 1
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
@@ -0,0 +1,424 @@
+"""多租户模块 - 在一个进程中运行多个相互独立的提醒管道"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from clock import SYSTEM_CLOCK
+from home_assistant import HomeAssistantClient
+from http_transport import create_session
+from log_setup import setup_logging_from_env
+from metrics import MAIN_LOOP_SECONDS, MetricsServer
+from resilience import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# 每个租户必须单独配置的变量：不从全局环境变量继承，避免租户之间误用凭证
+REQUIRED_KEYS = ('HA_BASE_URL', 'HA_ACCESS_TOKEN', 'XIAOMI_SPEAKER_ENTITY_ID')
+
+# 每个租户独立的文件，相对路径位于租户的数据目录下
+TENANT_FILES = {
+    'GOOGLE_TOKEN_PATH': 'token.pickle',
+    'STATE_FILE': 'reminded_events.json',
+    'EVENT_CACHE_PATH': 'event_cache.db',
+    'SPEAKER_ROUTE_CACHE_PATH': 'speaker_routes.json',
+}
+
+# 没有单独配置时使用的值（而不是全局 .env 中单租户部署的值）
+TENANT_DEFAULTS = {
+    'GOOGLE_CALENDAR_IDS': 'primary',
+    # 推送通知需要每个租户配置不同的 WATCH_LISTEN_PORT，默认关闭
+    'WATCH_ENABLED': 'false',
+}
+
+
+def load_tenants(path):
+    """
+    读取租户配置文件
+
+    文件格式（JSON）：
+        {
+          "defaults": {"CHECK_INTERVAL": 60},
+          "tenants": [
+            {"name": "home-a", "config": {"HA_BASE_URL": "...", "HA_ACCESS_TOKEN": "...",
+                                         "XIAOMI_SPEAKER_ENTITY_ID": "...", "GOOGLE_CALENDAR_IDS": "primary"}},
+            {"name": "home-b", "data_dir": "/var/lib/calendar-reminder/home-b", "config": {...}}
+          ]
+        }
+
+    config 中的变量与 .env 相同；defaults 对所有租户生效。每个租户的令牌、
+    提醒状态、事件缓存默认保存在 tenants/<name>/ 下（相对于配置文件所在目录）。
+
+    Args:
+        path: 配置文件路径
+
+    Returns:
+        [{'name': 名称, 'data_dir': 数据目录, 'config': {变量名: 值}}, ...]
+
+    Raises:
+        ValueError: 配置不完整或租户名称重复
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = data.get('defaults', {})
+
+    tenants = []
+    seen = set()
+    for entry in data.get('tenants', []):
+        name = entry.get('name')
+        if not name:
+            raise ValueError('租户缺少 name')
+        if name in seen:
+            raise ValueError(f'租户名称重复: {name}')
+        seen.add(name)
+
+        config = dict(TENANT_DEFAULTS)
+        config.update(defaults)
+        config.update(entry.get('config', {}))
+
+        missing = [key for key in REQUIRED_KEYS if not config.get(key)]
+        if missing:
+            raise ValueError(f'租户 {name} 缺少配置: {", ".join(missing)}')
+
+        data_dir = os.path.join(base_dir, entry.get('data_dir') or os.path.join('tenants', name))
+        for key, filename in TENANT_FILES.items():
+            value = config.get(key, filename)
+            # 空值表示关闭（例如不使用事件缓存）
+            config[key] = os.path.join(data_dir, value) if value else ''
+        config['GOOGLE_CREDENTIALS_PATH'] = os.path.join(
+            base_dir, config.get('GOOGLE_CREDENTIALS_PATH', 'credentials.json'))
+        # 指标端点由宿主进程统一提供
+        config['METRICS_PORT'] = ''
+
+        tenants.append({'name': name, 'data_dir': data_dir, 'config': config})
+
+    return tenants
+
+
+def shard_tenants(tenants, shards):
+    """
+    按租户名称的哈希把租户分配到各个分片
+
+    同一个租户总是落在同一个分片，增减其他租户不会让它换到别的进程
+
+    Returns:
+        长度为 shards 的租户列表的列表
+    """
+    buckets = [[] for _ in range(shards)]
+    for tenant in tenants:
+        buckets[zlib.crc32(tenant['name'].encode('utf-8')) % shards].append(tenant)
+    return buckets
+
+
+class TenantHost:
+    """
+    在一个进程中运行多个租户的提醒管道
+
+    各租户共享：日历抓取线程池、Google API 连接池和限流令牌桶（同一个 OAuth 项目的配额）、
+    Home Assistant 连接池、提醒主循环和日历刷新调度线程；
+    各租户独立：凭证和令牌文件、提醒状态、事件缓存、日历同步状态、调度表和播报线程
+    （一个租户的音箱很慢不会拖慢其他租户的播报）。
+    """
+
+    def __init__(self, tenants, headless=True, fetch_workers=8, refresh_workers=4,
+                 metrics_port=None, metrics_host='127.0.0.1', clock=SYSTEM_CLOCK):
+        """
+        初始化宿主并创建各租户的应用实例
+
+        Args:
+            tenants: load_tenants() 返回的租户列表
+            headless: 是否为 CLI 无浏览器环境
+            fetch_workers: 共享的日历抓取线程数
+            refresh_workers: 同时刷新的租户数上限
+            metrics_port: 指标端点端口，None 表示不开启
+            metrics_host: 指标端点监听地址
+            clock: 时钟对象
+        """
+        # 延迟导入，避免与 main_cli 的循环导入
+        from main_cli import CalendarReminderApp
+
+        self.clock = clock
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_server = None
+
+        # 所有租户的调度表共用一个唤醒事件，由同一个主循环等待
+        self._wakeup = threading.Event()
+        self._refresh_wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+        self.fetch_executor = ThreadPoolExecutor(
+            max_workers=fetch_workers, thread_name_prefix='calendar-fetch')
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix='tenant-refresh')
+        self.ha_session = HomeAssistantClient.create_session(
+            pool_size=int(os.getenv('HA_POOL_SIZE', '4')),
+            max_retries=int(os.getenv('HA_MAX_RETRIES', '2')),
+            pool_connections=max(1, len(tenants))
+        )
+        # 所有租户访问同一个 googleapis.com：共用一个连接池，每个抓取线程一个长连接
+        self.calendar_session = create_session(pool_size=fetch_workers + refresh_workers)
+        rate = float(os.getenv('CALENDAR_RATE_LIMIT', '5'))
+        self.rate_limiter = TokenBucket(
+            rate, int(os.getenv('CALENDAR_RATE_BURST', '10'))) if rate > 0 else None
+
+        self.apps = {}
+        for tenant in tenants:
+            name = tenant['name']
+            os.makedirs(tenant['data_dir'], exist_ok=True)
+
+            token_path = tenant['config']['GOOGLE_TOKEN_PATH']
+            if not os.path.exists(token_path):
+                # 宿主进程不能停下来等待交互式授权
+                logger.error('租户 %s 尚未授权，请先运行: python tenants.py authorize <配置文件> %s',
+                             name, name)
+                continue
+
+            try:
+                self.apps[name] = CalendarReminderApp(
+                    headless=headless,
+                    clock=clock,
+                    config=tenant['config'],
+                    fetch_executor=self.fetch_executor,
+                    ha_session=self.ha_session,
+                    rate_limiter=self.rate_limiter,
+                    calendar_session=self.calendar_session,
+                    wakeup=self._wakeup,
+                    refresh_wakeup=self._refresh_wakeup
+                )
+            except Exception as e:
+                logger.exception('租户 %s 初始化失败: %s', name, e)
+
+    def run(self):
+        """启动所有租户并运行共享的主循环"""
+        running = {}
+        for name, app in self.apps.items():
+            logger.info('启动租户 %s', name)
+            try:
+                if app.start():
+                    running[name] = app
+            except Exception as e:
+                logger.exception('租户 %s 启动失败: %s', name, e)
+
+        if not running:
+            logger.error('没有可运行的租户')
+            return
+
+        logger.info('已启动 %d/%d 个租户', len(running), len(self.apps))
+
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(self.metrics_host, int(self.metrics_port))
+            self.metrics_server.start()
+
+        refresher = threading.Thread(
+            target=self._refresh_loop, args=(running,), name='tenant-refresh-scheduler', daemon=True)
+        refresher.start()
+
+        max_wait = min(app.check_interval for app in running.values())
+        try:
+            while not self._stopped.is_set():
+                # 睡眠到所有租户中最近的提醒截止时间，任一调度表更新时会被提前唤醒
+                deadlines = [deadline for deadline in
+                             (app.scheduler.next_deadline() for app in running.values())
+                             if deadline is not None]
+                timeout = max_wait
+                if deadlines:
+                    timeout = min(timeout, max(0.0, min(deadlines) - self.clock.monotonic()))
+                self.clock.wait(self._wakeup, timeout)
+                self._wakeup.clear()
+                if self._stopped.is_set():
+                    break
+
+                started = time.monotonic()
+                for name, app in running.items():
+                    try:
+                        app.fire_due_reminders()
+                    except Exception as e:
+                        logger.exception('租户 %s 发送提醒时出错: %s', name, e)
+                MAIN_LOOP_SECONDS.observe(time.monotonic() - started)
+        except KeyboardInterrupt:
+            pass
+
+        self._stopped.set()
+        self._refresh_wakeup.set()
+        for app in running.values():
+            app.shutdown()
+        self._refresh_executor.shutdown(wait=False)
+        self.fetch_executor.shutdown(wait=False)
+        self.ha_session.close()
+        self.calendar_session.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+
+    def _refresh_loop(self, running):
+        """
+        日历刷新调度：按各租户的刷新策略（或收到推送通知时）把刷新任务提交到共享线程池
+
+        同一租户上一次刷新还没完成时不会重复提交，完成后再按刷新策略安排下次刷新
+        """
+        now = self.clock.monotonic()
+        next_refresh = {name: now for name in running}
+        in_flight = {}
+
+        while not self._stopped.is_set():
+            now = self.clock.monotonic()
+            for name, app in running.items():
+                future = in_flight.get(name)
+                if future is not None:
+                    if not future.done():
+                        continue
+                    del in_flight[name]
+                    next_refresh[name] = now + app.next_refresh_delay()
+
+                periodic = now >= next_refresh[name]
+                if not periodic and not app.has_pending_refresh():
+                    continue
+
+                # 推送通知触发的刷新只同步发生变更的日历，定时刷新同步全部日历
+                pending = app.take_pending_calendars()
+                calendar_ids = None if periodic else pending
+                future = self._refresh_executor.submit(
+                    self._refresh_tenant, name, app, calendar_ids, not periodic)
+                # 刷新完成时唤醒调度，立即按刷新策略安排该租户的下次刷新
+                future.add_done_callback(lambda _: self._refresh_wakeup.set())
+                in_flight[name] = future
+
+            # 正在刷新的租户在刷新完成时唤醒，不需要按时间检查
+            waiting = [next_refresh[name] for name in running if name not in in_flight]
+            timeout = max(0.0, min(waiting) - self.clock.monotonic()) if waiting else None
+            self.clock.wait(self._refresh_wakeup, timeout)
+            self._refresh_wakeup.clear()
+
+    @staticmethod
+    def _refresh_tenant(name, app, calendar_ids, force):
+        try:
+            app.refresh(calendar_ids=calendar_ids, force=force)
+        except Exception as e:
+            logger.exception('租户 %s 检查事件时出错: %s', name, e)
+
+    def stop(self):
+        """让 run() 的主循环退出（可从其他线程调用）"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._refresh_wakeup.set()
+
+
+def _run_shard(index, tenants, headless, metrics_port):
+    """分片子进程的入口"""
+    listener = setup_logging_from_env()
+    try:
+        logger.info('分片 %d 启动，租户: %s', index, ', '.join(tenant['name'] for tenant in tenants))
+        TenantHost(
+            tenants,
+            headless=headless,
+            fetch_workers=int(os.getenv('TENANT_FETCH_WORKERS', '8')),
+            refresh_workers=int(os.getenv('TENANT_REFRESH_WORKERS', '4')),
+            metrics_port=metrics_port,
+            metrics_host=os.getenv('METRICS_HOST', '127.0.0.1')
+        ).run()
+    finally:
+        # 子进程退出时不会执行 atexit，手动写完剩余日志
+        listener.stop()
+
+
+def run_tenants(path, headless=True, processes=1):
+    """
+    按租户配置文件运行所有租户
+
+    Args:
+        path: 租户配置文件路径
+        headless: 是否为 CLI 无浏览器环境
+        processes: 进程数；大于 1 时按租户名称分片，每个进程运行一部分租户
+    """
+    tenants = load_tenants(path)
+    metrics_port = os.getenv('METRICS_PORT')
+
+    if processes <= 1:
+        TenantHost(
+            tenants,
+            headless=headless,
+            fetch_workers=int(os.getenv('TENANT_FETCH_WORKERS', '8')),
+            refresh_workers=int(os.getenv('TENANT_REFRESH_WORKERS', '4')),
+            metrics_port=metrics_port,
+            metrics_host=os.getenv('METRICS_HOST', '127.0.0.1')
+        ).run()
+        return
+
+    workers = []
+    for index, shard in enumerate(shard_tenants(tenants, processes)):
+        if not shard:
+            continue
+        # 每个分片使用各自的指标端口：METRICS_PORT + 分片序号
+        shard_port = int(metrics_port) + index if metrics_port else None
+        process = multiprocessing.Process(
+            target=_run_shard, args=(index, shard, headless, shard_port),
+            name=f'tenant-shard-{index}')
+        process.start()
+        workers.append(process)
+
+    logger.info('已启动 %d 个分片进程，共 %d 个租户', len(workers), len(tenants))
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        # 子进程同样收到 SIGINT，等待它们保存状态后退出
+        for process in workers:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+
+
+def authorize(path, name):
+    """为单个租户执行交互式 Google 授权，令牌保存到该租户的数据目录"""
+    from google_calendar_cli import GoogleCalendarClient
+
+    tenant = next((tenant for tenant in load_tenants(path) if tenant['name'] == name), None)
+    if tenant is None:
+        raise SystemExit(f'配置文件中没有租户: {name}')
+
+    config = tenant['config']
+    os.makedirs(tenant['data_dir'], exist_ok=True)
+    GoogleCalendarClient(
+        credentials_path=config['GOOGLE_CREDENTIALS_PATH'],
+        headless=True,
+        calendar_ids=[calendar_id.strip() for calendar_id in str(config['GOOGLE_CALENDAR_IDS']).split(',')
+                      if calendar_id.strip()],
+        token_path=config['GOOGLE_TOKEN_PATH']
+    )
+    logger.info('租户 %s 授权完成，令牌已保存到 %s', name, config['GOOGLE_TOKEN_PATH'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多租户日历提醒')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='运行配置文件中的所有租户')
+    run_parser.add_argument('config', help='租户配置文件')
+    run_parser.add_argument('--processes', type=int, default=int(os.getenv('TENANT_PROCESSES', '1')),
+                            help='进程数，大于 1 时按租户分片')
+
+    auth_parser = subparsers.add_parser('authorize', help='为单个租户执行 Google 授权')
+    auth_parser.add_argument('config', help='租户配置文件')
+    auth_parser.add_argument('name', help='租户名称')
+
+    args = parser.parse_args()
+    load_dotenv()
+    setup_logging_from_env()
+
+    if args.command == 'authorize':
+        authorize(args.config, args.name)
+    else:
+        run_tenants(args.config, headless=True, processes=args.processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,16 @@
 import os
 from dotenv import load_dotenv
 from home_assistant import HomeAssistantClient
+from log_setup import setup_logging
 
 # 加载环境变量
 load_dotenv()
 
 def main():
     """测试小米音箱"""
+    # 测试时输出完整的请求/响应详情
+    setup_logging(levels={'home_assistant': 'DEBUG'})
+
     print('=' * 60)
     print('小米音箱测试脚本')
     print('=' * 60)
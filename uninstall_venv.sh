@@ -97,6 +97,7 @@ remove_install_dir() {
             [ -f "$INSTALL_DIR/credentials.json" ] && cp "$INSTALL_DIR/credentials.json" "$BACKUP_DIR/"
             [ -f "$INSTALL_DIR/token.pickle" ] && cp "$INSTALL_DIR/token.pickle" "$BACKUP_DIR/"
             [ -f "$INSTALL_DIR/reminded_events.json" ] && cp "$INSTALL_DIR/reminded_events.json" "$BACKUP_DIR/"
+            [ -f "$INSTALL_DIR/reminded_events.journal" ] && cp "$INSTALL_DIR/reminded_events.journal" "$BACKUP_DIR/"
 
             print_info "重要文件已备份到: $BACKUP_DIR"
 
@@ -120,6 +121,7 @@ remove_logs() {
 
     if [[ $REPLY == "yes" ]]; then
         [ -f "$LOG_FILE" ] && rm -f "$LOG_FILE" && print_info "已删除: $LOG_FILE"
+        rm -f "$LOG_FILE".*.gz
         [ -f "$ERROR_LOG_FILE" ] && rm -f "$ERROR_LOG_FILE" && print_info "已删除: $ERROR_LOG_FILE"
     else
         print_info "保留日志文件"